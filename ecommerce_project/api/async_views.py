@@ -0,0 +1,206 @@
+"""Async variants of the login/register endpoints and of the read endpoints.
+
+These are plain Django async views, served alongside the DRF views in
+``api.views`` and returning the same responses. Under ASGI, password hashing
+runs in the bounded pool from :mod:`api.hashers` instead of tying up the event
+loop or the single thread that async views share for synchronous work, and
+reads use token authentication and queries from the async ORM.
+"""
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError
+from django.http import Http404, JsonResponse
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from django.views import View
+from django.views.decorators.http import require_POST
+from rest_framework import exceptions
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+from api import cache, hashers, refdata, views
+from api.authentication import CustomTokenAuthentication
+from api.models import CustomToken
+from api.serializer import CredentialsSerializer, RegisterSerializer
+
+User = get_user_model()
+
+
+class BadRequest(Exception):
+
+    def __init__(self, detail):
+        self.detail = detail
+
+
+def _request_data(request):
+    if request.content_type == 'application/json':
+        try:
+            return json.loads(request.body or b'{}')
+        except ValueError as exc:
+            raise BadRequest({'detail': f'JSON parse error - {exc}'})
+    return request.POST
+
+
+async def _authenticate(email, password):
+    user = await User.objects.filter(email=email).afirst()
+    if user is None:
+        # Hash anyway so unknown emails take as long as wrong passwords.
+        await hashers.amake_password(password)
+        return None
+
+    is_correct, upgraded = await hashers.averify_password(password, user.password)
+    if not is_correct or not user.is_active:
+        return None
+    if upgraded:
+        user.password = upgraded
+        await user.asave(update_fields=['password'])
+    return user
+
+
+@csrf_exempt
+@require_POST
+async def login(request):
+    try:
+        credentials = CredentialsSerializer(data=_request_data(request))
+    except BadRequest as exc:
+        return JsonResponse(exc.detail, status=400)
+    if not credentials.is_valid():
+        return JsonResponse(credentials.errors, status=400)
+
+    user = await _authenticate(credentials.validated_data['email'], credentials.validated_data['password'])
+    if user is None:
+        return JsonResponse({'non_field_errors': ['Invalid credentials']}, status=400)
+
+    try:
+        token, _ = await CustomToken.objects.aget_or_create(user=user)
+        if token.is_expired():
+            token.expires = timezone.now() + settings.AUTH_TOKEN_EXPIRATION
+            await token.asave()
+    except IntegrityError:
+        return JsonResponse({'non_field_errors': ['Error creating token']}, status=400)
+
+    return JsonResponse({'email': user.email, 'name': user.name, 'role': user.role, 'token': token.key})
+
+
+@csrf_exempt
+@require_POST
+async def register(request):
+    try:
+        serializer = RegisterSerializer(data=_request_data(request))
+    except BadRequest as exc:
+        return JsonResponse(exc.detail, status=400)
+    # Field validation includes the unique email lookup.
+    if not await sync_to_async(serializer.is_valid)():
+        return JsonResponse(serializer.errors, status=400)
+
+    data = serializer.validated_data
+    user = User(email=User.objects.normalize_email(data['email']), name=data['name'])
+    user.password = await hashers.amake_password(data['password'])
+    try:
+        await user.asave()
+    except IntegrityError:
+        return JsonResponse({'email': ['custom user with this email already exists.']}, status=400)
+    return JsonResponse(RegisterSerializer(user).data, status=201)
+
+
+class AsyncReadView(View):
+    """Async list (no ``pk``) and retrieve for the DRF viewset in ``viewset_class``.
+
+    The viewset is instantiated only for its queryset, permissions, paginator
+    and serializer; nothing here runs a synchronous query.
+    """
+    http_method_names = ['get', 'head', 'options']
+    viewset_class = None
+
+    async def get(self, request, pk=None):
+        drf_request = Request(request)
+        drf_request.accepted_renderer = JSONRenderer()
+        drf_request.accepted_media_type = JSONRenderer.media_type
+        try:
+            auth = await CustomTokenAuthentication().aauthenticate(request)
+            if auth is None:
+                raise exceptions.NotAuthenticated()
+            drf_request.user, drf_request.auth = auth
+
+            viewset = self.viewset_class(
+                request=drf_request, args=(), kwargs={} if pk is None else {'pk': pk}, format_kwarg=None,
+                action='list' if pk is None else 'retrieve', headers={},
+            )
+            viewset.check_permissions(drf_request)
+            response = await (self.list(viewset) if pk is None else self.retrieve(viewset, pk))
+        except exceptions.APIException as exc:
+            response = Response({'detail': exc.detail}, status=exc.status_code)
+            if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+                response['WWW-Authenticate'] = 'Token'
+        except Http404 as exc:
+            response = Response({'detail': str(exc)}, status=404)
+        return _render(response)
+
+    async def list(self, viewset):
+        # Applies ?ordering= before the fieldset, which keeps the columns it orders by.
+        queryset = viewset.filter_queryset(viewset.get_queryset())
+        paginator = viewset.paginator
+        page = await paginator.apaginate_queryset(queryset, viewset.request, view=viewset)
+        return paginator.get_paginated_response(viewset.get_serializer(page, many=True).data)
+
+    async def retrieve(self, viewset, pk):
+        queryset = viewset.filter_queryset(viewset.get_queryset())
+        try:
+            instance = await queryset.aget(pk=pk)
+        except queryset.model.DoesNotExist:
+            raise Http404(f'No {queryset.model._meta.object_name} matches the given query.')
+        # Customers' querysets are already limited to their own rows, which
+        # is what the object permissions check.
+        return Response(viewset.get_serializer(instance).data)
+
+
+def _render(response):
+    if isinstance(response, Response):
+        response.accepted_renderer = JSONRenderer()
+        response.accepted_media_type = JSONRenderer.media_type
+        response.renderer_context = {}
+        response.render()
+    return response
+
+
+class ProductReadView(AsyncReadView):
+    viewset_class = views.ProductViewSet
+
+    async def list(self, viewset):
+        return await self.cached(viewset, super().list)
+
+    async def retrieve(self, viewset, pk):
+        return await self.cached(viewset, lambda viewset: super(ProductReadView, self).retrieve(viewset, pk))
+
+    async def cached(self, viewset, handler):
+        """Cache like the sync view, with the same invalidation and conditional GET handling."""
+        generation = await cache.acatalog_generation()
+        key = viewset.catalog_cache_key(viewset.request, generation)
+        entry = await cache.catalog_cache().aget(key)
+        if entry is None:
+            modified = await cache.acatalog_modified()
+            response = await handler(viewset)
+            entry = await viewset.astore_catalog_entry(key, generation, response.data, modified)
+        return viewset.catalog_response(viewset.request, entry)
+
+
+class OrderReadView(AsyncReadView):
+    viewset_class = views.OrderViewSet
+
+
+class ReferenceReadView(AsyncReadView):
+    """Reference tables are served from the in-memory snapshot."""
+
+    async def list(self, viewset):
+        table = (await refdata.store.asnapshot()).tables[viewset.reference_table]
+        return viewset.reference_response(viewset.request, table.body, table.etag)
+
+    async def retrieve(self, viewset, pk):
+        table = (await refdata.store.asnapshot()).tables[viewset.reference_table]
+        if pk not in table.objects:
+            raise exceptions.NotFound()
+        return viewset.reference_response(viewset.request, *table.objects[pk])
@@ -1,18 +1,223 @@
 # api/authentication.py
 
-from rest_framework.authentication import TokenAuthentication
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+from rest_framework.authentication import TokenAuthentication, get_authorization_header
 from rest_framework.exceptions import AuthenticationFailed
+from api import metrics
+from api.cache import LRUCache
 from api.models import CustomToken
 
+# Marker stored for keys that do not match any token (negative caching).
+INVALID_TOKEN = 'invalid'
+
+# Per-process first level in front of the shared cache; entries only live for
+# AUTH_TOKEN_CACHE_LOCAL_TIMEOUT seconds so other workers converge quickly
+# after an invalidation.
+token_cache = LRUCache(maxsize=getattr(settings, 'AUTH_TOKEN_CACHE_LOCAL_MAXSIZE', 1024))
+
+
+def _shared_cache():
+    return caches[getattr(settings, 'AUTH_TOKEN_CACHE_ALIAS', 'default')]
+
+
+def _cache_key(key):
+    return f'auth:token:{key}'
+
+
+def _timeouts(token):
+    """Return the (local, shared) timeouts for a cache entry, in seconds."""
+    if token == INVALID_TOKEN:
+        negative = getattr(settings, 'AUTH_TOKEN_CACHE_NEGATIVE_TIMEOUT', 30)
+        return min(negative, getattr(settings, 'AUTH_TOKEN_CACHE_LOCAL_TIMEOUT', 10)), negative
+
+    # Never keep a token around past its expiry.
+    remaining = (token.expires - timezone.now()).total_seconds()
+    local = min(getattr(settings, 'AUTH_TOKEN_CACHE_LOCAL_TIMEOUT', 10), remaining)
+    shared = min(getattr(settings, 'AUTH_TOKEN_CACHE_TIMEOUT', 300), remaining)
+    return local, shared
+
+
+def cache_token(key, token):
+    local, shared = _timeouts(token)
+    token_cache.set(key, token, local)
+    if shared > 0:
+        _shared_cache().set(_cache_key(key), token, int(shared) or 1)
+
+
+async def acache_token(key, token):
+    """Async :func:`cache_token`."""
+    local, shared = _timeouts(token)
+    token_cache.set(key, token, local)
+    if shared > 0:
+        await _shared_cache().aset(_cache_key(key), token, int(shared) or 1)
+
+
+def _cached_token(key):
+    token = token_cache.get(key)
+    if token is not None:
+        return token
+    token = _shared_cache().get(_cache_key(key))
+    if token is not None:
+        local, _ = _timeouts(token)
+        token_cache.set(key, token, local)
+    return token
+
+
+async def _acached_token(key):
+    token = token_cache.get(key)
+    if token is not None:
+        return token
+    token = await _shared_cache().aget(_cache_key(key))
+    if token is not None:
+        local, _ = _timeouts(token)
+        token_cache.set(key, token, local)
+    return token
+
+
+def get_token(key):
+    """Look up a token (with its user) by key, going to the database only on a cache miss."""
+    token = _cached_token(key)
+    if token is None:
+        try:
+            token = CustomToken.objects.select_related('user').get(key=key)
+        except CustomToken.DoesNotExist:
+            token = INVALID_TOKEN
+        cache_token(key, token)
+    return token
+
+
+async def aget_token(key):
+    """Async :func:`get_token`; the shared cache is used through its async API too."""
+    token = await _acached_token(key)
+    if token is None:
+        try:
+            token = await CustomToken.objects.select_related('user').aget(key=key)
+        except CustomToken.DoesNotExist:
+            token = INVALID_TOKEN
+        await acache_token(key, token)
+    return token
+
+
+def invalidate_token(key):
+    token_cache.delete(key)
+    _shared_cache().delete(_cache_key(key))
+
+
+async def ainvalidate_token(key):
+    token_cache.delete(key)
+    await _shared_cache().adelete(_cache_key(key))
+
+
+def invalidate_user_tokens(user):
+    for key in CustomToken.objects.filter(user=user).values_list('key', flat=True):
+        invalidate_token(key)
+
+
+def _renewal(token):
+    """Return the new expiry if ``token`` is due for renewal, else None."""
+    now = timezone.now()
+    lifetime = settings.AUTH_TOKEN_EXPIRATION
+    interval = getattr(settings, 'AUTH_TOKEN_RENEW_INTERVAL', lifetime / 5)
+    if token.expires > now + lifetime - interval:
+        return None
+    return now + lifetime
+
+
+def _renewed(token, expires, updated):
+    if updated:
+        token.expires = expires
+        cache_token(token.key, token)
+    else:
+        invalidate_token(token.key)
+
+
+async def _arenewed(token, expires, updated):
+    if updated:
+        token.expires = expires
+        await acache_token(token.key, token)
+    else:
+        await ainvalidate_token(token.key)
+
+
+def renew_token(token):
+    """Slide ``token.expires`` forward to a full lifetime from now.
+
+    The database is only written once the token has aged by at least
+    AUTH_TOKEN_RENEW_INTERVAL, and the update is conditional on the expiry we
+    read, so concurrent requests (in any worker) renew a token at most once per
+    interval. A request that loses that race holds a stale copy and drops it
+    from the caches instead.
+    """
+    expires = _renewal(token)
+    if expires is not None:
+        updated = CustomToken.objects.filter(key=token.key, expires=token.expires).update(expires=expires)
+        _renewed(token, expires, updated)
+
+
+async def arenew_token(token):
+    """Async :func:`renew_token`."""
+    expires = _renewal(token)
+    if expires is not None:
+        updated = await CustomToken.objects.filter(key=token.key, expires=token.expires).aupdate(expires=expires)
+        await _arenewed(token, expires, updated)
+
+
+def purge_expired_tokens(batch_size=1000):
+    """Delete expired tokens ``batch_size`` rows at a time and return how many were deleted."""
+    deleted = 0
+    now = timezone.now()
+    while True:
+        keys = list(CustomToken.objects.filter(expires__lt=now).values_list('key', flat=True)[:batch_size])
+        if not keys:
+            return deleted
+        # Expiry is checked again: a token renewed or reissued since it was
+        # selected is valid and stays.
+        deleted += CustomToken.objects.filter(key__in=keys, expires__lt=now).delete()[0]
+
+
 class CustomTokenAuthentication(TokenAuthentication):
 
+    def authenticate(self, request):
+        with metrics.phase('auth'):
+            return super().authenticate(request)
+
     def authenticate_credentials(self, key):
+        token = get_token(key)
+        self.check_token(token)
+        renew_token(token)
+        return (token.user, token)
+
+    async def aauthenticate(self, request):
+        """Async ``authenticate()`` for plain Django async views."""
+        with metrics.phase('auth'):
+            return await self._aauthenticate(request)
+
+    async def _aauthenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) == 1:
+            raise AuthenticationFailed('Invalid token header. No credentials provided.')
+        if len(auth) > 2:
+            raise AuthenticationFailed('Invalid token header. Token string should not contain spaces.')
         try:
-            token = CustomToken.objects.get(key=key)
-        except CustomToken.DoesNotExist:
+            key = auth[1].decode()
+        except UnicodeError:
+            raise AuthenticationFailed('Invalid token header. Token string should not contain invalid characters.')
+
+        token = await aget_token(key)
+        self.check_token(token)
+        await arenew_token(token)
+        return (token.user, token)
+
+    def check_token(self, token):
+        if token == INVALID_TOKEN:
             raise AuthenticationFailed('Invalid token.')
 
         if token.is_expired():
             raise AuthenticationFailed('Token has expired.')
 
-        return (token.user, token)
+        if not token.user.is_active:
+            raise AuthenticationFailed('User inactive or deleted.')
@@ -0,0 +1,483 @@
+"""Reproducible API benchmarks.
+
+:func:`seed` fills the current database with a deterministic dataset and
+:func:`run` drives the API routes through the Django test client as an admin
+and as a customer, reporting latency percentiles, queries per request and
+peak memory per endpoint. The ``bench`` management command wraps both in a
+throwaway test database and prints the report as JSON.
+"""
+import asyncio
+import json
+import random
+import statistics
+import threading
+import time
+import tracemalloc
+from collections import namedtuple
+from decimal import Decimal
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.db import OperationalError, connection, reset_queries
+from django.db.models import F
+from django.test import AsyncClient, Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import Resolver404, URLResolver, get_resolver, resolve
+
+from api import cache, inventory, models, refdata, rollups
+from api.models import Brand, Cart, Category, City, CustomToken, CustomUser, Order, Product, State, StockReservation
+from api.urls import router
+
+BATCH_SIZE = 5000
+
+LOGIN_PATHS = {
+    'sync': '/api/login/',
+    'async': '/api/async/login/',
+}
+
+# Routes that don't depend on who is calling are measured once, anonymously.
+PUBLIC_ROUTES = {'login', 'async-login', 'register', 'async-register', 'api-token-auth'}
+
+# Extra query parameters needed to exercise a route meaningfully.
+ROUTE_PARAMS = {
+    'product-search': {'q': 'product'},
+}
+
+# One benchmarked request. ``prepare``, if set, runs untimed before every
+# request and puts back what the previous one changed, so that a checkout
+# always has a cart to order and a transition always has orders to move.
+Route = namedtuple('Route', 'name method path data content_type prepare',
+                   defaults=(None, 'application/json', None))
+
+
+def _bulk_create(model, objects):
+    """Insert ``objects`` (any iterable) in fixed-size batches without materialising it."""
+    objects = iter(objects)
+    while True:
+        batch = list(islice(objects, BATCH_SIZE))
+        if not batch:
+            return
+        model.objects.bulk_create(batch)
+
+
+def dataset_sizes(scale):
+    """Row counts derived from ``scale`` (the number of products)."""
+    return {
+        'products': scale,
+        'orders': scale,
+        'carts': max(1, scale // 10),
+        'customers': max(10, scale // 100),
+        'states': 50,
+        'cities': 500,
+        'brands': 100,
+        'categories': 50,
+    }
+
+
+def seed(scale=1000, seed=0):
+    """Fill the database with a deterministic dataset and return the benchmark users' tokens."""
+    rng = random.Random(seed)
+    sizes = dataset_sizes(scale)
+
+    _bulk_create(State, (State(abbreviation=f'{chr(65 + i // 26)}{chr(65 + i % 26)}', name=f'State {i}')
+                         for i in range(sizes['states'])))
+    state_ids = list(State.objects.order_by('pk').values_list('pk', flat=True))
+    _bulk_create(City, (City(name=f'City {i}', state_id=rng.choice(state_ids)) for i in range(sizes['cities'])))
+    _bulk_create(Brand, (Brand(name=f'Brand {i}') for i in range(sizes['brands'])))
+    _bulk_create(Category, (Category(name=f'Category {i}', slug=f'category-{i}', description=f'Category {i}')
+                            for i in range(sizes['categories'])))
+    cities = list(City.objects.order_by('pk').values_list('pk', 'state_id'))
+    brand_ids = list(Brand.objects.order_by('pk').values_list('pk', flat=True))
+    category_ids = list(Category.objects.order_by('pk').values_list('pk', flat=True))
+
+    def products():
+        for i in range(sizes['products']):
+            price = Decimal(rng.randint(100, 100000)) / 100
+            yield Product(
+                name=f'Product {i}', slug=f'product-{i}', description=f'Benchmark product number {i}.',
+                category_id=rng.choice(category_ids), brand_id=rng.choice(brand_ids), price=price,
+                discount_price=(price * Decimal('0.8')).quantize(Decimal('0.01')) if rng.random() < 0.3 else None,
+                stock_quantity=rng.randint(0, 500), is_active=rng.random() < 0.95,
+            )
+
+    _bulk_create(Product, products())
+    prices = dict(Product.objects.order_by('pk').annotate(
+        effective_price=models.effective_price()).values_list('pk', 'effective_price'))
+    product_ids = list(prices)
+    product_categories = dict(Product.objects.values_list('pk', 'category_id'))
+
+    # Hashing once keeps seeding fast; every user shares the same password.
+    password = make_password('benchmark')
+    admin = CustomUser.objects.create(email='admin@bench.test', name='Admin', role='admin',
+                                      is_staff=True, password=password)
+    _bulk_create(CustomUser, (CustomUser(email=f'customer{i}@bench.test', name=f'Customer {i}', password=password)
+                              for i in range(sizes['customers'])))
+    customer_ids = list(CustomUser.objects.filter(role='customer').order_by('pk').values_list('pk', flat=True))
+
+    def orders():
+        for _ in range(sizes['orders']):
+            city_id, state_id = rng.choice(cities)
+            product_id, quantity = rng.choice(product_ids), rng.randint(1, 5)
+            yield Order(
+                user_id=rng.choice(customer_ids), product_id=product_id, quantity=quantity,
+                unit_price=prices[product_id], line_total=prices[product_id] * quantity,
+                category_id=product_categories[product_id],
+                status=rng.choice(Order.STATUS_CHOICES)[0], street_address='1 Benchmark Way',
+                city_id=city_id, state_id=state_id, postal_code='00000', phone_number='555-0100',
+            )
+
+    _bulk_create(Order, orders())
+    def carts():
+        # A customer has at most one line per product.
+        lines = set()
+        for i in range(sizes['carts']):
+            user_id = customer_ids[i % len(customer_ids)]
+            product_id = rng.choice(product_ids)
+            if (user_id, product_id) not in lines:
+                lines.add((user_id, product_id))
+                yield Cart(user_id=user_id, product_id=product_id, quantity=rng.randint(1, 3))
+
+    _bulk_create(Cart, carts())
+
+    rollups.rebuild()
+
+    customer = CustomUser.objects.get(pk=customer_ids[0])
+    cache.bump_catalog_generation()
+    refdata.bump_version()
+    return {
+        'admin': CustomToken.objects.create(user=admin),
+        'customer': CustomToken.objects.create(user=customer),
+    }
+
+
+def api_url_names(patterns=None, prefix=''):
+    """Names of every URL pattern under ``/api/``, all of which :func:`routes` covers."""
+    if patterns is None:
+        patterns = get_resolver().url_patterns
+    names = set()
+    for pattern in patterns:
+        route = prefix + str(pattern.pattern)
+        if isinstance(pattern, URLResolver):
+            names |= api_url_names(pattern.url_patterns, route)
+        elif pattern.name and route.startswith('api/'):
+            names.add(pattern.name)
+    return names
+
+
+def _import_rows(products):
+    """NDJSON that re-imports ``products`` unchanged, matched by slug."""
+    return ''.join(json.dumps({
+        'name': product.name, 'slug': product.slug, 'description': product.description,
+        'category': product.category.name, 'brand': product.brand.name if product.brand else None,
+        'price': str(product.price),
+        'discount_price': str(product.discount_price) if product.discount_price is not None else None,
+        'stock_quantity': product.stock_quantity, 'is_active': product.is_active,
+    }) + '\n' for product in products)
+
+
+def _refill_cart(user, product):
+    def prepare():
+        # Checkout empties the cart and takes the stock; give both back.
+        Cart.objects.filter(user=user).delete()
+        Cart.objects.create(user=user, product=product, quantity=1)
+        Product.objects.filter(pk=product.pk).update(stock_quantity=F('stock_quantity') + 1)
+    return prepare
+
+
+def _reset_status(order_ids):
+    def prepare():
+        # Pending and processing orders count alike in the rollups, so an UPDATE may move them back.
+        Order.objects.filter(pk__in=order_ids).update(status='PENDING')
+    return prepare
+
+
+def _unregister(email):
+    def prepare():
+        CustomUser.objects.filter(email=email).delete()
+    return prepare
+
+
+def routes(tokens):
+    """Yield a :class:`Route` for every URL pattern in :func:`api_url_names`.
+
+    Router viewsets contribute their list, detail and GET extra actions, and
+    every read with an ``/api/async/`` twin is also measured there; the
+    writes below are listed by hand.
+    """
+    customer = tokens['customer'].user
+    reads = [Route('api-root', 'get', '/api/')]
+    for prefix, viewset, basename in router.registry:
+        model = viewset.queryset.model
+        owned = {'user': customer} if any(field.name == 'user' for field in model._meta.fields) else {}
+        reads.append(Route(f'{basename}-list', 'get', f'/api/{prefix}/'))
+        for extra in viewset.get_extra_actions():
+            if not extra.detail and 'get' in extra.mapping:
+                name = f'{basename}-{extra.url_name}'
+                reads.append(Route(name, 'get', f'/api/{prefix}/{extra.url_path}/', ROUTE_PARAMS.get(name)))
+        obj = model.objects.filter(**owned).order_by('pk').first()
+        if obj is not None:
+            reads.append(Route(f'{basename}-detail', 'get', f'/api/{prefix}/{obj.pk}/'))
+    reads.append(Route('sales-analytics', 'get', '/api/analytics/sales/'))
+    reads.extend(Route(f'sales-breakdown-{dimension}', 'get', f'/api/analytics/sales/{dimension}/')
+                 for dimension in rollups.DIMENSIONS)
+    yield from reads
+    for route in reads:
+        path = route.path.replace('/api/', '/api/async/', 1)
+        try:
+            match = resolve(path)
+        except Resolver404:
+            continue
+        yield route._replace(name=match.url_name, path=path)
+
+    product = Product.objects.filter(is_active=True).order_by('-stock_quantity', 'pk').first()
+    in_stock = Product.objects.filter(is_active=True, stock_quantity__gt=0).order_by('pk')[:5]
+    city = City.objects.order_by('pk').first()
+    pending = list(Order.objects.filter(status='PENDING').order_by('pk').values_list('pk', flat=True)[:100])
+    yield Route('product-activate-deactivate', 'patch', f'/api/products/{product.pk}/activate-deactivate/',
+                {'is_active': True})
+    yield Route('product-bulk', 'post', '/api/products/bulk/',
+                _import_rows(Product.objects.select_related('category', 'brand').order_by('pk')[:20]),
+                'application/x-ndjson')
+    yield Route('cart-batch', 'post', '/api/carts/batch/',
+                {'operations': [{'op': 'set', 'product': item.pk, 'quantity': 1} for item in in_stock]})
+    yield Route('cart-reserve', 'post', '/api/carts/reserve/')
+    yield Route('cart-to-order', 'post', '/api/cart-to-order/', {
+        'street_address': '1 Benchmark Way', 'city': city.pk, 'postal_code': '00000', 'phone_number': '555-0100',
+    }, prepare=_refill_cart(customer, product))
+    yield Route('order-transition', 'post', '/api/orders/transition/', {'status': 'PROCESSING', 'ids': pending},
+                prepare=_reset_status(pending))
+
+    credentials = {'email': customer.email, 'password': 'benchmark'}
+    yield Route('login', 'post', LOGIN_PATHS['sync'], credentials)
+    yield Route('async-login', 'post', LOGIN_PATHS['async'], credentials)
+    yield Route('api-token-auth', 'post', '/api/api-token-auth/',
+                {'username': customer.email, 'password': 'benchmark'})
+    for name, path in (('register', '/api/register/'), ('async-register', '/api/async/register/')):
+        email = f'{name}@bench.test'
+        yield Route(name, 'post', path, {'email': email, 'name': 'Registered', 'password': 'benchmark'},
+                    prepare=_unregister(email))
+
+
+def _percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def _request(client, method, path, data, token, content_type):
+    kwargs = {'HTTP_AUTHORIZATION': f'Token {token.key}'} if token else {}
+    if method == 'get':
+        response = client.get(path, data or {}, **kwargs)
+    else:
+        response = getattr(client, method)(path, data or {}, content_type=content_type, **kwargs)
+    # Streaming responses do their work while being consumed.
+    size = len(b''.join(response.streaming_content)) if response.streaming else len(response.content)
+    return response.status_code, size
+
+
+def measure(method, path, data, token, iterations=50, warmup=5, cold=False, content_type='application/json',
+            prepare=None):
+    """Time one route; ``cold`` bumps the response caches before every request.
+
+    ``prepare`` is called before every request, outside the measurements.
+    """
+    client = Client()
+    prepare = prepare or (lambda: None)
+
+    def request():
+        if cold:
+            cache.bump_catalog_generation()
+            refdata.bump_version()
+        return _request(client, method, path, data, token, content_type)
+
+    for _ in range(warmup):
+        prepare()
+        request()
+
+    latencies = []
+    for _ in range(iterations):
+        prepare()
+        start = time.perf_counter()
+        status, size = request()
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    # The query log is a bounded deque; a full one would make the capture count zero.
+    reset_queries()
+    prepare()
+    with CaptureQueriesContext(connection) as queries:
+        request()
+    query_count = len(queries)
+
+    prepare()
+    tracemalloc.start()
+    try:
+        request()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'status': status,
+        'response_bytes': size,
+        'p50_ms': round(_percentile(latencies, 0.50), 3),
+        'p95_ms': round(_percentile(latencies, 0.95), 3),
+        'p99_ms': round(_percentile(latencies, 0.99), 3),
+        'mean_ms': round(statistics.fmean(latencies), 3),
+        'queries': query_count,
+        'peak_memory_kb': round(peak / 1024, 1),
+    }
+
+
+def run(tokens, iterations=50, warmup=5, cold=False, only=None):
+    """Benchmark every route as admin and customer; returns ``{'<role> <route>': results}``.
+
+    ``only`` is a list of substrings; routes whose name contains none of them are skipped.
+    """
+    results = {}
+    for route in routes(tokens):
+        if only and not any(pattern in route.name for pattern in only):
+            continue
+        callers = {'anonymous': None} if route.name in PUBLIC_ROUTES else tokens
+        for role, token in callers.items():
+            results[f'{role} {route.name}'] = measure(route.method, route.path, route.data, token, iterations,
+                                                      warmup, cold, route.content_type, route.prepare)
+    return results
+
+
+def _summary(latencies):
+    return {
+        'p50_ms': round(_percentile(latencies, 0.50), 3),
+        'p99_ms': round(_percentile(latencies, 0.99), 3),
+        'max_ms': round(max(latencies), 3),
+    }
+
+
+async def _timed(request):
+    start = time.perf_counter()
+    response = await request()
+    assert response.status_code == 200, response.status_code
+    return (time.perf_counter() - start) * 1000
+
+
+async def _storm(login_path, credentials, token, logins, probes, probe_path):
+    client = AsyncClient()
+    headers = {'AUTHORIZATION': f'Token {token.key}'}
+
+    async def probe_loop():
+        return [await _timed(lambda: client.get(probe_path, headers=headers)) for _ in range(probes)]
+
+    async def login():
+        return await _timed(lambda: client.post(login_path, credentials, content_type='application/json'))
+
+    await probe_loop()  # warm caches
+    baseline = await probe_loop()
+    during, *login_latencies = await asyncio.gather(probe_loop(), *[login() for _ in range(logins)])
+    return {
+        'probe_baseline': _summary(baseline),
+        'probe_during_storm': _summary(during),
+        'login': _summary(login_latencies),
+    }
+
+
+def login_storm(tokens, logins=20, probes=50, probe_path='/api/products/'):
+    """Compare ``probe_path`` latency alone and during a burst of concurrent logins.
+
+    Requests go through the ASGI handler, once per login implementation in
+    :data:`LOGIN_PATHS`; synchronous views all share one thread there, so a
+    login that hashes on that thread delays every probe queued behind it.
+    """
+    customer = tokens['customer'].user
+    credentials = {'email': customer.email, 'password': 'benchmark'}
+    return {
+        name: asyncio.run(_storm(path, credentials, tokens['customer'], logins, probes, probe_path))
+        for name, path in LOGIN_PATHS.items()
+    }
+
+
+async def _throughput(path, token, concurrency, requests):
+    client = AsyncClient()
+    headers = {'AUTHORIZATION': f'Token {token.key}'}
+    remaining = iter(range(requests))
+    latencies = []
+
+    async def worker():
+        for _ in remaining:
+            latencies.append(await _timed(lambda: client.get(path, headers=headers)))
+
+    await client.get(path, headers=headers)  # warm caches
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+    return {'requests_per_second': round(requests / elapsed, 1), **_summary(latencies)}
+
+
+def throughput(tokens, concurrency=50, requests=500):
+    """Requests per second for each sync read endpoint and its ``/api/async/`` twin.
+
+    Everything runs in this process through Django's ASGI handler, so the
+    figures are per worker.
+    """
+    results = {}
+    customer = tokens['customer'].user
+    order = Order.objects.filter(user=customer).order_by('pk').first()
+    product = Product.objects.filter(is_active=True, stock_quantity__gt=0).order_by('pk').first()
+    paths = ['/api/products/', f'/api/products/{product.pk}/', '/api/orders/', '/api/states/', '/api/cities/']
+    if order is not None:
+        paths.append(f'/api/orders/{order.pk}/')
+    for path in paths:
+        for variant, url in (('sync', path), ('async', path.replace('/api/', '/api/async/', 1))):
+            results[f'{variant} {path}'] = asyncio.run(
+                _throughput(url, tokens['customer'], concurrency, requests))
+    return results
+
+
+def reservation_stress(threads=8, stock=500):
+    """Have ``threads`` customers reserve one unit at a time of a single product until it sells out.
+
+    Every thread uses its own database connection. Returns the units
+    reserved against the starting stock (``oversold`` must be 0), how often
+    a write had to be retried because of lock contention, and throughput.
+    """
+    category, _ = Category.objects.get_or_create(slug='stress', defaults={'name': 'Stress'})
+    product = Product.objects.create(name='Hot product', slug=f'hot-product-{time.time_ns()}', description='',
+                                     category=category, price=1, stock_quantity=stock)
+    users = CustomUser.objects.bulk_create(
+        CustomUser(email=f'stress{i}-{product.pk}@bench.test', name=f'Stress {i}') for i in range(threads))
+    barrier = threading.Barrier(threads)
+    reserved, retries = [0] * threads, [0] * threads
+
+    def customer(index):
+        try:
+            barrier.wait()
+            while True:
+                try:
+                    inventory.reserve(users[index], {product.pk: 1})
+                except inventory.InsufficientStock:
+                    return
+                except OperationalError:  # SQLite allows one writer at a time
+                    retries[index] += 1
+                    time.sleep(0.001)
+                else:
+                    reserved[index] += 1
+        finally:
+            connection.close()
+
+    workers = [threading.Thread(target=customer, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+
+    product.refresh_from_db()
+    held = StockReservation.objects.filter(product=product).count()
+    return {
+        'threads': threads,
+        'stock': stock,
+        'reserved': sum(reserved),
+        'reservation_rows': held,
+        'remaining_stock': product.stock_quantity,
+        'oversold': max(0, sum(reserved) - stock, -product.stock_quantity),
+        'contention_retries': sum(retries),
+        'reservations_per_second': round(sum(reserved) / elapsed, 1),
+    }
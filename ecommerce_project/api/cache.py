@@ -0,0 +1,213 @@
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.http import http_date, parse_http_date_safe, quote_etag, urlencode
+from rest_framework import status
+from rest_framework.response import Response
+
+from api.fieldsets import EXPAND_PARAM, FIELDS_PARAM
+
+CATALOG_GENERATION_KEY = 'catalog:generation'
+CATALOG_MODIFIED_KEY = 'catalog:modified'
+
+
+class LRUCache:
+    """Bounded, thread-safe in-process cache with a per-entry expiry.
+
+    Entries are evicted least-recently-used first once ``maxsize`` is reached,
+    and lazily dropped on lookup once their timeout (in seconds) has passed.
+    A ``None`` timeout keeps an entry until it is evicted.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value, deadline = self._data[key]
+            except KeyError:
+                return default
+            if deadline <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout=None):
+        if timeout is not None and timeout <= 0:
+            self.delete(key)
+            return
+        deadline = math.inf if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            self._data[key] = (value, deadline)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+def catalog_cache():
+    return caches[getattr(settings, 'CATALOG_CACHE_ALIAS', 'default')]
+
+
+def catalog_generation():
+    """Return the current catalog generation, starting a new one if it was evicted."""
+    generation = catalog_cache().get(CATALOG_GENERATION_KEY)
+    if generation is None:
+        # Seed from the clock so a lost counter never repeats an old generation.
+        generation = time.time_ns()
+        catalog_cache().add(CATALOG_GENERATION_KEY, generation, None)
+        generation = catalog_cache().get(CATALOG_GENERATION_KEY, generation)
+    return generation
+
+
+async def acatalog_generation():
+    """Async :func:`catalog_generation`."""
+    generation = await catalog_cache().aget(CATALOG_GENERATION_KEY)
+    if generation is None:
+        generation = time.time_ns()
+        await catalog_cache().aadd(CATALOG_GENERATION_KEY, generation, None)
+        generation = await catalog_cache().aget(CATALOG_GENERATION_KEY, generation)
+    return generation
+
+
+def catalog_modified():
+    """Return when the catalog last changed, as a timestamp in whole seconds.
+
+    Every :func:`bump_catalog_generation` moves it forward, so deactivating or
+    deleting a product, or renaming its category, changes it too; the newest
+    ``updated_at`` among the rows returned would not. If it was evicted, the
+    current time is taken.
+    """
+    modified = catalog_cache().get(CATALOG_MODIFIED_KEY)
+    if modified is None:
+        modified = int(time.time())
+        catalog_cache().add(CATALOG_MODIFIED_KEY, modified, None)
+        modified = catalog_cache().get(CATALOG_MODIFIED_KEY, modified)
+    return modified
+
+
+async def acatalog_modified():
+    """Async :func:`catalog_modified`."""
+    modified = await catalog_cache().aget(CATALOG_MODIFIED_KEY)
+    if modified is None:
+        modified = int(time.time())
+        await catalog_cache().aadd(CATALOG_MODIFIED_KEY, modified, None)
+        modified = await catalog_cache().aget(CATALOG_MODIFIED_KEY, modified)
+    return modified
+
+
+def bump_catalog_generation():
+    """Invalidate every cached catalog response.
+
+    Call this after writes that bypass model signals, such as
+    ``QuerySet.update()`` or ``bulk_create()`` on products. The generation is
+    bumped again once the surrounding transaction commits, so a response
+    cached from pre-commit data by a concurrent request cannot outlive it.
+    """
+    _incr_catalog_generation()
+    transaction.on_commit(_incr_catalog_generation)
+
+
+def _incr_catalog_generation():
+    try:
+        catalog_cache().incr(CATALOG_GENERATION_KEY)
+    except ValueError:
+        catalog_cache().set(CATALOG_GENERATION_KEY, time.time_ns(), None)
+    catalog_cache().set(CATALOG_MODIFIED_KEY, int(time.time()), None)
+
+
+def _normalized_query(request):
+    """The query string in a canonical order; ``?fields=``/``?expand=`` lists are sorted and de-duplicated too."""
+    pairs = []
+    for name, values in request.GET.lists():
+        for value in values:
+            if name in (FIELDS_PARAM, EXPAND_PARAM):
+                value = ','.join(sorted({part.strip() for part in value.split(',') if part.strip()}))
+            pairs.append((name, value))
+    return urlencode(sorted(pairs))
+
+
+class CatalogCacheMixin:
+    """Serve list/retrieve from a generation-versioned cache with conditional GET support.
+
+    Responses are keyed on the user's role, the accepted renderer, the host
+    (pagination links are absolute) and the full query string, so customers
+    (who only see active, in-stock products) and admins never share entries.
+    ``Last-Modified`` is :func:`catalog_modified` as read before the response
+    was built, which is never later than the data it describes.
+    """
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+    def catalog_cache_key(self, request, generation):
+        raw = (f'{request.user.role}:{request.accepted_renderer.format}:{request.get_host()}{request.path}'
+               f'?{_normalized_query(request)}')
+        return f'catalog:{generation}:{hashlib.md5(raw.encode()).hexdigest()}'
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        generation = catalog_generation()
+        key = self.catalog_cache_key(request, generation)
+        entry = catalog_cache().get(key)
+        if entry is None:
+            modified = catalog_modified()
+            response = handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            entry = self.store_catalog_entry(key, generation, response.data, modified)
+        return self.catalog_response(request, entry)
+
+    def catalog_entry(self, key, generation, data, modified):
+        return {
+            'data': data,
+            'etag': quote_etag(f'{generation:x}-{key[-12:]}'),
+            'last_modified': modified,
+        }
+
+    def store_catalog_entry(self, key, generation, data, modified):
+        entry = self.catalog_entry(key, generation, data, modified)
+        catalog_cache().set(key, entry, getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300))
+        return entry
+
+    async def astore_catalog_entry(self, key, generation, data, modified):
+        """Async :meth:`store_catalog_entry`."""
+        entry = self.catalog_entry(key, generation, data, modified)
+        await catalog_cache().aset(key, entry, getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300))
+        return entry
+
+    def catalog_response(self, request, entry):
+        headers = {'ETag': entry['etag'], 'Last-Modified': http_date(entry['last_modified'])}
+
+        if self.not_modified(request, entry):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response(entry['data'], headers=headers)
+
+    def not_modified(self, request, entry):
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match is not None:
+            return entry['etag'] in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*'
+        if_modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+        return if_modified_since is not None and entry['last_modified'] <= if_modified_since
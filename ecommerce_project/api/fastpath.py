@@ -0,0 +1,122 @@
+"""Read-only list serialization from ``.values()`` rows.
+
+Building a model instance per row and running every serializer field's
+``get_attribute()`` and ``to_representation()`` costs far more than the query
+behind a long listing. :class:`FastListMixin` serves list requests from
+``.values()`` over the exact columns the serializer's fields read instead,
+and turns each row into the same dict the serializer would have produced
+with a :class:`RowSerializer` compiled once per serializer and fieldset.
+
+Only fields whose output follows from a single column are supported:
+
+* model fields and ``source='relation.field'`` fields, converted by the
+  field's own ``to_representation()`` (skipped where that is the identity);
+* ``PrimaryKeyRelatedField``, which is the foreign key column;
+* fields listed in the serializer's ``Meta.value_sources``, which maps a field
+  such as a ``SerializerMethodField`` to the ORM path whose value it returns.
+
+Anything else (nested serializers, ``source='*'``, properties) makes
+:func:`compile_rows` return ``None`` and the request takes the regular path.
+"""
+from rest_framework import serializers
+from rest_framework.relations import PrimaryKeyRelatedField, RelatedField
+from rest_framework.response import Response
+
+from api import metrics
+from api.cache import LRUCache
+from api.fieldsets import ordering_columns, path_relations
+
+# Fields whose to_representation() returns database values unchanged.
+IDENTITY_FIELDS = (serializers.IntegerField, serializers.CharField, serializers.SlugField, serializers.BooleanField)
+
+# Bounded: ``?fields=`` subsets are chosen by the client.
+COMPILED_MAXSIZE = 256
+
+_compiled = LRUCache(maxsize=COMPILED_MAXSIZE)
+_MISSING = object()
+
+
+class RowSerializer:
+    """Maps ``.values(*columns)`` rows to serializer output, field by field."""
+
+    def __init__(self, columns, fields):
+        self.columns = columns
+        # (output name, values() key, converter or None)
+        self.fields = fields
+
+    def row(self, values):
+        data = {}
+        for name, key, convert in self.fields:
+            value = values[key]
+            data[name] = value if convert is None or value is None else convert(value)
+        return data
+
+    def serialize(self, rows):
+        row = self.row
+        with metrics.phase('serialize'):
+            return [row(values) for values in rows]
+
+
+def _field_spec(serializer, name, field):
+    value_sources = getattr(getattr(serializer, 'Meta', None), 'value_sources', {})
+    if name in value_sources:
+        path = value_sources[name]
+        convert = None if isinstance(field, serializers.SerializerMethodField) else field.to_representation
+    elif isinstance(field, PrimaryKeyRelatedField):
+        if field.pk_field is not None or not field.use_pk_only_optimization():
+            return None
+        path, convert = '__'.join(field.source_attrs), None
+    elif isinstance(field, (serializers.BaseSerializer, serializers.SerializerMethodField, RelatedField,
+                            serializers.ManyRelatedField)) or field.source == '*':
+        return None
+    else:
+        path = '__'.join(field.source_attrs)
+        convert = None if type(field) in IDENTITY_FIELDS else field.to_representation
+    if path_relations(serializer.Meta.model, path) is None:
+        return None
+    return name, path, convert
+
+
+def compile_rows(serializer):
+    """A :class:`RowSerializer` equivalent to ``serializer``'s fields, or ``None`` if some field is unsupported."""
+    fields = []
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        spec = _field_spec(serializer, name, field)
+        if spec is None:
+            return None
+        fields.append(spec)
+    return RowSerializer(list(dict.fromkeys(path for _, path, _ in fields)), fields)
+
+
+class FastListMixin:
+    """Serve list requests through :func:`compile_rows` when the serializer allows it.
+
+    Compiled row serializers are cached per serializer class and fieldset
+    (``?fields=``/``?expand=``, see ``api.fieldsets``), the
+    :data:`COMPILED_MAXSIZE` most recently used ones; set ``fast_list`` to
+    ``False`` to always take the regular path.
+    """
+    fast_list = True
+
+    def row_serializer(self):
+        fieldset = getattr(self, 'fieldset', None)
+        key = (self.get_serializer_class(), fieldset and (fieldset.fields, fieldset.expand))
+        rows = _compiled.get(key, _MISSING)
+        if rows is _MISSING:
+            rows = compile_rows(self.get_serializer())
+            _compiled.set(key, rows)
+        return rows
+
+    def list(self, request, *args, **kwargs):
+        rows = self.row_serializer() if self.fast_list else None
+        if rows is None:
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        queryset = queryset.values(*dict.fromkeys([*rows.columns, *ordering_columns(queryset, self.paginator)]))
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(rows.serialize(page))
+        return Response(rows.serialize(queryset))
@@ -0,0 +1,191 @@
+"""Sparse fieldsets (``?fields=``) and relation expansion (``?expand=``) for list and retrieve.
+
+``?fields=id,name,price`` keeps only those serializer fields, and
+``?expand=category`` replaces a related object's primary key with the object
+itself, serialized by the class named in the serializer's
+``Meta.expandable_fields``. The selection is pushed down to the queryset as
+well: only the columns the remaining fields read are fetched (``.only()``),
+and only the relations they traverse are joined (``select_related()``).
+
+The columns a field reads are worked out from its ``source``. Fields that
+read something else, such as a ``SerializerMethodField``, list the ORM paths
+they read in the serializer's ``Meta.field_dependencies``; without that the
+queryset is left alone and only the output is pruned.
+"""
+from functools import cached_property
+
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework.exceptions import ValidationError
+from rest_framework.serializers import BaseSerializer
+
+FIELDS_PARAM = 'fields'
+EXPAND_PARAM = 'expand'
+
+ACTIONS = ('list', 'retrieve')
+
+
+class Fieldset:
+    """The fields (``None`` for all) and expansions asked for by one request.
+
+    Both are frozensets, so the same selection written in another order or
+    with repeats is an equal fieldset.
+    """
+
+    def __init__(self, fields, expand):
+        self.fields = fields
+        self.expand = expand
+
+
+def _names(request, param):
+    value = request.query_params.get(param)
+    if value is None:
+        return None
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+def path_relations(model, path):
+    """The relations ``path`` (e.g. ``'category__name'``) traverses, or ``None`` if it is not a column path."""
+    parts = path.split('__')
+    relations = []
+    try:
+        for index, part in enumerate(parts):
+            field = model._meta.get_field(part)
+            if not field.concrete:
+                return None
+            if index < len(parts) - 1:
+                if not (field.many_to_one or field.one_to_one):
+                    return None
+                relations.append('__'.join(parts[:index + 1]))
+                model = field.related_model
+    except FieldDoesNotExist:
+        return None
+    return relations
+
+
+def _read_paths(serializer, model, prefix=''):
+    """``(columns, relations)``: the ORM paths ``serializer``'s fields read and the relations to join.
+
+    Returns ``None`` if some field reads something that cannot be worked out.
+    """
+    dependencies = getattr(getattr(serializer, 'Meta', None), 'field_dependencies', {})
+    paths, relations = set(), set()
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        if isinstance(field, BaseSerializer):
+            source = '__'.join(field.source_attrs)
+            related = path_relations(model, source)
+            related_model = _related_model(model, source) if related is not None else None
+            nested = None if related_model is None else _read_paths(field, related_model, f'{prefix}{source}__')
+            if nested is None:
+                return None
+            paths.add(prefix + source)
+            paths.update(nested[0])
+            relations.update(prefix + relation for relation in [*related, source])
+            relations.update(nested[1])
+            continue
+        if name in dependencies:
+            field_paths = dependencies[name]
+        elif field.source == '*':
+            return None
+        else:
+            field_paths = ['__'.join(field.source_attrs)]
+        for path in field_paths:
+            related = path_relations(model, path)
+            if related is None:
+                return None
+            paths.add(prefix + path)
+            relations.update(prefix + relation for relation in related)
+    return paths, relations
+
+
+def ordering_columns(queryset, paginator):
+    """The model columns ``queryset`` and ``paginator`` order by, which the cursor paginator reads back."""
+    ordering = getattr(paginator, 'ordering', None) or ()
+    if isinstance(ordering, str):
+        ordering = (ordering,)
+    return [
+        name.lstrip('-') for name in [*queryset.query.order_by, *ordering]
+        if isinstance(name, str) and path_relations(queryset.model, name.lstrip('-')) == []
+    ]
+
+
+def _related_model(model, path):
+    for part in path.split('__'):
+        model = model._meta.get_field(part).related_model
+    return model
+
+
+class SparseFieldsetSerializerMixin:
+    """Serializer side: keeps the fields of ``context['fieldset']`` and expands the ones it names."""
+
+    def get_fields(self):
+        fields = super().get_fields()
+        fieldset = self.context.get('fieldset')
+        if fieldset is None:
+            return fields
+        if fieldset.fields is not None:
+            fields = {name: field for name, field in fields.items() if name in fieldset.fields}
+        expandable = getattr(self.Meta, 'expandable_fields', {})
+        for name in fieldset.expand:
+            if name in fields:
+                fields[name] = expandable[name](source=fields[name].source, read_only=True)
+        return fields
+
+
+class SparseFieldsetMixin:
+    """View side: parses ``?fields=`` and ``?expand=`` and narrows the queryset to match.
+
+    ``fieldset_columns`` are loaded whatever is asked for, such as the owner
+    that object permissions compare.
+    """
+    fieldset_columns = ()
+
+    @cached_property
+    def fieldset(self):
+        request = self.request
+        if request.method not in ('GET', 'HEAD') or self.action not in ACTIONS:
+            return None
+        fields, expand = _names(request, FIELDS_PARAM), _names(request, EXPAND_PARAM)
+        if fields is None and expand is None:
+            return None
+
+        serializer_class = self.get_serializer_class()
+        errors = {}
+        if fields is not None:
+            available = serializer_class(context={}).fields
+            unknown = [name for name in fields if name not in available or available[name].write_only]
+            if unknown:
+                errors[FIELDS_PARAM] = f"Unknown field(s): {', '.join(unknown)}."
+        expandable = getattr(serializer_class.Meta, 'expandable_fields', {})
+        unknown = [name for name in expand or () if name not in expandable]
+        if unknown:
+            errors[EXPAND_PARAM] = f"Cannot expand: {', '.join(unknown)}."
+        if errors:
+            raise ValidationError(errors)
+        return Fieldset(None if fields is None else frozenset(fields), frozenset(expand or ()))
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.fieldset is not None:
+            context['fieldset'] = self.fieldset
+        return context
+
+    def filter_queryset(self, queryset):
+        return self.select_fieldset(super().filter_queryset(queryset))
+
+    def select_fieldset(self, queryset):
+        """Fetch only the columns and join only the relations the requested fields need."""
+        if self.fieldset is None:
+            return queryset
+        needed = _read_paths(self.get_serializer(), queryset.model)
+        if needed is None:
+            return queryset
+        paths, relations = needed
+        # Every relation joined must stay loaded, or only() refuses to follow it.
+        paths.update(relations)
+        queryset = queryset.select_related(None)
+        if relations:
+            # select_related() without arguments would follow every foreign key.
+            queryset = queryset.select_related(*relations)
+        return queryset.only('pk', *self.fieldset_columns, *ordering_columns(queryset, self.paginator), *paths)
@@ -0,0 +1,51 @@
+"""Password hashing policy and an off-event-loop hashing pool.
+
+``PASSWORD_HASHERS`` lists :class:`PBKDF2PasswordHasher` first, so its cost is
+taken from ``PASSWORD_HASHER_ITERATIONS``. Django re-hashes a password on the
+next successful login whenever the stored hash uses another algorithm or
+iteration count, so changing either setting migrates users transparently.
+"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import hashers
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    """Django's PBKDF2-SHA256 hasher with the iteration count taken from settings."""
+
+    @property
+    def iterations(self):
+        return getattr(settings, 'PASSWORD_HASHER_ITERATIONS', hashers.PBKDF2PasswordHasher.iterations)
+
+
+def executor():
+    """The shared pool that runs password hashing for async views."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'PASSWORD_HASHING_WORKERS', 2),
+                    thread_name_prefix='password-hashing',
+                )
+    return _executor
+
+
+async def amake_password(password):
+    return await asyncio.get_running_loop().run_in_executor(executor(), hashers.make_password, password)
+
+
+async def averify_password(password, encoded):
+    """Return ``(is_correct, new_encoded)``; ``new_encoded`` is set when the hash must be upgraded."""
+
+    def verify():
+        is_correct, must_update = hashers.verify_password(password, encoded)
+        return is_correct, hashers.make_password(password) if is_correct and must_update else None
+
+    return await asyncio.get_running_loop().run_in_executor(executor(), verify)
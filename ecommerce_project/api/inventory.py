@@ -0,0 +1,207 @@
+"""Stock accounting for ``Product.stock_quantity``.
+
+Stock only ever moves through conditional set-based UPDATEs such as
+``stock_quantity = stock_quantity - n WHERE stock_quantity >= n``, so
+concurrent buyers of the same product cannot oversell it and nobody holds a
+row lock longer than one statement needs.
+
+* :func:`take` removes stock for good (an order is placed) and
+  :func:`restock` puts it back.
+* :func:`reserve` takes stock and records it as a :class:`StockReservation`
+  that expires after ``STOCK_RESERVATION_TTL``. :func:`commit` turns a
+  customer's live reservations into a sale, :func:`release` returns them, and
+  :func:`release_expired` returns whatever was left to expire.
+
+Customers only see products that are in stock, so the catalog cache
+(:mod:`api.cache`) is invalidated only when a product sells out or comes back.
+Otherwise, the stock counts in cached responses can lag by up to
+``CATALOG_CACHE_TIMEOUT``. Every sale still checks the live count.
+"""
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, F, IntegerField, OuterRef, Q, Subquery, Sum, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from api import cache
+from api.models import Product, StockReservation
+
+
+class InsufficientStock(Exception):
+    """Raised when some products cannot cover the quantity asked for.
+
+    ``available`` maps each short product ID to its stock (0 for inactive or
+    missing products).
+    """
+
+    def __init__(self, available):
+        super().__init__(f'Insufficient stock for products {sorted(available)}.')
+        self.available = available
+
+
+class ReservationExpired(Exception):
+    """Raised by :func:`commit` when a reservation was released while being committed."""
+
+
+class _Shortfall(Exception):
+    pass
+
+
+def _decrement(quantities):
+    """Take ``{product_id: quantity}`` in one UPDATE, or raise ``_Shortfall`` (the caller rolls back)."""
+    condition = Q()
+    for product_id, quantity in quantities.items():
+        condition |= Q(pk=product_id, stock_quantity__gte=quantity)
+    remaining = Case(
+        *[When(pk=product_id, then=F('stock_quantity') - quantity) for product_id, quantity in quantities.items()],
+        output_field=IntegerField(),
+    )
+    updated = Product.objects.filter(condition, is_active=True).update(
+        stock_quantity=remaining, updated_at=timezone.now())
+    if updated != len(quantities):
+        raise _Shortfall
+
+
+def _take(quantities):
+    try:
+        with transaction.atomic():
+            _decrement(quantities)
+            return
+    except _Shortfall:
+        pass
+    # Holds that have lapsed are returned only when someone needs the stock.
+    if release_expired(product_ids=quantities):
+        try:
+            with transaction.atomic():
+                _decrement(quantities)
+                return
+        except _Shortfall:
+            pass
+    available = dict(Product.objects.filter(pk__in=quantities, is_active=True).values_list('pk', 'stock_quantity'))
+    raise InsufficientStock({
+        product_id: available.get(product_id, 0)
+        for product_id, quantity in quantities.items() if available.get(product_id, 0) < quantity
+    })
+
+
+def _sold_out(product_ids):
+    """Whether taking stock left any of ``product_ids`` with none."""
+    return Product.objects.filter(pk__in=list(product_ids), stock_quantity=0).exists()
+
+
+def _back_in_stock(quantities):
+    """Whether returning ``{product_id: quantity}`` may have brought a product back from none."""
+    stock = Product.objects.filter(pk__in=list(quantities)).values_list('pk', 'stock_quantity')
+    return any(remaining <= quantities[product_id] for product_id, remaining in stock)
+
+
+def take(quantities):
+    """Remove ``{product_id: quantity}`` from stock, all or nothing.
+
+    Only active products count as available. Raises :class:`InsufficientStock`.
+    """
+    quantities = {product_id: quantity for product_id, quantity in quantities.items() if quantity}
+    if not quantities:
+        return
+    _take(quantities)
+    if _sold_out(quantities):
+        cache.bump_catalog_generation()
+
+
+def restock(quantities):
+    """Put ``{product_id: quantity}`` back into stock.
+
+    Nothing is conditional here, so one parameterised UPDATE is run per
+    product instead of building a CASE with a WHEN per product, which gets
+    expensive when a bulk cancellation returns thousands of products.
+    """
+    quantities = {product_id: quantity for product_id, quantity in quantities.items() if quantity}
+    if not quantities:
+        return
+    quote = connection.ops.quote_name
+    now = timezone.now()
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'UPDATE {quote(Product._meta.db_table)} SET {quote("stock_quantity")} = {quote("stock_quantity")} + %s, '
+            f'{quote("updated_at")} = %s WHERE {quote("id")} = %s',
+            [(quantity, now, product_id) for product_id, quantity in quantities.items()],
+        )
+    if _back_in_stock(quantities):
+        cache.bump_catalog_generation()
+
+
+def reserve(user, quantities, ttl=None):
+    """Take ``{product_id: quantity}`` from stock and hold it for ``user`` until ``ttl`` passes.
+
+    Returns the created reservations. Raises :class:`InsufficientStock`.
+    """
+    expires = timezone.now() + (settings.STOCK_RESERVATION_TTL if ttl is None else ttl)
+    with transaction.atomic():
+        take(quantities)
+        return StockReservation.objects.bulk_create(
+            StockReservation(user=user, product_id=product_id, quantity=quantity, expires=expires)
+            for product_id, quantity in quantities.items() if quantity
+        )
+
+
+def commit(user):
+    """Turn ``user``'s live reservations into a sale and return the quantities they held per product.
+
+    Raises :class:`ReservationExpired` if one expired and was released
+    concurrently; nothing is committed then.
+    """
+    with transaction.atomic():
+        held = list(StockReservation.objects.select_for_update().filter(user=user, expires__gt=timezone.now())
+                    .values_list('pk', 'product_id', 'quantity'))
+        if not held:
+            return Counter()
+        deleted, _ = StockReservation.objects.filter(pk__in=[pk for pk, _, _ in held]).delete()
+        if deleted != len(held):
+            raise ReservationExpired()
+    quantities = Counter()
+    for _, product_id, quantity in held:
+        quantities[product_id] += quantity
+    return quantities
+
+
+def _release(reservations):
+    """Return the stock held by ``reservations`` (a queryset) and delete them; returns how many there were.
+
+    The stock UPDATE reads the reservations itself, so a reservation that a
+    concurrent commit or release got to first is not counted twice.
+    """
+    with transaction.atomic():
+        # Locks the rows where the database supports it.
+        rows = list(reservations.select_for_update().values_list('pk', 'product_id', 'quantity'))
+        if not rows:
+            return 0
+        returned = Counter()
+        for _, product_id, quantity in rows:
+            returned[product_id] += quantity
+        held = StockReservation.objects.filter(pk__in=[pk for pk, _, _ in rows])
+        per_product = held.filter(product=OuterRef('pk')).values('product').annotate(
+            total=Sum('quantity')).values('total')
+        Product.objects.filter(pk__in=held.values('product')).update(
+            stock_quantity=F('stock_quantity') + Coalesce(Subquery(per_product), 0),
+            updated_at=timezone.now(),
+        )
+        released, _ = held.delete()
+        restocked = released and _back_in_stock(returned)
+    if restocked:
+        cache.bump_catalog_generation()
+    return released
+
+
+def release(user):
+    """Return all of ``user``'s reservations to stock."""
+    return _release(StockReservation.objects.filter(user=user))
+
+
+def release_expired(product_ids=None):
+    """Return expired reservations (only those for ``product_ids``, if given) to stock."""
+    reservations = StockReservation.objects.filter(expires__lte=timezone.now())
+    if product_ids is not None:
+        reservations = reservations.filter(product__in=list(product_ids))
+    return _release(reservations)
@@ -0,0 +1,60 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from api import benchmark
+
+
+class Command(BaseCommand):
+    help = ('Seed a throwaway test database with a deterministic dataset and report latency '
+            'percentiles, queries per request and peak memory for every API route as JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=int, default=1000, help='Number of products (and orders) to seed.')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for the dataset.')
+        parser.add_argument('--iterations', type=int, default=50, help='Timed requests per route and role.')
+        parser.add_argument('--warmup', type=int, default=5, help='Untimed requests per route and role.')
+        parser.add_argument('--cold', action='store_true', help='Invalidate response caches before each request.')
+        parser.add_argument('--routes', nargs='*', help='Only run routes whose name contains one of these.')
+        parser.add_argument('--login-storm', type=int, default=0, metavar='LOGINS',
+                            help='Also measure product listing latency during this many concurrent logins.')
+        parser.add_argument('--concurrency', type=int, default=0,
+                            help='Also compare sync and async read throughput at this many concurrent requests.')
+        parser.add_argument('--reservation-stress', type=int, default=0, metavar='THREADS',
+                            help='Also reserve a single hot product from this many threads until it sells out.')
+        parser.add_argument('--output', '-o', default='-', help="Output file, or '-' for standard output.")
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            tokens = benchmark.seed(options['scale'], options['seed'])
+            report = {
+                'scale': options['scale'],
+                'seed': options['seed'],
+                'iterations': options['iterations'],
+                'cold': options['cold'],
+                'vendor': connection.vendor,
+                'dataset': benchmark.dataset_sizes(options['scale']),
+                'results': benchmark.run(tokens, options['iterations'], options['warmup'],
+                                         options['cold'], options['routes']),
+            }
+            if options['login_storm']:
+                report['login_storm'] = benchmark.login_storm(tokens, logins=options['login_storm'])
+            if options['concurrency']:
+                report['throughput'] = benchmark.throughput(tokens, concurrency=options['concurrency'])
+            if options['reservation_stress']:
+                report['reservation_stress'] = benchmark.reservation_stress(threads=options['reservation_stress'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        output = json.dumps(report, indent=2)
+        if options['output'] == '-':
+            sys.stdout.write(output + '\n')
+        else:
+            with open(options['output'], 'w') as file:
+                file.write(output + '\n')
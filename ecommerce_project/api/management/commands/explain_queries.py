@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from api import query_plans
+
+
+class Command(BaseCommand):
+    help = ("Explain the list and retrieve queryset of every registered endpoint, as each role sees it, "
+            "and fail if any filtered or paginated query scans a whole table.")
+
+    def handle(self, *args, **options):
+        if connection.vendor not in query_plans.FULL_SCAN_PATTERNS:
+            raise CommandError(f'Query plans cannot be checked on {connection.vendor}.')
+        plans = query_plans.endpoint_plans()
+        failed = [plan for plan in plans if plan.scans]
+        for plan in plans:
+            if plan.scans:
+                self.stdout.write(self.style.ERROR(f"{plan}: full scan of {', '.join(plan.scans)}"))
+            elif options['verbosity'] > 1:
+                self.stdout.write(f'{plan}: ok')
+            if options['verbosity'] > 1 or plan.scans:
+                self.stdout.write(f'    {plan.sql}')
+                self.stdout.write(''.join(f'    {line}\n' for line in plan.plan.splitlines()), ending='')
+        if failed:
+            raise CommandError(f'{len(failed)} of {len(plans)} endpoint queries scan whole tables.')
+        self.stdout.write(self.style.SUCCESS(f'{len(plans)} endpoint queries checked, no full table scans.'))
@@ -0,0 +1,44 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.order_export import DEFAULT_CHUNK_SIZE, ENCODERS, export_queryset, stream_orders
+from api.serializer import OrderExportSerializer
+
+
+class Command(BaseCommand):
+    help = 'Stream orders to a file as NDJSON or CSV without loading them into memory.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', '-o', default='-', help="Output file, or '-' for standard output.")
+        parser.add_argument('--format', dest='file_format', choices=sorted(ENCODERS), default='ndjson')
+        parser.add_argument('--date-from', help='First day to include (YYYY-MM-DD).')
+        parser.add_argument('--date-to', help='Last day to include (YYYY-MM-DD).')
+        parser.add_argument('--status', help='Comma-separated list of statuses to include.')
+        parser.add_argument('--gzip', action='store_true')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        params = OrderExportSerializer(data={
+            key: options[key] for key in ('date_from', 'date_to', 'status', 'file_format', 'gzip')
+            if options[key] is not None
+        })
+        if not params.is_valid():
+            raise CommandError(params.errors)
+        filters = params.validated_data
+
+        queryset = export_queryset(filters.get('date_from'), filters.get('date_to'), filters.get('status'))
+        chunks = stream_orders(queryset, filters['file_format'], gzip=filters['gzip'],
+                               chunk_size=options['chunk_size'])
+
+        if options['output'] == '-':
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
+            return
+        try:
+            with open(options['output'], 'wb') as output:
+                for chunk in chunks:
+                    output.write(chunk)
+        except OSError as exc:
+            raise CommandError(exc)
@@ -0,0 +1,37 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.product_import import DEFAULT_BATCH_SIZE, READERS, import_products
+
+
+class Command(BaseCommand):
+    help = ('Stream products from a CSV or NDJSON file in batches: rows with a slug are upserted on it, '
+            'rows without one are created with a unique slug.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import, or '-' for standard input.")
+        parser.add_argument('--format', choices=sorted(READERS),
+                            help='Input format; defaults to the file extension.')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'csv')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive.')
+
+        if path == '-':
+            report = import_products(READERS[fmt](sys.stdin), batch_size=options['batch_size'])
+        else:
+            try:
+                with open(path, newline='', encoding='utf-8') as lines:
+                    report = import_products(READERS[fmt](lines), batch_size=options['batch_size'])
+            except OSError as exc:
+                raise CommandError(exc)
+
+        for error in report.errors:
+            self.stderr.write(f"row {error['row']}: {json.dumps(error['errors'])}")
+        self.stdout.write(self.style.SUCCESS(
+            f'{report.created} created, {report.updated} updated, {report.error_count} rejected.'))
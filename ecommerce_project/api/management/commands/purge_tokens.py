@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.authentication import purge_expired_tokens
+
+
+class Command(BaseCommand):
+    help = 'Delete expired authentication tokens in bounded batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive.')
+        deleted = purge_expired_tokens(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'{deleted} expired tokens deleted.'))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from api.rollups import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Recompute the daily sales rollups from the orders table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date-from', help='First day to rebuild (YYYY-MM-DD); defaults to all days.')
+        parser.add_argument('--date-to', help='Last day to rebuild (YYYY-MM-DD); defaults to all days.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        dates = {}
+        for name in ('date_from', 'date_to'):
+            if options[name]:
+                dates[name] = parse_date(options[name])
+                if dates[name] is None:
+                    raise CommandError(f"--{name.replace('_', '-')} must be a date (YYYY-MM-DD).")
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive.')
+
+        written = rebuild(batch_size=options['batch_size'], **dates)
+        for model, count in written.items():
+            self.stdout.write(f'{model}: {count} rows')
+        self.stdout.write(self.style.SUCCESS('Rollups rebuilt.'))
@@ -0,0 +1,318 @@
+"""Per-request timing: ``Server-Timing`` headers and Prometheus latency histograms.
+
+:class:`MetricsMiddleware` starts a :class:`RequestTimer` for every request and
+makes it current through a context variable, so it follows the request into
+``sync_to_async`` threads. Time spent in these phases is added to it:
+
+* ``auth``: ``CustomTokenAuthentication``, which times itself with :func:`phase`;
+* ``db``: every SQL statement, through a wrapper :func:`install` adds to each
+  database connection (the number of statements is counted too);
+* ``serialize``: reading a serializer's ``.data``;
+* ``render``: rendering a DRF ``Response``.
+
+Phases can overlap: queries run while serializing count towards both ``db``
+and ``serialize``. When the response leaves, the middleware adds the phases
+as a ``Server-Timing`` header and records the request in the histograms of
+its route, which :func:`metrics_view` serves in the Prometheus text format.
+The histograms live in process memory, so every worker is scraped on its own.
+Only clients whose address is in ``METRICS_ALLOWED_IPS`` can read them.
+"""
+import bisect
+import ipaddress
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden
+from rest_framework.response import Response
+from rest_framework.serializers import BaseSerializer
+
+PHASES = ('auth', 'db', 'serialize', 'render')
+
+# Upper bounds, in seconds, of the request duration histogram buckets.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+# Route label for requests that did not resolve to a view, so that scanners
+# probing random paths cannot create unbounded series.
+UNMATCHED = '<unmatched>'
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_current = ContextVar('request_timer', default=None)
+
+
+class RequestTimer:
+    """Durations (in seconds) of one request's phases and its SQL statement count."""
+
+    __slots__ = ('start', 'durations', 'queries', '_open')
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.durations = dict.fromkeys(PHASES, 0.0)
+        self.queries = 0
+        self._open = set()
+
+
+def current():
+    """The :class:`RequestTimer` of the request being handled, or ``None``."""
+    return _current.get()
+
+
+class phase:
+    """Context manager adding the time spent in its block to phase ``name`` of the current request, if any.
+
+    A block nested in another block of the same phase is not counted twice.
+    """
+
+    __slots__ = ('name', '_timer', '_start')
+
+    def __init__(self, name):
+        self.name = name
+        self._timer = None
+
+    def __enter__(self):
+        timer = _current.get()
+        if timer is not None and self.name not in timer._open:
+            timer._open.add(self.name)
+            self._timer = timer
+            self._start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        timer = self._timer
+        if timer is not None:
+            timer.durations[self.name] += time.perf_counter() - self._start
+            timer._open.discard(self.name)
+            self._timer = None
+
+
+def _time_queries(execute, sql, params, many, context):
+    timer = _current.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timer.durations['db'] += time.perf_counter() - start
+        timer.queries += 1
+
+
+def _instrument_connection(sender, connection, **kwargs):
+    # First in the list, so that it is outermost and a surrounding
+    # ``connection.execute_wrapper()`` block still removes its own wrapper.
+    if _time_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _time_queries)
+
+
+def _timed_property(prop, name):
+    fget = prop.fget
+
+    def timed(self):
+        timer = _current.get()
+        if timer is None or name in timer._open:
+            return fget(self)
+        timer._open.add(name)
+        start = time.perf_counter()
+        try:
+            return fget(self)
+        finally:
+            timer.durations[name] += time.perf_counter() - start
+            timer._open.discard(name)
+
+    timed.__wrapped__ = fget
+    return property(timed, prop.fset, prop.fdel, prop.__doc__)
+
+
+_installed = False
+
+
+def install():
+    """Hook the ``db``, ``serialize`` and ``render`` phases in; called once from ``ApiConfig.ready()``."""
+    global _installed
+    if _installed:
+        return
+    _installed = True
+    connection_created.connect(_instrument_connection)
+    # Connections opened before the signal was connected.
+    for connection in connections.all(initialized_only=True):
+        _instrument_connection(None, connection)
+    # Serializer.data and ListSerializer.data both call BaseSerializer.data.
+    BaseSerializer.data = _timed_property(BaseSerializer.data, 'serialize')
+    Response.rendered_content = _timed_property(Response.rendered_content, 'render')
+
+
+def server_timing(timer, total):
+    """The ``Server-Timing`` header value for ``timer``, with durations in milliseconds."""
+    durations = timer.durations
+    return (
+        f'total;dur={total * 1000:.3f}, '
+        f'auth;dur={durations["auth"] * 1000:.3f}, '
+        f'db;dur={durations["db"] * 1000:.3f};desc="{timer.queries} queries", '
+        f'serialize;dur={durations["serialize"] * 1000:.3f}, '
+        f'render;dur={durations["render"] * 1000:.3f}'
+    )
+
+
+class _Series:
+    __slots__ = ('buckets', 'count', 'sum', 'phases', 'queries')
+
+    def __init__(self, size):
+        # Per bucket, not cumulative; the last one is +Inf.
+        self.buckets = [0] * (size + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.queries = 0
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _labels(pairs):
+    return ','.join(f'{name}="{_escape(value)}"' for name, value in pairs)
+
+
+class Registry:
+    """Request duration histograms and phase totals per ``(route, method, status)``, safe across threads."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, route, method, status, total, timer):
+        index = bisect.bisect_left(self.buckets, total)
+        key = (route, method, status)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = _Series(len(self.buckets))
+            series.buckets[index] += 1
+            series.count += 1
+            series.sum += total
+            for name, duration in timer.durations.items():
+                series.phases[name] += duration
+            series.queries += timer.queries
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def snapshot(self):
+        """``{(route, method, status): series}`` copies, for reading without the lock."""
+        with self._lock:
+            return {
+                key: (list(series.buckets), series.count, series.sum, dict(series.phases), series.queries)
+                for key, series in self._series.items()
+            }
+
+    def export(self):
+        """All series in the Prometheus text exposition format."""
+        series = sorted(self.snapshot().items())
+        bounds = [repr(float(bound)) for bound in self.buckets] + ['+Inf']
+        lines = [
+            '# HELP http_request_duration_seconds Time from a request reaching MetricsMiddleware to its response leaving it.',
+            '# TYPE http_request_duration_seconds histogram',
+        ]
+        for key, (buckets, count, total, _, _) in series:
+            labels = _labels(zip(('route', 'method', 'status'), key))
+            cumulative = 0
+            for bound, observed in zip(bounds, buckets):
+                cumulative += observed
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'http_request_duration_seconds_sum{{{labels}}} {total!r}')
+            lines.append(f'http_request_duration_seconds_count{{{labels}}} {count}')
+
+        lines += [
+            '# HELP http_request_phase_seconds_total Time spent in each phase of handling requests; phases can overlap.',
+            '# TYPE http_request_phase_seconds_total counter',
+        ]
+        for key, (_, _, _, phases, _) in series:
+            labels = _labels(zip(('route', 'method', 'status'), key))
+            for name in PHASES:
+                lines.append(f'http_request_phase_seconds_total{{{labels},phase="{name}"}} {phases[name]!r}')
+
+        lines += [
+            '# HELP http_request_db_queries_total SQL statements run while handling requests.',
+            '# TYPE http_request_db_queries_total counter',
+        ]
+        for key, (_, _, _, _, queries) in series:
+            lines.append(f'http_request_db_queries_total{{{_labels(zip(("route", "method", "status"), key))}}} {queries}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry(getattr(settings, 'METRICS_LATENCY_BUCKETS', DEFAULT_BUCKETS))
+
+
+class MetricsMiddleware:
+    """Times every request; goes first in ``MIDDLEWARE`` so the total covers the whole stack."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        timer = RequestTimer()
+        token = _current.set(timer)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, timer)
+
+    async def __acall__(self, request):
+        timer = RequestTimer()
+        token = _current.set(timer)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, timer)
+
+    def _finish(self, request, response, timer):
+        total = time.perf_counter() - timer.start
+        response['Server-Timing'] = server_timing(timer, total)
+        match = request.resolver_match
+        registry.observe(
+            match.view_name if match else UNMATCHED,
+            request.method if request.method in METHODS else 'OTHER',
+            f'{response.status_code // 100}xx',
+            total,
+            timer,
+        )
+        return response
+
+
+def _allowed(address):
+    """Whether ``address`` is in one of the ``METRICS_ALLOWED_IPS`` addresses or networks."""
+    try:
+        address = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(allowed, strict=False)
+               for allowed in getattr(settings, 'METRICS_ALLOWED_IPS', ()))
+
+
+def metrics_view(request):
+    """``GET /metrics``: this process's histograms for Prometheus to scrape.
+
+    Answers 403 unless the peer address (``REMOTE_ADDR``, never a forwarded
+    header) is allowed.
+    """
+    if not _allowed(request.META.get('REMOTE_ADDR', '')):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.export(), content_type=CONTENT_TYPE)
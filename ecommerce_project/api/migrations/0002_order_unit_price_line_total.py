@@ -0,0 +1,23 @@
+# Generated by Django 5.0.14 on 2026-10-18 18:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='line_total',
+            field=models.DecimalField(decimal_places=2, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='unit_price',
+            field=models.DecimalField(decimal_places=2, max_digits=10, null=True),
+        ),
+    ]
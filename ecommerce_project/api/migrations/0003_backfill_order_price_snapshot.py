@@ -0,0 +1,45 @@
+from django.db import migrations, models, transaction
+from django.db.models import ExpressionWrapper, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, NullIf
+
+BATCH_SIZE = 5000
+
+
+def backfill_price_snapshot(apps, schema_editor):
+    """Snapshot each existing order at its product's current price, one primary key range at a time."""
+    Order = apps.get_model('api', 'Order')
+    Product = apps.get_model('api', 'Product')
+    db_alias = schema_editor.connection.alias
+
+    price = Subquery(
+        Product.objects.using(db_alias).filter(pk=OuterRef('product_id')).values(
+            effective_price=Coalesce(NullIf(F('discount_price'), Value(0)), F('price'),
+                           output_field=models.DecimalField(max_digits=10, decimal_places=2)),
+        )[:1]
+    )
+    orders = Order.objects.using(db_alias).filter(unit_price__isnull=True).order_by('pk')
+    last_pk = 0
+    while True:
+        pks = list(orders.filter(pk__gt=last_pk).values_list('pk', flat=True)[:BATCH_SIZE])
+        if not pks:
+            break
+        with transaction.atomic(using=db_alias):
+            Order.objects.using(db_alias).filter(pk__in=pks).update(
+                unit_price=price,
+                line_total=ExpressionWrapper(
+                    F('quantity') * price, output_field=models.DecimalField(max_digits=12, decimal_places=2)),
+            )
+        last_pk = pks[-1]
+
+
+class Migration(migrations.Migration):
+    # Each batch commits on its own so large tables are not locked for the whole backfill.
+    atomic = False
+
+    dependencies = [
+        ('api', '0002_order_unit_price_line_total'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_price_snapshot, migrations.RunPython.noop),
+    ]
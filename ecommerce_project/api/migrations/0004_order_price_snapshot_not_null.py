@@ -0,0 +1,25 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_backfill_order_price_snapshot'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='line_total',
+            field=models.DecimalField(decimal_places=2, max_digits=12),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='unit_price',
+            field=models.DecimalField(decimal_places=2, max_digits=10),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['-line_total', '-id'], name='order_line_total_idx'),
+        ),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 5.0.14 on 2026-10-18 18:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_order_price_snapshot_not_null'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyCategorySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('orders', models.IntegerField(default=0)),
+                ('units', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.category')),
+            ],
+            options={
+                'verbose_name': 'Daily category sales',
+                'verbose_name_plural': 'Daily category sales',
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyProductSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('orders', models.IntegerField(default=0)),
+                ('units', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.product')),
+            ],
+            options={
+                'verbose_name': 'Daily product sales',
+                'verbose_name_plural': 'Daily product sales',
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyStateSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('orders', models.IntegerField(default=0)),
+                ('units', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('state', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.state')),
+            ],
+            options={
+                'verbose_name': 'Daily state sales',
+                'verbose_name_plural': 'Daily state sales',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='dailycategorysales',
+            constraint=models.UniqueConstraint(fields=('date', 'category'), name='daily_category_sales_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailyproductsales',
+            constraint=models.UniqueConstraint(fields=('date', 'product'), name='daily_product_sales_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailystatesales',
+            constraint=models.UniqueConstraint(fields=('date', 'state'), name='daily_state_sales_unique'),
+        ),
+    ]
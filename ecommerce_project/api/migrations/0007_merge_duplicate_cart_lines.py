@@ -0,0 +1,29 @@
+from django.db import migrations
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_cart_lines(apps, schema_editor):
+    """Fold repeated (user, product) cart lines into the oldest one, adding up their quantities."""
+    Cart = apps.get_model('api', 'Cart')
+    db_alias = schema_editor.connection.alias
+
+    duplicates = (
+        Cart.objects.using(db_alias).values('user_id', 'product_id')
+        .annotate(lines=Count('pk'), keep=Min('pk'), total=Sum('quantity'))
+        .filter(lines__gt=1).order_by()
+    )
+    for row in list(duplicates):
+        lines = Cart.objects.using(db_alias).filter(user_id=row['user_id'], product_id=row['product_id'])
+        lines.filter(pk=row['keep']).update(quantity=row['total'])
+        lines.exclude(pk=row['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_stock_reservation'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_cart_lines, migrations.RunPython.noop),
+    ]
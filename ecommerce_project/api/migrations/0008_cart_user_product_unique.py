@@ -0,0 +1,17 @@
+# Generated by Django 5.0.14 on 2026-10-18 18:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_merge_duplicate_cart_lines'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='cart',
+            constraint=models.UniqueConstraint(fields=('user', 'product'), name='cart_user_product_unique'),
+        ),
+    ]
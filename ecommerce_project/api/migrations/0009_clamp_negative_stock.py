@@ -0,0 +1,18 @@
+from django.db import migrations
+
+
+def clamp_negative_stock(apps, schema_editor):
+    """Set stock below zero to zero, so the non-negative check in the next migration can be added."""
+    Product = apps.get_model('api', 'Product')
+    Product.objects.using(schema_editor.connection.alias).filter(stock_quantity__lt=0).update(stock_quantity=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_cart_user_product_unique'),
+    ]
+
+    operations = [
+        migrations.RunPython(clamp_negative_stock, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.0.14 on 2026-10-18 19:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_clamp_negative_stock'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(fields=['name'], name='category_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_active', True), ('stock_quantity__gt', 0)), fields=['created_at', 'id'], name='product_available_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['name'], name='product_name_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='product',
+            constraint=models.CheckConstraint(check=models.Q(('stock_quantity__gte', 0)), name='product_stock_non_negative'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+from django.db import migrations
+
+
+def install_search_index(apps, schema_editor):
+    """Recreate the search triggers that rebuilding ``api_product`` in 0010 dropped on SQLite."""
+    from api import search
+
+    connection = schema_editor.connection
+    search.get_backend(connection).install(connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search_index, migrations.RunPython.noop),
+    ]
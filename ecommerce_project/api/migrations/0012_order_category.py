@@ -0,0 +1,20 @@
+# Generated by Django 5.0.14 on 2026-10-18 21:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_reinstall_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='category',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+',
+                                    to='api.category'),
+        ),
+    ]
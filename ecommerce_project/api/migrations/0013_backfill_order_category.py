@@ -0,0 +1,35 @@
+from django.db import migrations, transaction
+from django.db.models import OuterRef, Subquery
+
+BATCH_SIZE = 5000
+
+
+def backfill_order_category(apps, schema_editor):
+    """Snapshot each existing order's product's current category, one primary key range at a time."""
+    Order = apps.get_model('api', 'Order')
+    Product = apps.get_model('api', 'Product')
+    db_alias = schema_editor.connection.alias
+
+    category = Subquery(Product.objects.using(db_alias).filter(pk=OuterRef('product_id')).values('category_id')[:1])
+    orders = Order.objects.using(db_alias).filter(category__isnull=True).order_by('pk')
+    last_pk = 0
+    while True:
+        pks = list(orders.filter(pk__gt=last_pk).values_list('pk', flat=True)[:BATCH_SIZE])
+        if not pks:
+            break
+        with transaction.atomic(using=db_alias):
+            Order.objects.using(db_alias).filter(pk__in=pks).update(category=category)
+        last_pk = pks[-1]
+
+
+class Migration(migrations.Migration):
+    # Each batch commits on its own so large tables are not locked for the whole backfill.
+    atomic = False
+
+    dependencies = [
+        ('api', '0012_order_category'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_order_category, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.14 on 2026-10-18 21:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_backfill_order_category'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='category',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.category'),
+        ),
+    ]
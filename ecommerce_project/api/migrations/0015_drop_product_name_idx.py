@@ -0,0 +1,17 @@
+# Generated by Django 5.0.14 on 2026-10-18 19:54
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_order_category_not_null'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='product',
+            name='product_name_idx',
+        ),
+    ]
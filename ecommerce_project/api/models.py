@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models import ExpressionWrapper, F, Q, Value
+from django.db.models.functions import Coalesce, NullIf
 from django.utils.text import slugify
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 from django.contrib.auth.models import PermissionsMixin
@@ -9,7 +11,7 @@ class CustomToken(models.Model):
     key = models.CharField(max_length=40, primary_key=True)
     user = models.OneToOneField(settings.AUTH_USER_MODEL, related_name='custom_token', on_delete=models.CASCADE)
     created = models.DateTimeField(auto_now_add=True)
-    expires = models.DateTimeField()
+    expires = models.DateTimeField(db_index=True)
 
     def save(self, *args, **kwargs):
         if not self.key:
@@ -134,11 +136,33 @@ class Category(models.Model):
     class Meta:
         verbose_name = 'Category'
         verbose_name_plural = 'Categories'
+        indexes = [
+            models.Index(fields=['name'], name='category_name_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
 
+def effective_price(prefix=''):
+    """SQL expression for the price a product sells at: its discount price when set, else its price.
+
+    ``prefix`` is the lookup path to the product, e.g. ``'product__'``.
+    """
+    return Coalesce(
+        NullIf(F(f'{prefix}discount_price'), Value(0)), F(f'{prefix}price'),
+        output_field=models.DecimalField(max_digits=10, decimal_places=2),
+    )
+
+
+def line_total(prefix=''):
+    """SQL expression for ``quantity`` times the product's current :func:`effective_price`."""
+    return ExpressionWrapper(
+        F('quantity') * effective_price(f'{prefix}product__'),
+        output_field=models.DecimalField(max_digits=12, decimal_places=2),
+    )
+
+
 class Product(models.Model):
     name = models.CharField(max_length=200)
     slug = models.SlugField(unique=True)
@@ -157,9 +181,23 @@ class Product(models.Model):
             self.slug = slugify(self.name)
         super(Product, self).save(*args, **kwargs)
 
+    @property
+    def unit_price(self):
+        """The price an order placed now pays per unit; see :func:`effective_price`."""
+        return self.discount_price or self.price
+
     class Meta:
         verbose_name = 'Product'
         verbose_name_plural = 'Products'
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='product_created_id_idx'),
+            # The customer listing: only products that can be bought, in cursor order.
+            models.Index(fields=['created_at', 'id'], condition=Q(is_active=True, stock_quantity__gt=0),
+                         name='product_available_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(check=Q(stock_quantity__gte=0), name='product_stock_non_negative'),
+        ]
 
     def __str__(self):
         return self.name
@@ -173,13 +211,16 @@ class Cart(models.Model):
     class Meta:
         verbose_name = 'Cart'
         verbose_name_plural = 'Carts'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'product'], name='cart_user_product_unique'),
+        ]
 
     @property
     def total_cost(self):
-          if(self.product.discount_price):
-            return self.quantity * self.product.discount_price
-          else:
-            return self.quantity * self.product.price
+        # Querysets annotated with line_total() carry the total already.
+        if hasattr(self, 'line_total'):
+            return self.line_total
+        return self.quantity * self.product.unit_price
 
     def update_quantity(self, new_quantity):
         if new_quantity > 0:
@@ -199,6 +240,12 @@ class Order(models.Model):
         ('COMPLETED', 'Completed'),
         ('CANCELLED', 'Cancelled'),
     ]
+    # Target status -> statuses an order may move to it from.
+    TRANSITIONS = {
+        'PROCESSING': ('PENDING',),
+        'COMPLETED': ('PROCESSING',),
+        'CANCELLED': ('PENDING', 'PROCESSING'),
+    }
 
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
@@ -213,13 +260,103 @@ class Order(models.Model):
     postal_code = models.CharField(max_length=20)
     phone_number = models.CharField(max_length=20)  
 
+    # Price snapshot taken when the order is placed, so later price changes
+    # do not reprice it.
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+    line_total = models.DecimalField(max_digits=12, decimal_places=2)
+    # Category snapshot, so moving the product to another category does not
+    # move its past sales in the rollups.
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='+')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remembered so that saves can adjust the sales rollups by the difference.
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using, fields, **kwargs)
+        attnames = [self._meta.get_field(name).attname for name in fields] if fields else [
+            field.attname for field in self._meta.concrete_fields]
+        self._loaded_values = {
+            **getattr(self, '_loaded_values', {}),
+            **{name: getattr(self, name) for name in attnames if name in self.__dict__},
+        }
+
+    def save(self, *args, **kwargs):
+        if self.unit_price is None:
+            self.unit_price = self.product.unit_price
+        if self.category_id is None:
+            self.category_id = self.product.category_id
+        self.line_total = self.unit_price * self.quantity
+        super().save(*args, **kwargs)
+
     @property
     def total_cost(self):
-        if self.product.discount_price:
-            return self.quantity * self.product.discount_price
-        else:
-            return self.quantity * self.product.price
+        return self.line_total
 
     class Meta:
         verbose_name = 'Order'
-        verbose_name_plural = 'Orders'
\ No newline at end of file
+        verbose_name_plural = 'Orders'
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='order_created_id_idx'),
+            models.Index(fields=['user', '-created_at', '-id'], name='order_user_created_idx'),
+            models.Index(fields=['-line_total', '-id'], name='order_line_total_idx'),
+        ]
+
+
+class StockReservation(models.Model):
+    """Stock taken out of ``Product.stock_quantity`` and held for a customer until it expires; see ``api.inventory``."""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    quantity = models.PositiveIntegerField()
+    expires = models.DateTimeField(db_index=True)
+
+    class Meta:
+        verbose_name = 'Stock reservation'
+        verbose_name_plural = 'Stock reservations'
+
+
+class SalesRollup(models.Model):
+    """Daily totals of orders that are not cancelled, maintained by ``api.rollups``."""
+    date = models.DateField()
+    orders = models.IntegerField(default=0)
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        abstract = True
+
+
+class DailyProductSales(SalesRollup):
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        verbose_name = 'Daily product sales'
+        verbose_name_plural = 'Daily product sales'
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'product'], name='daily_product_sales_unique'),
+        ]
+
+
+class DailyCategorySales(SalesRollup):
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        verbose_name = 'Daily category sales'
+        verbose_name_plural = 'Daily category sales'
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'category'], name='daily_category_sales_unique'),
+        ]
+
+
+class DailyStateSales(SalesRollup):
+    state = models.ForeignKey(State, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        verbose_name = 'Daily state sales'
+        verbose_name_plural = 'Daily state sales'
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'state'], name='daily_state_sales_unique'),
+        ]
@@ -0,0 +1,110 @@
+"""Streaming order export.
+
+Orders are read with ``values().iterator()`` in one joined query, so neither
+model instances nor the full result set are ever held in memory; rows are
+encoded and yielded as byte chunks, optionally gzip-compressed on the fly.
+"""
+import csv
+import json
+import zlib
+from datetime import datetime, time, timedelta
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F
+from django.utils import timezone
+
+from api.models import Order
+
+DEFAULT_CHUNK_SIZE = 2000
+
+# Exported columns, in output order: plain Order fields or aliases of joined
+# and computed expressions.
+COLUMNS = [
+    'id', 'created_at', 'status', 'user_email', 'user_name', 'product_id', 'product_name',
+    'quantity', 'total_cost', 'street_address', 'city_name', 'state_code', 'postal_code', 'phone_number',
+]
+EXPRESSIONS = {
+    'user_email': F('user__email'),
+    'user_name': F('user__name'),
+    'product_name': F('product__name'),
+    'total_cost': F('line_total'),
+    'city_name': F('city__name'),
+    'state_code': F('state__abbreviation'),
+}
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def filter_orders(queryset, date_from=None, date_to=None, statuses=None):
+    """Narrow ``queryset`` to orders in ``[date_from, date_to]`` (inclusive dates) with one of ``statuses``."""
+    if date_from:
+        queryset = queryset.filter(created_at__gte=timezone.make_aware(datetime.combine(date_from, time.min)))
+    if date_to:
+        queryset = queryset.filter(
+            created_at__lt=timezone.make_aware(datetime.combine(date_to + timedelta(days=1), time.min)))
+    if statuses:
+        queryset = queryset.filter(status__in=statuses)
+    return queryset
+
+
+def export_queryset(date_from=None, date_to=None, statuses=None):
+    """Orders in ``[date_from, date_to]`` (inclusive dates) with one of ``statuses``, as row dicts."""
+    return filter_orders(Order.objects.all(), date_from, date_to, statuses).order_by('id').values(
+        *[column for column in COLUMNS if column not in EXPRESSIONS], **EXPRESSIONS)
+
+
+class _Echo:
+    """File-like object whose write() hands the line straight back to csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def _encode_csv(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(COLUMNS).encode()
+    for row in rows:
+        yield writer.writerow([row[column] for column in COLUMNS]).encode()
+
+
+def _encode_ndjson(rows):
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+    for row in rows:
+        yield (encoder.encode({column: row[column] for column in COLUMNS}) + '\n').encode()
+
+
+ENCODERS = {
+    'csv': _encode_csv,
+    'ndjson': _encode_ndjson,
+}
+
+
+def _buffered(lines, size=64 * 1024):
+    buffer = []
+    length = 0
+    for line in lines:
+        buffer.append(line)
+        length += len(line)
+        if length >= size:
+            yield b''.join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def _gzipped(chunks):
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def stream_orders(queryset, file_format='ndjson', gzip=False, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield the encoded export of ``queryset`` (from :func:`export_queryset`) as byte chunks."""
+    chunks = _buffered(ENCODERS[file_format](queryset.iterator(chunk_size=chunk_size)))
+    return _gzipped(chunks) if gzip else chunks
@@ -0,0 +1,72 @@
+"""Bulk order status changes following ``Order.TRANSITIONS``.
+
+Orders are moved with set-based UPDATEs that repeat the allowed source
+statuses in their WHERE clause, ``BATCH_SIZE`` orders per statement, so a
+transition that raced with another change is detected instead of applied
+twice. Stock held by cancelled orders goes back on the shelf and the sales
+rollups are adjusted in the same transaction.
+"""
+from collections import Counter, namedtuple
+
+from django.db import transaction
+from django.utils import timezone
+
+from api import inventory, rollups
+from api.models import Order
+
+BATCH_SIZE = 5000
+
+# Statuses whose orders no longer hold their stock.
+RESTOCKING_STATUSES = ('CANCELLED',)
+
+ATTEMPTS = 3
+
+TransitionResult = namedtuple('TransitionResult', 'transitioned skipped')
+
+
+class TransitionConflict(Exception):
+    """Raised when orders kept changing status concurrently for :data:`ATTEMPTS` tries."""
+
+
+def _transition(orders, status):
+    sources = Order.TRANSITIONS[status]
+    now = timezone.now()
+    with transaction.atomic():
+        rows = list(
+            orders.select_for_update(of=('self',)).order_by('pk')
+            .values('pk', *rollups.TRACKED_FIELDS)
+        )
+        moving = [row for row in rows if row['status'] in sources]
+        for start in range(0, len(moving), BATCH_SIZE):
+            batch = [row['pk'] for row in moving[start:start + BATCH_SIZE]]
+            updated = Order.objects.filter(pk__in=batch, status__in=sources).update(status=status, updated_at=now)
+            if updated != len(batch):
+                raise TransitionConflict()
+
+        if status in RESTOCKING_STATUSES:
+            quantities = Counter()
+            for row in moving:
+                if row['status'] not in RESTOCKING_STATUSES:
+                    quantities[row['product_id']] += row['quantity']
+            inventory.restock(quantities)
+        rollups.status_changed(moving, status)
+
+    return TransitionResult(
+        [row['pk'] for row in moving],
+        {row['pk']: row['status'] for row in rows if row['status'] not in sources},
+    )
+
+
+def transition(orders, status):
+    """Move every order in ``orders`` (a queryset) that ``Order.TRANSITIONS`` allows to ``status``.
+
+    Returns the IDs moved and ``{id: current status}`` for the orders that
+    could not be. Raises :class:`TransitionConflict` if concurrent changes
+    keep getting in the way.
+    """
+    for _ in range(ATTEMPTS):
+        try:
+            return _transition(orders, status)
+        except TransitionConflict:
+            continue
+    raise TransitionConflict()
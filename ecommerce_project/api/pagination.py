@@ -0,0 +1,63 @@
+from asgiref.sync import sync_to_async
+from rest_framework.pagination import CursorPagination, LimitOffsetPagination
+
+
+class AsyncCursorPaginationMixin:
+    """``apaginate_queryset()``: ``CursorPagination.paginate_queryset()`` run off the event loop.
+
+    Cursor decoding, ordering and position handling stay DRF's own; only the
+    page query runs in a thread, like every other ``sync_to_async`` ORM call.
+    """
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        return await sync_to_async(self.paginate_queryset)(queryset, request, view)
+
+
+class ProductCursorPagination(AsyncCursorPaginationMixin, CursorPagination):
+    """Keyset pagination over the (created_at, id) index on Product."""
+    ordering = ('created_at', 'id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+
+class OrderCursorPagination(AsyncCursorPaginationMixin, CursorPagination):
+    """Keyset pagination over the (created_at, id) indexes on Order, newest first."""
+    ordering = ('-created_at', '-id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+
+class AdminOffsetPagination(LimitOffsetPagination):
+    """Offset pagination for the admin UI, which needs page counts and random access."""
+    default_limit = 50
+    max_limit = 200
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+
+        self.count = await queryset.acount()
+        self.offset = self.get_offset(request)
+        if self.count == 0 or self.offset > self.count:
+            return []
+        return [obj async for obj in queryset[self.offset:self.offset + self.limit]]
+
+
+class KeysetPaginationMixin:
+    """Use the cursor paginator unless an admin opts in to offset paging with ``?offset=``."""
+    offset_pagination_class = AdminOffsetPagination
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            user = self.request.user
+            if (user.is_authenticated and user.role == 'admin'
+                    and self.offset_pagination_class.offset_query_param in self.request.query_params):
+                self._paginator = self.offset_pagination_class()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
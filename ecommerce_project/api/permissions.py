@@ -21,30 +21,80 @@ class UpdateOwnStatus(permissions.BasePermission):
             return True
 
         return obj.user_profile.id == request.user.id
-class IsAdminOrOwner(permissions.BasePermission):
-    def has_permission(self, request, view):
-        if request.user.is_authenticated:
-            return True
-        return False
 
-    def has_object_permission(self, request, view, obj):
-        if request.user.role == 'admin':
-            return True
-        if request.user.role == 'customer':
-            if request.method in permissions.SAFE_METHODS:
-                return obj.user == request.user
-            if request.method in ['PUT', 'PATCH', 'DELETE']:
-                return obj.user == request.user
-        return False
-    
-class IsAdmin(permissions.BasePermission):
-    def has_permission(self, request, view):
-        return request.user and request.user.role == 'admin'
+# Access a role gets to an endpoint: everything, or only rows it owns
+# (``obj.user_id``). Roles missing from a rule are denied.
+ALLOW = 'allow'
+OWNER = 'owner'
+
+READ = permissions.SAFE_METHODS
+WRITE = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+# policy name -> ((methods, {role: access}), ...). Views pick a policy with
+# their ``policy`` attribute (or ``@action(policy=...)``).
+POLICY_TABLE = {
+    # Catalog and reference data: everyone reads, admins write.
+    'catalog': (
+        (READ, {'admin': ALLOW, 'customer': ALLOW}),
+        (WRITE, {'admin': ALLOW}),
+    ),
+    'cart': (
+        (READ + WRITE, {'customer': OWNER}),
+    ),
+    'order': (
+        (READ + WRITE, {'admin': ALLOW, 'customer': OWNER}),
+    ),
+    'admin': (
+        (READ + WRITE, {'admin': ALLOW}),
+    ),
+    'customer': (
+        (READ + WRITE, {'customer': ALLOW}),
+    ),
+}
+
+
+class Policy(permissions.BasePermission):
+    """One row of :data:`POLICY_TABLE`, compiled to ``{method: {role: access}}``.
+
+    Instances hold no per-request state, so one is shared by every request.
+    """
+
+    def __init__(self, rules):
+        compiled = {}
+        for methods, roles in rules:
+            for method in methods:
+                compiled.setdefault(method, {}).update(roles)
+        self.rules = compiled
+
+    def access(self, request):
+        user = request.user
+        if not user or not user.is_authenticated:
+            return None
+        return self.rules.get(request.method, {}).get(user.role)
 
-class IsCustomer(permissions.BasePermission):
     def has_permission(self, request, view):
-        return request.user and request.user.role == 'customer'    
+        return self.access(request) is not None
 
-class IsOwner(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
-        return obj.user == request.user
\ No newline at end of file
+        access = self.access(request)
+        return access == ALLOW or (access == OWNER and obj.user_id == request.user.id)
+
+    def scope(self, request, queryset):
+        """Limit ``queryset`` to the rows the caller may see at all."""
+        if self.access(request) == OWNER:
+            return queryset.filter(user_id=request.user.id)
+        return queryset
+
+
+POLICIES = {name: Policy(rules) for name, rules in POLICY_TABLE.items()}
+
+
+class PolicyMixin:
+    """Check requests against ``POLICIES[policy]`` and scope querysets to owned rows where it says so."""
+    policy = None
+
+    def get_permissions(self):
+        return [POLICIES[self.policy]]
+
+    def get_queryset(self):
+        return POLICIES[self.policy].scope(self.request, super().get_queryset())
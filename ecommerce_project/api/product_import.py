@@ -0,0 +1,243 @@
+"""Streaming bulk import of products from CSV or NDJSON.
+
+Rows are validated one at a time but written in batches: each batch resolves
+its categories and brands by name in one query each and writes its products
+with a few ``bulk_create()`` calls, so memory use is bounded by the batch size
+rather than the input size.
+
+A row with a ``slug`` updates the product with that slug, or creates it.
+An update only overwrites the optional columns (description, brand,
+discount price, stock and active flag) the row has; the ones it leaves out
+keep their values, and CSV treats an empty cell as left out. A row without
+a slug always creates a product, with a slug derived from its name
+and made unique with a ``-2``, ``-3``, ... suffix, so two products that share
+a name never overwrite each other.
+"""
+import csv
+import json
+from collections import Counter, defaultdict
+from itertools import islice
+
+from django.db import transaction
+from django.utils.text import slugify
+from rest_framework import serializers
+
+from api.cache import bump_catalog_generation
+from api.models import Brand, Category, Product
+
+DEFAULT_BATCH_SIZE = 1000
+
+SLUG_LENGTH = Product._meta.get_field('slug').max_length
+# Generated slug candidates are looked up this many at a time, well below
+# SQLite's limit on query parameters.
+SLUG_LOOKUP_CHUNK = 900
+# Numbered candidates looked up per base beyond the rows that need one.
+SLUG_PROBES = 1
+
+# Only the first errors are kept in the report; the rest are just counted.
+MAX_REPORTED_ERRORS = 1000
+
+# Columns an upsert always overwrites, and those it overwrites only when the row has them.
+UPDATE_FIELDS = ['name', 'category', 'price', 'updated_at']
+OPTIONAL_UPDATE_FIELDS = ['description', 'brand', 'discount_price', 'stock_quantity', 'is_active']
+
+
+class ProductImportRowSerializer(serializers.Serializer):
+    name = serializers.CharField(max_length=200)
+    slug = serializers.SlugField(max_length=SLUG_LENGTH, required=False)
+    description = serializers.CharField(required=False, allow_blank=True, default='')
+    category = serializers.CharField(max_length=100)
+    brand = serializers.CharField(max_length=100, required=False, allow_null=True)
+    price = serializers.DecimalField(max_digits=10, decimal_places=2)
+    discount_price = serializers.DecimalField(max_digits=10, decimal_places=2, required=False, allow_null=True)
+    stock_quantity = serializers.IntegerField(min_value=0, default=0)
+    is_active = serializers.BooleanField(default=True)
+
+    def validate(self, data):
+        discount_price = data.get('discount_price')
+        if discount_price and discount_price >= data['price']:
+            raise serializers.ValidationError("Discount price must be less than the regular price.")
+        if not data.get('slug') and not slugify(data['name']):
+            raise serializers.ValidationError("Cannot derive a slug from the product name.")
+        return data
+
+
+class ImportReport:
+
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.error_count = 0
+        self.errors = []
+
+    def add_error(self, row, errors):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': row, 'errors': errors})
+
+    def as_dict(self):
+        return {
+            'created': self.created,
+            'updated': self.updated,
+            'error_count': self.error_count,
+            'errors': self.errors,
+        }
+
+
+def read_csv(lines):
+    """Yield one dict per CSV record; empty cells are treated as missing."""
+    for record in csv.DictReader(lines):
+        yield {key: value for key, value in record.items() if key and value not in ('', None)}
+
+
+def read_ndjson(lines):
+    """Yield one dict per non-blank line; undecodable lines are yielded as the exception."""
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as exc:
+            yield exc
+            continue
+        yield record if isinstance(record, dict) else ValueError('Each line must be a JSON object.')
+
+
+READERS = {
+    'csv': read_csv,
+    'ndjson': read_ndjson,
+}
+
+
+def import_products(records, batch_size=DEFAULT_BATCH_SIZE):
+    """Upsert products from an iterable of dicts and return an :class:`ImportReport`."""
+    report = ImportReport()
+    numbered = enumerate(records, start=1)
+    while True:
+        batch = list(islice(numbered, batch_size))
+        if not batch:
+            break
+        _import_batch(batch, report)
+    bump_catalog_generation()
+    return report
+
+
+def _import_batch(batch, report):
+    rows = []
+    # One serializer validates every row: building its fields per row costs more than the rest of the import.
+    validator = ProductImportRowSerializer()
+    for number, record in batch:
+        if isinstance(record, Exception):
+            report.add_error(number, [str(record)])
+            continue
+        try:
+            rows.append((number, validator.run_validation(record), record.keys()))
+        except serializers.ValidationError as exc:
+            report.add_error(number, exc.detail)
+
+    categories = dict(Category.objects.filter(
+        name__in={data['category'] for _, data, _ in rows}).values_list('name', 'id'))
+    brands = dict(Brand.objects.filter(
+        name__in={data['brand'] for _, data, _ in rows if data.get('brand')}).values_list('name', 'id'))
+
+    upserts, inserts, numbers, supplied = {}, [], {}, {}
+    for number, data, keys in rows:
+        if data['category'] not in categories:
+            report.add_error(number, {'category': [f"Category '{data['category']}' does not exist."]})
+            continue
+        brand = data.get('brand')
+        if brand and brand not in brands:
+            report.add_error(number, {'brand': [f"Brand '{brand}' does not exist."]})
+            continue
+        slug = data.get('slug')
+        if slug in upserts:
+            report.add_error(number, {'slug': [f"Slug '{slug}' is already used by row {numbers[slug]}."]})
+            continue
+        product = Product(
+            name=data['name'],
+            slug=slug,
+            description=data['description'],
+            category_id=categories[data['category']],
+            brand_id=brands.get(brand),
+            price=data['price'],
+            discount_price=data.get('discount_price'),
+            stock_quantity=data['stock_quantity'],
+            is_active=data['is_active'],
+        )
+        if slug:
+            upserts[slug] = product
+            numbers[slug] = number
+            supplied[slug] = tuple(field for field in OPTIONAL_UPDATE_FIELDS if field in keys)
+        else:
+            inserts.append(product)
+
+    if not upserts and not inserts:
+        return
+
+    with transaction.atomic():
+        existing = set(Product.objects.filter(slug__in=upserts).values_list('slug', flat=True))
+        _assign_slugs(inserts, taken=set(upserts))
+        # One upsert per combination of optional columns the rows have.
+        groups = defaultdict(list)
+        for slug, product in upserts.items():
+            groups[supplied[slug]].append(product)
+        for fields, products in groups.items():
+            Product.objects.bulk_create(
+                products,
+                update_conflicts=True,
+                unique_fields=['slug'],
+                update_fields=[*UPDATE_FIELDS, *fields],
+            )
+        if inserts:
+            Product.objects.bulk_create(inserts)
+    report.updated += len(existing)
+    report.created += len(upserts) - len(existing) + len(inserts)
+
+
+def _numbered(base, number):
+    if number == 1:
+        return base
+    suffix = f'-{number}'
+    return base[:SLUG_LENGTH - len(suffix)] + suffix
+
+
+def _existing_slugs(slugs):
+    existing = set()
+    for start in range(0, len(slugs), SLUG_LOOKUP_CHUNK):
+        existing.update(Product.objects.filter(
+            slug__in=slugs[start:start + SLUG_LOOKUP_CHUNK]).values_list('slug', flat=True))
+    return existing
+
+
+def _assign_slugs(products, taken):
+    """Give each of ``products`` a slug from its name that no product, nor a slug in ``taken``, has.
+
+    Candidates (``base``, ``base-2``, ...) are looked up by exact value, a
+    few more per base than the batch needs; a base whose candidates are all
+    taken gets the next few in another round.
+    """
+    if not products:
+        return
+    bases = [slugify(product.name)[:SLUG_LENGTH] for product in products]
+    needed = Counter(bases)
+    free = {base: [] for base in needed}
+    claimed = set(taken)
+    next_number = dict.fromkeys(needed, 1)
+    short = dict(needed)
+    while short:
+        candidates = {}
+        for base, count in short.items():
+            stop = next_number[base] + count + SLUG_PROBES
+            candidates[base] = [_numbered(base, number) for number in range(next_number[base], stop)]
+            next_number[base] = stop
+        existing = _existing_slugs([slug for slugs in candidates.values() for slug in slugs])
+        for base, slugs in candidates.items():
+            for slug in slugs:
+                # A truncated or suffixed candidate can equal another base's.
+                if slug not in existing and slug not in claimed:
+                    free[base].append(slug)
+                    claimed.add(slug)
+        short = {base: needed[base] - len(free[base]) for base in short if len(free[base]) < needed[base]}
+    free = {base: iter(slugs) for base, slugs in free.items()}
+    for product, base in zip(products, bases):
+        product.slug = next(free[base])
@@ -0,0 +1,224 @@
+"""N+1 and slow query detection for development and the test suite.
+
+While a :func:`watch` block is active, every SQL statement is fingerprinted by
+its normalised shape (literals, placeholders and ``IN`` lists replaced). The
+watch flags a shape that runs more than ``QUERY_DETECTOR_REPEAT_LIMIT`` times,
+which is what a serializer reading ``source='product.name'`` row by row looks
+like, and any single statement slower than ``QUERY_DETECTOR_SLOW_MS``. Each
+finding names the serializer field being read when it happened, if any, and
+keeps an excerpt of the project's own stack frames.
+
+:class:`QueryDetectorMiddleware` watches every request when
+``QUERY_DETECTOR_ENABLED`` is set and logs what it finds, or raises
+:class:`ExcessiveQueries` if ``QUERY_DETECTOR_RAISE`` is set too, for the
+kinds of finding in ``QUERY_DETECTOR_RAISE_ON``. :class:`QueryDetectorTestRunner`
+sets both and raises on repeated statements only, so a request made by a test
+that introduces an N+1 fails that test while a slow CI machine just logs its
+slow statements. Detection is off by default and costs nothing then.
+"""
+import logging
+import re
+import sys
+import time
+import traceback
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test.runner import DiscoverRunner
+from rest_framework.serializers import Serializer
+
+from api import metrics
+
+logger = logging.getLogger(__name__)
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|%s|\?")
+_LISTS = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_SPACE = re.compile(r'\s+')
+
+# Transaction control runs around every atomic block and says nothing about N+1s.
+_IGNORED = ('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT', 'BEGIN', 'COMMIT', 'ROLLBACK')
+
+_PROJECT_DIR = str(Path(settings.BASE_DIR).resolve())
+# Wrappers whose frames would only clutter the stack excerpt.
+_INSTRUMENTATION = {str(Path(module).resolve()) for module in (__file__, metrics.__file__)}
+
+# Frames of DRF's Serializer.to_representation() hold the field being read in ``field``.
+_TO_REPRESENTATION = Serializer.to_representation.__code__
+
+STACK_FRAMES = 6
+
+_active = ContextVar('query_watch', default=None)
+
+
+class ExcessiveQueries(AssertionError):
+    """Raised for a request whose queries tripped the detector; the message is the report."""
+
+
+def fingerprint(sql):
+    """``sql`` with literals and placeholders replaced by ``?`` and ``IN (?, ?, ...)`` by ``IN (...)``."""
+    sql = _LITERALS.sub('?', sql)
+    sql = _LISTS.sub('(...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+def _serializer_field(frame):
+    """``'Serializer.field'`` for the innermost DRF field being serialized above ``frame``, if any."""
+    while frame is not None:
+        if frame.f_code is _TO_REPRESENTATION:
+            field = frame.f_locals.get('field')
+            if field is not None:
+                return f'{type(frame.f_locals["self"]).__name__}.{field.field_name}'
+        frame = frame.f_back
+    return None
+
+
+def _stack_excerpt(frame):
+    """The innermost :data:`STACK_FRAMES` frames of project code above ``frame``, formatted."""
+    frames = [
+        summary for summary in traceback.extract_stack(frame)
+        if summary.filename.startswith(_PROJECT_DIR) and summary.filename not in _INSTRUMENTATION
+    ]
+    return ''.join(traceback.format_list(frames[-STACK_FRAMES:]))
+
+
+class Finding:
+    """A repeated statement shape (``kind='repeated'``) or a single slow statement (``kind='slow'``)."""
+
+    def __init__(self, kind, sql, source, stack):
+        self.kind = kind
+        self.sql = sql
+        self.source = source
+        self.stack = stack
+        self.count = 0
+        self.duration = 0.0
+
+    def __str__(self):
+        if self.kind == 'repeated':
+            headline = f'Query ran {self.count} times'
+        else:
+            headline = f'Query took {self.duration * 1000:.1f} ms'
+        where = f' while serializing {self.source}' if self.source else ''
+        return f'{headline}{where}:\n    {self.sql}\n{self.stack}'
+
+
+class QueryWatch:
+    """Counts statement shapes and times statements for one :func:`watch` block."""
+
+    def __init__(self, repeat_limit=None, slow_ms=None):
+        self.repeat_limit = getattr(settings, 'QUERY_DETECTOR_REPEAT_LIMIT', 10) if repeat_limit is None else repeat_limit
+        self.slow = (getattr(settings, 'QUERY_DETECTOR_SLOW_MS', 200) if slow_ms is None else slow_ms) / 1000
+        self.counts = {}
+        self.findings = []
+        self._repeated = {}
+
+    def record(self, sql, duration):
+        if sql.lstrip().upper().startswith(_IGNORED):
+            return
+        shape = fingerprint(sql)
+        count = self.counts[shape] = self.counts.get(shape, 0) + 1
+        if count > self.repeat_limit:
+            finding = self._repeated.get(shape)
+            if finding is None:
+                frame = sys._getframe(2)
+                finding = self._repeated[shape] = Finding(
+                    'repeated', shape, _serializer_field(frame), _stack_excerpt(frame))
+                self.findings.append(finding)
+            finding.count = count
+        if duration > self.slow:
+            frame = sys._getframe(2)
+            finding = Finding('slow', shape, _serializer_field(frame), _stack_excerpt(frame))
+            finding.count, finding.duration = 1, duration
+            self.findings.append(finding)
+
+    def report(self, context=None):
+        """All findings as text, headed by ``context`` (such as the view) when given."""
+        header = f'{len(self.findings)} query problem(s)' + (f' in {context}' if context else '') + ':'
+        return '\n\n'.join([header] + [str(finding) for finding in self.findings])
+
+    def check(self, context=None, kinds=None):
+        """Raise :class:`ExcessiveQueries` if anything (of ``kinds``, when given) was found."""
+        if any(kinds is None or finding.kind in kinds for finding in self.findings):
+            raise ExcessiveQueries(self.report(context))
+
+
+def _watch_queries(execute, sql, params, many, context):
+    watch = _active.get()
+    if watch is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        watch.record(sql, time.perf_counter() - start)
+
+
+def _instrument_connection(sender, connection, **kwargs):
+    # First in the list, like api.metrics, so surrounding execute_wrapper()
+    # blocks still pop their own wrapper.
+    if _watch_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _watch_queries)
+
+
+_installed = False
+
+
+def _install():
+    global _installed
+    if not _installed:
+        _installed = True
+        connection_created.connect(_instrument_connection)
+        for connection in connections.all(initialized_only=True):
+            _instrument_connection(None, connection)
+
+
+@contextmanager
+def watch(repeat_limit=None, slow_ms=None):
+    """Watch the queries run in the block, including ``sync_to_async`` threads it starts; yields the :class:`QueryWatch`.
+
+    The limits default to the ``QUERY_DETECTOR_*`` settings.
+    """
+    _install()
+    query_watch = QueryWatch(repeat_limit, slow_ms)
+    token = _active.set(query_watch)
+    try:
+        yield query_watch
+    finally:
+        _active.reset(token)
+
+
+class QueryDetectorMiddleware:
+    """Watches every request while ``QUERY_DETECTOR_ENABLED`` is set; removes itself otherwise."""
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'QUERY_DETECTOR_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with watch() as query_watch:
+            response = self.get_response(request)
+        if query_watch.findings:
+            match = request.resolver_match
+            context = f'{request.method} {request.path}' + (f' ({match.view_name})' if match else '')
+            if getattr(settings, 'QUERY_DETECTOR_RAISE', False):
+                query_watch.check(context, getattr(settings, 'QUERY_DETECTOR_RAISE_ON', None))
+            logger.warning(query_watch.report(context))
+        return response
+
+
+class QueryDetectorTestRunner(DiscoverRunner):
+    """Runs the tests with the detector on, so requests that run into an N+1 fail their test.
+
+    Slow statements are only logged: how fast a query runs depends on the machine.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        settings.QUERY_DETECTOR_ENABLED = True
+        settings.QUERY_DETECTOR_RAISE = True
+        settings.QUERY_DETECTOR_RAISE_ON = ('repeated',)
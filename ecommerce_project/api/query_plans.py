@@ -0,0 +1,97 @@
+"""Query plans of the API's endpoints, checked for full table scans.
+
+:func:`endpoint_plans` builds the queryset each router-registered viewset
+runs for ``list`` and ``retrieve``, as each role that may call it would see
+it (owner scoping, default ordering and the first page of cursor
+pagination included), and asks the database how it would execute it:
+``EXPLAIN QUERY PLAN`` on SQLite, ``EXPLAIN`` on PostgreSQL. A plan that
+reads a whole table to answer a filtered or paginated query means an index
+is missing. Unfiltered, unpaginated queries, such as the reference data
+listings, read every row anyway and are not reported.
+
+The ``explain_queries`` management command runs this against the
+configured database and fails if anything scans.
+"""
+import re
+
+from django.db import connections
+from rest_framework.pagination import CursorPagination
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api.models import CustomUser
+
+ROLES = ('admin', 'customer')
+ACTIONS = ('list', 'retrieve')
+
+# vendor -> pattern whose first group is a table read from start to end.
+FULL_SCAN_PATTERNS = {
+    # "SCAN api_product", but not "SCAN api_product USING INDEX ...".
+    'sqlite': re.compile(r'\bSCAN (\w+)(?: AS \w+)?$', re.MULTILINE),
+    'postgresql': re.compile(r'\bSeq Scan on (\w+)'),
+}
+
+
+class EndpointPlan:
+    """The plan of one endpoint's queryset for one role and action, and the tables it scans."""
+
+    def __init__(self, endpoint, role, action, queryset):
+        self.endpoint = endpoint
+        self.role = role
+        self.action = action
+        self.sql = str(queryset.query)
+        self.plan = queryset.explain()
+        query = queryset.query
+        # A query that returns every row may as well read every row.
+        selective = bool(query.where) or query.high_mark is not None
+        self.scans = _scanned_tables(queryset.db, self.plan) if selective else []
+
+    def __str__(self):
+        return f'{self.endpoint}-{self.action} ({self.role})'
+
+
+def _scanned_tables(alias, plan):
+    pattern = FULL_SCAN_PATTERNS[connections[alias].vendor]
+    return list(dict.fromkeys(pattern.findall(plan)))
+
+
+def full_scans(queryset):
+    """Tables the database would read in full to evaluate ``queryset``."""
+    return _scanned_tables(queryset.db, queryset.explain())
+
+
+def _user(role):
+    # Never saved: the queryset only needs its primary key and role.
+    return CustomUser(pk=1, role=role, email=f'{role}@explain.invalid')
+
+
+def _queryset(view):
+    queryset = view.filter_queryset(view.get_queryset())
+    if view.action == 'retrieve':
+        return queryset.filter(pk=1)
+    paginator = view.paginator
+    if isinstance(paginator, CursorPagination):
+        request = view.request
+        ordering = paginator.get_ordering(request, queryset, view)
+        # The first page; later pages add a range condition on the same columns.
+        return queryset.order_by(*ordering)[:paginator.get_page_size(request) + 1]
+    return queryset
+
+
+def endpoint_plans(router=None, roles=ROLES):
+    """An :class:`EndpointPlan` per viewset registered on ``router``, role allowed to read it and action."""
+    if router is None:
+        from api.urls import router
+    factory = APIRequestFactory()
+    plans = []
+    for prefix, viewset, basename in router.registry:
+        for role in roles:
+            for action in ACTIONS:
+                request = Request(factory.get('/'))
+                request.user = _user(role)
+                view = viewset(request=request, args=(), kwargs={} if action == 'list' else {'pk': 1},
+                               format_kwarg=None, action=action, headers={})
+                if not all(permission.has_permission(request, view) for permission in view.get_permissions()):
+                    continue
+                plans.append(EndpointPlan(basename, role, action, _queryset(view)))
+    return plans
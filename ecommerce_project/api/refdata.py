@@ -0,0 +1,175 @@
+"""Process-local snapshot of the small, nearly static reference tables.
+
+States, cities, brands and categories are loaded once per process into
+immutable structures, together with their JSON responses pre-rendered to
+bytes. A version number in the shared cache is bumped whenever any of these
+tables is written (see ``api.signals``); each worker compares it with the
+version of its snapshot and reloads on mismatch.
+"""
+import hashlib
+import threading
+import time
+from collections import namedtuple
+from types import MappingProxyType
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotModified
+from rest_framework.exceptions import NotFound
+from rest_framework.renderers import JSONRenderer
+
+from api import models, serializer
+
+VERSION_KEY = 'refdata:version'
+
+StateRow = namedtuple('StateRow', 'id abbreviation name')
+CityRow = namedtuple('CityRow', 'id name state_id')
+
+Table = namedtuple('Table', 'body etag objects')
+
+
+def _cache():
+    return caches[getattr(settings, 'REFDATA_CACHE_ALIAS', 'default')]
+
+
+def _etag(body):
+    return '"%s"' % hashlib.sha1(body).hexdigest()
+
+
+def _render_table(instances, serializer_class):
+    renderer = JSONRenderer()
+    rows = serializer_class(instances, many=True).data
+    body = renderer.render(rows)
+    objects = {}
+    for row in rows:
+        rendered = renderer.render(row)
+        objects[row['id']] = (rendered, _etag(rendered))
+    return Table(body, _etag(body), MappingProxyType(objects))
+
+
+class Snapshot:
+    """Immutable view of the reference tables at one version."""
+
+    def __init__(self, version):
+        self.version = version
+        states = list(models.State.objects.order_by('pk'))
+        cities = list(models.City.objects.order_by('pk'))
+        self.tables = MappingProxyType({
+            'states': _render_table(states, serializer.StateSerializer),
+            'cities': _render_table(cities, serializer.CitySerializer),
+            'brands': _render_table(models.Brand.objects.order_by('pk'), serializer.BrandSerializer),
+            'categories': _render_table(models.Category.objects.order_by('pk'), serializer.CategorySerializer),
+        })
+        self.states_by_abbreviation = MappingProxyType({
+            state.abbreviation: StateRow(state.id, state.abbreviation, state.name) for state in states
+        })
+        self.cities = MappingProxyType({city.id: CityRow(city.id, city.name, city.state_id) for city in cities})
+
+
+class ReferenceData:
+
+    def __init__(self):
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    def current_version(self):
+        version = _cache().get(VERSION_KEY)
+        if version is None:
+            # Seed from the clock so a lost version never repeats an old one.
+            _cache().add(VERSION_KEY, time.time_ns(), None)
+            version = _cache().get(VERSION_KEY)
+        return version
+
+    async def acurrent_version(self):
+        """Async :meth:`current_version`."""
+        version = await _cache().aget(VERSION_KEY)
+        if version is None:
+            await _cache().aadd(VERSION_KEY, time.time_ns(), None)
+            version = await _cache().aget(VERSION_KEY)
+        return version
+
+    def snapshot(self):
+        version = self.current_version()
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.version != version:
+            with self._lock:
+                snapshot = self._snapshot
+                if snapshot is None or snapshot.version != version:
+                    # Loaded under the version read beforehand, so a write
+                    # racing with the load just triggers another reload.
+                    snapshot = self._snapshot = Snapshot(version)
+        return snapshot
+
+    async def asnapshot(self):
+        """Async :meth:`snapshot`; only a reload leaves the event loop."""
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.version == await self.acurrent_version():
+            return snapshot
+        return await sync_to_async(self.snapshot)()
+
+    def table(self, name):
+        return self.snapshot().tables[name]
+
+    def state_by_abbreviation(self, abbreviation):
+        return self.snapshot().states_by_abbreviation.get(abbreviation)
+
+    def city(self, pk):
+        """Return an unshared ``City`` instance for ``pk`` built from the snapshot, or None."""
+        row = self.snapshot().cities.get(pk)
+        if row is None:
+            return None
+        return models.City.from_db('default', CityRow._fields, row)
+
+    def clear(self):
+        self._snapshot = None
+
+
+store = ReferenceData()
+
+
+def bump_version():
+    """Make every worker reload its snapshot; bumped again on commit like the catalog generation."""
+    _incr_version()
+    transaction.on_commit(_incr_version)
+
+
+def _incr_version():
+    try:
+        _cache().incr(VERSION_KEY)
+    except ValueError:
+        _cache().set(VERSION_KEY, time.time_ns(), None)
+
+
+class ReferenceDataMixin:
+    """Serve JSON list/retrieve for a reference viewset straight from the snapshot.
+
+    Other renderers (such as the browsable API) fall through to the regular
+    serializer path.
+    """
+    reference_table = None
+
+    def list(self, request, *args, **kwargs):
+        if request.accepted_renderer.format != 'json':
+            return super().list(request, *args, **kwargs)
+        table = store.table(self.reference_table)
+        return self.reference_response(request, table.body, table.etag)
+
+    def retrieve(self, request, *args, **kwargs):
+        if request.accepted_renderer.format != 'json':
+            return super().retrieve(request, *args, **kwargs)
+        try:
+            body, etag = store.table(self.reference_table).objects[int(kwargs[self.lookup_field])]
+        except (KeyError, ValueError):
+            raise NotFound()
+        return self.reference_response(request, body, etag)
+
+    def reference_response(self, request, body, etag):
+        if_none_match = request.headers.get('If-None-Match', '')
+        if etag in [tag.strip() for tag in if_none_match.split(',')]:
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(body, content_type=request.accepted_renderer.media_type)
+        response['ETag'] = etag
+        return response
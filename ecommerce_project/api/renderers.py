@@ -0,0 +1,44 @@
+"""JSON rendering with orjson.
+
+:class:`ORJSONRenderer` produces the same bytes as DRF's ``JSONRenderer`` with
+the default ``UNICODE_JSON`` and ``COMPACT_JSON`` settings, in a fraction of
+the time. Values orjson does not know natively, and datetimes (which DRF
+writes with a ``Z`` suffix), go through DRF's ``JSONEncoder``. The one known
+difference is the exponent format of floats below 1e-4 or from 1e16 up
+(``1e-05`` vs ``1e-5``), which the API never produces: its decimals are
+rendered as strings, or as floats of at most twelve digits.
+
+It falls back to ``JSONRenderer`` when orjson is not installed, when the
+client asks for indented output, when non-default JSON settings are in effect,
+and for data orjson rejects, such as integers over 64 bits.
+"""
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+if orjson is not None:
+    OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+# DRF escapes these so that the JSON is also valid JavaScript.
+_LINE_SEPARATOR = '\u2028'.encode()
+_PARAGRAPH_SEPARATOR = '\u2029'.encode()
+
+
+class ORJSONRenderer(JSONRenderer):
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if (orjson is None or self.ensure_ascii or not self.compact
+                or self.get_indent(accepted_media_type, renderer_context or {})):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            rendered = orjson.dumps(data, default=self.encoder_class().default, option=OPTIONS)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        if b'\xe2\x80' in rendered:
+            rendered = rendered.replace(_LINE_SEPARATOR, b'\\u2028').replace(_PARAGRAPH_SEPARATOR, b'\\u2029')
+        return rendered
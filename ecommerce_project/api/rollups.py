@@ -0,0 +1,210 @@
+"""Incrementally maintained daily sales rollups.
+
+Every order that is not cancelled contributes one order, its quantity and its
+``line_total`` to three daily tables keyed by product, category and state.
+The category is the one the order snapshotted when it was placed, so moving
+a product to another category leaves its past sales where they were.
+Saving or deleting an order applies the difference between its old and new
+contribution (see ``api.signals``); code that writes orders without signals,
+such as ``bulk_create()``, calls :func:`record` itself. The
+``rebuild_rollups`` command recomputes the tables from ``Order``.
+"""
+from collections import defaultdict, namedtuple
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from itertools import islice
+
+from django.db import connection, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from api.models import DailyCategorySales, DailyProductSales, DailyStateSales, Order
+
+# Orders in these statuses do not count as sales.
+EXCLUDED_STATUSES = ('CANCELLED',)
+
+# Order fields a contribution depends on.
+TRACKED_FIELDS = ('created_at', 'product_id', 'category_id', 'state_id', 'status', 'quantity', 'line_total')
+
+# (rollup model, Contribution attribute holding its key)
+ROLLUPS = (
+    (DailyProductSales, 'product_id'),
+    (DailyCategorySales, 'category_id'),
+    (DailyStateSales, 'state_id'),
+)
+
+# Breakdowns served by the analytics endpoint: rollup model, key field, label field.
+DIMENSIONS = {
+    'products': (DailyProductSales, 'product', 'product__name'),
+    'categories': (DailyCategorySales, 'category', 'category__name'),
+    'states': (DailyStateSales, 'state', 'state__abbreviation'),
+}
+
+Contribution = namedtuple('Contribution', 'date product_id category_id state_id quantity revenue')
+
+
+def _contribution(values):
+    if values['status'] in EXCLUDED_STATUSES:
+        return None
+    return Contribution(
+        timezone.localdate(values['created_at']), values['product_id'], values['category_id'], values['state_id'],
+        values['quantity'], values['line_total'],
+    )
+
+
+def _current_values(order):
+    return {name: getattr(order, name) for name in TRACKED_FIELDS}
+
+
+def apply(changes):
+    """Add ``sign`` times each contribution in ``changes``, an iterable of ``(contribution, sign)``.
+
+    Changes are merged per rollup row first; each rollup table then takes one
+    INSERT and one batched UPDATE however many rows change.
+    """
+    totals = defaultdict(lambda: defaultdict(lambda: [0, 0, Decimal(0)]))
+    for contribution, sign in changes:
+        if contribution is None:
+            continue
+        for model, key in ROLLUPS:
+            row = totals[model, key][contribution.date, getattr(contribution, key)]
+            row[0] += sign
+            row[1] += sign * contribution.quantity
+            row[2] += sign * contribution.revenue
+
+    for (model, key), rows in totals.items():
+        rows = {lookup: deltas for lookup, deltas in rows.items() if any(deltas)}
+        if rows:
+            _add(model, key, rows)
+
+
+def _add(model, key, rows):
+    """Increment ``rows`` (``{(date, key value): [orders, units, revenue]}``) of one rollup table."""
+    # Only rows gaining sales are created: a row missing for a removal was
+    # never written, or is being deleted along with its product, category
+    # or state.
+    model.objects.bulk_create(
+        [model(date=date, **{key: value}) for (date, value), deltas in rows.items() if max(deltas) > 0],
+        ignore_conflicts=True,
+    )
+
+    # One parameterised statement run for every row: building an ORM CASE
+    # with a WHEN per row costs far more than the UPDATE itself once
+    # thousands of rows change.
+    quote = connection.ops.quote_name
+    increments = ', '.join(f'{quote(column)} = {quote(column)} + %s' for column in ('orders', 'units', 'revenue'))
+    sql = (f'UPDATE {quote(model._meta.db_table)} SET {increments} '
+           f'WHERE {quote("date")} = %s AND {quote(model._meta.get_field(key).column)} = %s')
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [
+            (orders, units, revenue, date, value) for (date, value), (orders, units, revenue) in rows.items()
+        ])
+
+
+def record(orders, sign=1):
+    """Count newly created ``orders``, or uncount them with ``sign=-1``."""
+    apply((_contribution(_current_values(order)), sign) for order in orders)
+
+
+def status_changed(rows, status):
+    """Adjust for orders moved to ``status`` by a bulk UPDATE, which sends no signals.
+
+    ``rows`` are dicts of the orders' :data:`TRACKED_FIELDS` before the update.
+    """
+    changes = []
+    for row in rows:
+        changes.append((_contribution(row), -1))
+        changes.append((_contribution({**row, 'status': status}), 1))
+    apply(changes)
+
+
+def remember_previous(order):
+    """Make sure ``order`` knows its stored values before it is saved over them."""
+    loaded = getattr(order, '_loaded_values', None)
+    if order._state.adding or (loaded is not None and all(name in loaded for name in TRACKED_FIELDS)):
+        return
+    order._loaded_values = Order.objects.filter(pk=order.pk).values(*TRACKED_FIELDS).first()
+
+
+def order_saved(order, created):
+    new = _current_values(order)
+    old = None if created else getattr(order, '_loaded_values', None)
+    order._loaded_values = new
+    if old is not None and all(old.get(name) == new[name] for name in TRACKED_FIELDS):
+        return
+
+    changes = [(_contribution(new), 1)]
+    if old:
+        changes.append((_contribution(old), -1))
+    apply(changes)
+
+
+def order_deleted(order):
+    apply([(_contribution(_current_values(order)), -1)])
+
+
+def _day_range(queryset, field, date_from, date_to):
+    if date_from:
+        queryset = queryset.filter(**{f'{field}__gte': timezone.make_aware(datetime.combine(date_from, time.min))})
+    if date_to:
+        queryset = queryset.filter(
+            **{f'{field}__lt': timezone.make_aware(datetime.combine(date_to + timedelta(days=1), time.min))})
+    return queryset
+
+
+def rebuild(date_from=None, date_to=None, batch_size=5000):
+    """Recompute the rollups for ``[date_from, date_to]`` (all days by default) from ``Order``.
+
+    Returns the number of rows written per rollup model.
+    """
+    orders = _day_range(Order.objects.exclude(status__in=EXCLUDED_STATUSES), 'created_at', date_from, date_to)
+    written = {}
+    with transaction.atomic():
+        for model, key in ROLLUPS:
+            existing = model.objects.all()
+            if date_from:
+                existing = existing.filter(date__gte=date_from)
+            if date_to:
+                existing = existing.filter(date__lte=date_to)
+            existing.delete()
+
+            rows = orders.values(day=TruncDate('created_at'), key_value=F(key)).annotate(
+                order_count=Count('pk'), unit_count=Sum('quantity'), revenue_total=Sum('line_total'),
+            ).order_by().iterator(chunk_size=batch_size)
+            written[model.__name__] = 0
+            while True:
+                batch = [
+                    model(date=row['day'], orders=row['order_count'], units=row['unit_count'],
+                          revenue=row['revenue_total'], **{key: row['key_value']})
+                    for row in islice(rows, batch_size)
+                ]
+                if not batch:
+                    break
+                model.objects.bulk_create(batch)
+                written[model.__name__] += len(batch)
+    return written
+
+
+def daily_totals(date_from, date_to):
+    """Per-day totals; every counted order has exactly one state, so the state rollup sums to them."""
+    return (
+        DailyStateSales.objects.filter(date__range=(date_from, date_to)).values('date')
+        .annotate(order_count=Sum('orders'), unit_count=Sum('units'), revenue_total=Sum('revenue'))
+        .order_by('date')
+    )
+
+
+def breakdown(dimension, date_from, date_to, limit):
+    """Totals per product, category or state over the range, highest revenue first."""
+    model, key, label = DIMENSIONS[dimension]
+    rows = (
+        model.objects.filter(date__range=(date_from, date_to)).values(key, label)
+        .annotate(order_count=Sum('orders'), unit_count=Sum('units'), revenue_total=Sum('revenue'))
+        .order_by('-revenue_total', key)[:limit]
+    )
+    return [
+        {'id': row[key], 'name': row[label], 'orders': row['order_count'], 'units': row['unit_count'],
+         'revenue': row['revenue_total']}
+        for row in rows
+    ]
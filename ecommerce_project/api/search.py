@@ -0,0 +1,145 @@
+"""Full-text product search.
+
+Each database gets a backend that owns its index structures (created from the
+``post_migrate`` signal) and turns a user query into a ranked queryset. The
+backend is picked from ``connection.vendor`` unless ``PRODUCT_SEARCH_BACKEND``
+names one explicitly.
+"""
+import re
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.module_loading import import_string
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(query):
+    return WORD_RE.findall(query.lower())
+
+
+class SearchBackend:
+
+    def install(self, connection):
+        """Create the index structures; must be idempotent."""
+
+    def search(self, queryset, terms):
+        """Return ``queryset`` narrowed to products matching every term (as a prefix), best first."""
+        raise NotImplementedError
+
+
+class SQLiteFTS5Backend(SearchBackend):
+    """External-content FTS5 table over ``api_product``, kept in sync by triggers.
+
+    Triggers (rather than model signals) also cover ``bulk_create()`` and
+    ``QuerySet.update()``.
+    """
+    table = 'api_product_fts'
+
+    def triggers(self):
+        """``{name: CREATE TRIGGER statement}`` for the triggers that keep the index in sync."""
+        table = self.table
+        return {
+            f'{table}_ai': (
+                f"CREATE TRIGGER {table}_ai AFTER INSERT ON api_product BEGIN "
+                f"INSERT INTO {table}(rowid, name, description) VALUES (new.id, new.name, new.description); "
+                "END"
+            ),
+            f'{table}_ad': (
+                f"CREATE TRIGGER {table}_ad AFTER DELETE ON api_product BEGIN "
+                f"INSERT INTO {table}({table}, rowid, name, description) "
+                "VALUES ('delete', old.id, old.name, old.description); "
+                "END"
+            ),
+            f'{table}_au': (
+                f"CREATE TRIGGER {table}_au AFTER UPDATE OF name, description ON api_product BEGIN "
+                f"INSERT INTO {table}({table}, rowid, name, description) "
+                "VALUES ('delete', old.id, old.name, old.description); "
+                f"INSERT INTO {table}(rowid, name, description) VALUES (new.id, new.name, new.description); "
+                "END"
+            ),
+        }
+
+    def install(self, connection):
+        # SQLite drops a table's triggers when a migration rebuilds it (any
+        # AlterField or AddConstraint on Product), so check each of them, not
+        # just the index table.
+        triggers = self.triggers()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT name FROM sqlite_master WHERE (type = 'table' AND name = %s) "
+                "OR (type = 'trigger' AND tbl_name = 'api_product')", [self.table])
+            existing = {row[0] for row in cursor.fetchall()}
+            missing = [name for name in triggers if name not in existing]
+            if self.table in existing and not missing:
+                return
+            if self.table not in existing:
+                cursor.execute(
+                    f"CREATE VIRTUAL TABLE {self.table} USING fts5("
+                    "name, description, content='api_product', content_rowid='id', "
+                    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+                )
+            for name in missing:
+                cursor.execute(triggers[name])
+            # Rows written while a trigger was missing are not in the index.
+            cursor.execute(f"INSERT INTO {self.table}({self.table}) VALUES ('rebuild')")
+
+    def search(self, queryset, terms):
+        match = ' '.join('"%s"*' % term for term in terms)
+        return queryset.extra(
+            tables=[self.table],
+            where=[f'{self.table}.rowid = api_product.id', f'{self.table} MATCH %s'],
+            params=[match],
+            select={'search_rank': f'{self.table}.rank'},
+            order_by=['search_rank'],
+        )
+
+
+class PostgresSearchBackend(SearchBackend):
+    """``tsvector`` search backed by a GIN expression index."""
+    config = 'simple'
+
+    def install(self, connection):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS api_product_search_idx ON api_product USING GIN ("
+                f"to_tsvector('{self.config}'::regconfig, "
+                "COALESCE(name, '') || ' ' || COALESCE(description, '')))"
+            )
+
+    def search(self, queryset, terms):
+        from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+
+        vector = SearchVector('name', 'description', config=self.config)
+        query = SearchQuery(' & '.join('%s:*' % term for term in terms), search_type='raw', config=self.config)
+        return queryset.annotate(
+            search_vector=vector, search_rank=SearchRank(vector, query),
+        ).filter(search_vector=query).order_by('-search_rank', 'id')
+
+
+class LikeSearchBackend(SearchBackend):
+    """Unindexed fallback for databases without a full-text engine."""
+
+    def search(self, queryset, terms):
+        for term in terms:
+            queryset = queryset.filter(Q(name__icontains=term) | Q(description__icontains=term))
+        return queryset.order_by('id')
+
+
+BACKENDS = {
+    'sqlite': SQLiteFTS5Backend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+def get_backend(connection):
+    path = getattr(settings, 'PRODUCT_SEARCH_BACKEND', None)
+    backend_class = import_string(path) if path else BACKENDS.get(connection.vendor, LikeSearchBackend)
+    return backend_class()
+
+
+def search_products(queryset, query, connection):
+    terms = tokenize(query)
+    if not terms:
+        return queryset.none()
+    return get_backend(connection).search(queryset, terms)
@@ -1,10 +1,16 @@
+from collections import Counter
+
+from api import fieldsets
+from api import inventory
 from api import models
+from api import refdata
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from rest_framework.authtoken.models import Token
 from django.contrib.auth import authenticate
 from django.utils.text import slugify
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
+from django.db.models import F
 from rest_framework import status
 from rest_framework.response import Response
 from django.utils import timezone
@@ -26,6 +32,12 @@ class RegisterSerializer(serializers.ModelSerializer):
         )
         return user
 
+class CredentialsSerializer(serializers.Serializer):
+    """Login fields only; the async login view checks the password itself."""
+    email = serializers.EmailField()
+    password = serializers.CharField(write_only=True)
+
+
 class LoginSerializer(serializers.Serializer):
     email = serializers.EmailField()
     password = serializers.CharField(write_only=True)
@@ -83,14 +95,31 @@ class CitySerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         state_abbreviation = validated_data.pop('state')
-        try:
-            state = models.State.objects.get(abbreviation=state_abbreviation)
-        except models.State.DoesNotExist:
+        state = refdata.store.state_by_abbreviation(state_abbreviation)
+        if state is None:
             raise serializers.ValidationError(f"State with abbreviation '{state_abbreviation}' does not exist.")
         
-        city = models.City.objects.create(state=state, **validated_data)
+        city = models.City.objects.create(state_id=state.id, **validated_data)
         return city
     
+class ReferenceCityField(serializers.PrimaryKeyRelatedField):
+    """City primary key resolved against the in-memory reference data instead of the database."""
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('queryset', models.City.objects.all())
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            city = refdata.store.city(int(data))
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if city is None:
+            self.fail('does_not_exist', pk_value=data)
+        return city
+
 class BrandSerializer(serializers.ModelSerializer):
     class Meta:
         model = models.Brand
@@ -118,7 +147,7 @@ class CategorySerializer(serializers.ModelSerializer):
 
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(fieldsets.SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     category = serializers.PrimaryKeyRelatedField(queryset=models.Category.objects.all())
     brand = serializers.PrimaryKeyRelatedField(queryset=models.Brand.objects.all())
 
@@ -128,6 +157,7 @@ class ProductSerializer(serializers.ModelSerializer):
         model = models.Product
         fields = ['id', 'name', 'description', 'category', 'category_name', 'brand','brand_name', 'price', 'discount_price', 'stock_quantity', 'is_active', 'created_at', 'updated_at']
         read_only_fields = ['slug', 'created_at', 'updated_at','is_active'] 
+        expandable_fields = {'category': CategorySerializer, 'brand': BrandSerializer}
 
     # Ensure discount_price is less than price if provided
     def validate(self, data):
@@ -138,18 +168,9 @@ class ProductSerializer(serializers.ModelSerializer):
         return data
 
     def create(self, validated_data):
+        # The related fields have already resolved both primary keys.
         category = validated_data.pop('category')
         brand = validated_data.pop('brand')
-        try:
-            x = models.Category.objects.get(name=category)
-        except  models.Category.DoesNotExist:
-            raise serializers.ValidationError("Invalid category ID.")
-
-        try:
-            y =  models.Brand.objects.get(name=brand)
-        except  models.Brand.DoesNotExist:
-            raise serializers.ValidationError("Invalid brand ID.")
-
         product =  models.Product.objects.create(category=category, brand=brand, **validated_data)
         return product
 
@@ -164,18 +185,10 @@ class ProductSerializer(serializers.ModelSerializer):
             setattr(instance, attr, value)
 
         if category:
-            try:
-                x =  models.Category.objects.get(name=category)
-                instance.category = x
-            except  models.Category.DoesNotExist:
-                raise serializers.ValidationError("Invalid category ID.")
+            instance.category = category
 
         if brand:
-            try:
-                y =  models.Brand.objects.get(name=brand)
-                instance.brand = y
-            except  models.Brand.DoesNotExist:
-                raise serializers.ValidationError("Invalid brand ID.")
+            instance.brand = brand
 
         instance.save()
         return instance
@@ -188,12 +201,27 @@ class ProductSerializer(serializers.ModelSerializer):
             return Response({"message": f"Product '{instance.name}' has been deleted."}, status=status.HTTP_204_NO_CONTENT)
         else:
             return Response({"message": "Product is already inactive."}, status=status.HTTP_404_NOT_FOUND)
+class ProductSearchSerializer(serializers.Serializer):
+    """Query parameters accepted by the product search endpoint."""
+    q = serializers.CharField(max_length=200)
+    category = serializers.IntegerField(required=False)
+    brand = serializers.IntegerField(required=False)
+    min_price = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    max_price = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=20)
+
 class ProductActivationSerializer(serializers.ModelSerializer):
     class Meta:
         model = models.Product
         fields = ['is_active']
 
-class CartSerializer(serializers.ModelSerializer):
+class ProductSummarySerializer(serializers.ModelSerializer):
+    """A product as expanded into cart lines and orders by ``?expand=product``."""
+    class Meta:
+        model = models.Product
+        fields = ['id', 'name', 'price', 'discount_price', 'is_active']
+
+class CartSerializer(fieldsets.SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     total_cost = serializers.SerializerMethodField()
     product = serializers.PrimaryKeyRelatedField(queryset=models.Product.objects.all())
     pr_name = serializers.CharField(source='product.name', read_only=True)
@@ -205,25 +233,28 @@ class CartSerializer(serializers.ModelSerializer):
         extra_kwargs = {
             'user': {'read_only': True}  # Make the user field read-only
         }
+        expandable_fields = {'product': ProductSummarySerializer}
+        # CartViewSet annotates the line_total that total_cost returns.
+        field_dependencies = {'total_cost': []}
     def get_total_cost(self, obj):
         return obj.total_cost
     def create(self, validated_data):
-        product = validated_data.pop('product')
-        try:
-            p = models.Product.objects.get(name=product)
-        except models.Product.DoesNotExist:
-            raise serializers.ValidationError("Invalid product ID.")
-        
+        p = validated_data.pop('product')
+        quantity = validated_data.get('quantity', 1)
+
         if p.is_active == False:
             raise serializers.ValidationError(f"This product is inactive, please choose a new one!")
 
-        if p.stock_quantity < validated_data.get('quantity',1):
-            raise serializers.ValidationError(f"Insufficient stock for product ID {product}. Available stock: {p.stock_quantity}.")
+        # Adding a product that is already in the cart adds to that line.
+        with transaction.atomic():
+            cart, created = models.Cart.objects.get_or_create(
+                user=self.context['request'].user, product=p, defaults={'quantity': quantity})
+            if not created:
+                models.Cart.objects.filter(pk=cart.pk).update(quantity=F('quantity') + quantity)
+                cart.refresh_from_db(fields=['quantity'])
+            if p.stock_quantity < cart.quantity:
+                raise serializers.ValidationError(f"Insufficient stock for product ID {p}. Available stock: {p.stock_quantity}.")
 
-
-        cart =  models.Cart.objects.create(user=self.context['request'].user, 
-            product=product, **validated_data)
-      
         return cart
 
     def update(self, instance, validated_data):
@@ -240,6 +271,9 @@ class CartSerializer(serializers.ModelSerializer):
         if p.stock_quantity < validated_data.get('quantity', instance.quantity):
             raise serializers.ValidationError(f"Insufficient stock for product '{p.name}'. Available stock: {p.stock_quantity}.")
 
+        if p.pk != instance.product_id and models.Cart.objects.filter(user_id=instance.user_id, product=p).exists():
+            raise serializers.ValidationError(f"The product '{p.name}' is already in your cart.")
+
         instance.product = product
         instance.quantity = validated_data.get('quantity', instance.quantity)
         instance.save()
@@ -253,8 +287,102 @@ class CartSerializer(serializers.ModelSerializer):
         else:
             return Response({"message": "Cart item not found."}, status=status.HTTP_404_NOT_FOUND)
 
-class OrderSerializer(serializers.ModelSerializer):
-   city = serializers.PrimaryKeyRelatedField(queryset=models.City.objects.all())
+class CartOperationSerializer(serializers.Serializer):
+    op = serializers.ChoiceField(choices=['add', 'set', 'remove'])
+    product = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1, required=False)
+
+    def validate(self, data):
+        if data['op'] != 'remove' and 'quantity' not in data:
+            raise serializers.ValidationError({'quantity': 'This field is required.'})
+        return data
+
+class CartBatchSerializer(serializers.Serializer):
+    operations = CartOperationSerializer(many=True, allow_empty=False, max_length=100)
+
+class CheckoutSerializer(serializers.Serializer):
+    """Shipping details applied to every order created from the cart."""
+    street_address = serializers.CharField(max_length=255)
+    city = ReferenceCityField()
+    postal_code = serializers.CharField(max_length=20)
+    phone_number = serializers.CharField(max_length=20)
+
+class OrderExportSerializer(serializers.Serializer):
+    """Query parameters accepted by the order export endpoint."""
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    status = serializers.CharField(required=False, help_text="Comma-separated list of statuses.")
+    file_format = serializers.ChoiceField(choices=['ndjson', 'csv'], default='ndjson')
+    gzip = serializers.BooleanField(default=False)
+
+    def validate_status(self, value):
+        statuses = [status.strip().upper() for status in value.split(',') if status.strip()]
+        valid = {choice for choice, _ in models.Order.STATUS_CHOICES}
+        invalid = [status for status in statuses if status not in valid]
+        if invalid:
+            raise serializers.ValidationError(f"Unknown status: {', '.join(invalid)}.")
+        return statuses
+
+class OrderTransitionSerializer(serializers.Serializer):
+    """Body of the bulk transition endpoint: the target status and the orders to move, by ID and/or filter."""
+    status = serializers.ChoiceField(choices=list(models.Order.TRANSITIONS))
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False, allow_empty=False, max_length=50000)
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    from_status = serializers.ListField(
+        child=serializers.ChoiceField(choices=models.Order.STATUS_CHOICES), required=False, allow_empty=False)
+
+    def validate(self, data):
+        if not any(field in data for field in ('ids', 'date_from', 'date_to', 'from_status')):
+            raise serializers.ValidationError("Give ids or at least one filter.")
+        return data
+
+class SalesAnalyticsSerializer(serializers.Serializer):
+    """Query parameters of the sales analytics endpoints; the range defaults to the last 365 days."""
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    limit = serializers.IntegerField(min_value=1, max_value=1000, default=50)
+
+    def validate(self, data):
+        data.setdefault('date_to', timezone.localdate())
+        data.setdefault('date_from', data['date_to'] - timezone.timedelta(days=364))
+        if data['date_from'] > data['date_to']:
+            raise serializers.ValidationError("date_from must not be after date_to.")
+        return data
+
+class CartWarningSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    product = serializers.IntegerField()
+    code = serializers.CharField()
+    detail = serializers.CharField()
+
+class CartSummarySerializer(serializers.Serializer):
+    item_count = serializers.IntegerField()
+    subtotal = serializers.DecimalField(max_digits=14, decimal_places=2)
+    savings = serializers.DecimalField(max_digits=14, decimal_places=2)
+    total = serializers.DecimalField(max_digits=14, decimal_places=2)
+    warnings = CartWarningSerializer(many=True)
+
+class StockReservationSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = models.StockReservation
+        fields = ['id', 'product', 'quantity', 'expires']
+
+class SalesDaySerializer(serializers.Serializer):
+    date = serializers.DateField()
+    orders = serializers.IntegerField(source='order_count')
+    units = serializers.IntegerField(source='unit_count')
+    revenue = serializers.DecimalField(source='revenue_total', max_digits=14, decimal_places=2)
+
+class SalesBreakdownSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+    orders = serializers.IntegerField()
+    units = serializers.IntegerField()
+    revenue = serializers.DecimalField(max_digits=14, decimal_places=2)
+
+class OrderSerializer(fieldsets.SparseFieldsetSerializerMixin, serializers.ModelSerializer):
+   city = ReferenceCityField()
    product = serializers.PrimaryKeyRelatedField(queryset=models.Product.objects.all())
    state = serializers.SerializerMethodField() 
    total_cost = serializers.SerializerMethodField()
@@ -262,15 +390,22 @@ class OrderSerializer(serializers.ModelSerializer):
    class Meta:
         model = models.Order
         fields = '__all__'  
+        expandable_fields = {'product': ProductSummarySerializer, 'city': CitySerializer}
+        field_dependencies = {'state': ['city__state'], 'total_cost': ['line_total']}
+        # What get_state() and get_total_cost() return, for api.fastpath.
+        value_sources = {'state': 'city__state', 'total_cost': 'line_total'}
         extra_kwargs = {
             'user': {'read_only': True},  
             'status': {'read_only': True},  
             'created_at': {'read_only': True},
             'updated_at': {'read_only': True},
             'state':{'read_only': True},
+            'unit_price': {'read_only': True},
+            'line_total': {'read_only': True},
+            'category': {'read_only': True},
         }
    def get_state(self, obj):
-        return obj.city.state.id if obj.city else None
+        return obj.city.state_id if obj.city else None
    def get_total_cost(self, obj):
         return obj.total_cost
    def validate(self, data):
@@ -291,30 +426,23 @@ class OrderSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("User context is missing.")
         user = request.user
         validated_data['user'] = user
-        try:
-            c = models.City.objects.get(name=city)
-        except models.City.DoesNotExist:
-            raise serializers.ValidationError("Invalid city ID.")
-        
-        try:
-            p = models.Product.objects.get(name=product)
-        except models.Product.DoesNotExist:
-            raise serializers.ValidationError("Invalid product ID.")
-        
-        if p.is_active == False:
+        if not product.is_active:
             raise serializers.ValidationError(f"This product is inactive, please choose a new one!")
 
-        if p.stock_quantity < validated_data.get('quantity',1):
-            raise serializers.ValidationError(f"Insufficient stock for product ID {product}. Available stock: {p.stock_quantity}.")
-
-        state = c.state
-
-        order = models.Order.objects.create(
-            city=city,
-            state=state,
-            product=product,
-            **validated_data
-        )
+        with transaction.atomic():
+            try:
+                inventory.take({product.pk: validated_data.get('quantity', 1)})
+            except inventory.InsufficientStock as exc:
+                raise serializers.ValidationError(f"Insufficient stock for product ID {product}. Available stock: {exc.available[product.pk]}.")
+
+            order = models.Order.objects.create(
+                city=city,
+                state_id=city.state_id,
+                product=product,
+                unit_price=product.unit_price,
+                category_id=product.category_id,
+                **validated_data
+            )
 
         return order
    
@@ -324,26 +452,34 @@ class OrderSerializer(serializers.ModelSerializer):
 
         city = validated_data.pop('city')
         product = validated_data.pop('product')
+        # Only the difference from what the order already took moves stock.
+        held = Counter({instance.product_id: instance.quantity})
 
-        try:
-            c = models.City.objects.get(pk=city.pk)
-            instance.city = c
-            instance.state = c.state
-        except models.City.DoesNotExist:
-            raise serializers.ValidationError("Invalid city ID.")
+        instance.city = city
+        instance.state_id = city.state_id
 
         try:
             p = models.Product.objects.get(pk=product.pk)
+            if p.pk != instance.product_id:
+                # A different product is a new line, priced and categorised as of now.
+                instance.unit_price = p.unit_price
+                instance.category_id = p.category_id
             instance.product = p
             if not p.is_active:
                 raise serializers.ValidationError(f"This product '{p.name}' is inactive, please choose a different one!")
-            if p.stock_quantity < validated_data.get('quantity', instance.quantity):
-                raise serializers.ValidationError(f"Insufficient stock for product '{p.name}'. Available stock: {p.stock_quantity}.")
         except models.Product.DoesNotExist:
             raise serializers.ValidationError("Invalid product ID.")
 
+        needed = Counter({p.pk: validated_data.get('quantity', instance.quantity)})
+
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
 
-        instance.save()
+        with transaction.atomic():
+            try:
+                inventory.take(needed - held)
+            except inventory.InsufficientStock as exc:
+                raise serializers.ValidationError(f"Insufficient stock for product '{p.name}'. Available stock: {exc.available[p.pk]}.")
+            inventory.restock(held - needed)
+            instance.save()
         return instance
\ No newline at end of file
@@ -0,0 +1,67 @@
+from django.db import connections
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_save
+from django.dispatch import receiver
+
+from api import authentication, refdata, rollups, search
+from api.cache import bump_catalog_generation
+from api.models import Brand, Category, City, CustomToken, CustomUser, Order, Product, State
+
+
+@receiver(post_save, sender=CustomToken)
+@receiver(post_delete, sender=CustomToken)
+def invalidate_cached_token(sender, instance, **kwargs):
+    authentication.invalidate_token(instance.key)
+
+
+@receiver(post_save, sender=CustomUser)
+def invalidate_cached_user_tokens(sender, instance, created, **kwargs):
+    # Cached tokens carry a copy of the user, so deactivation and role
+    # changes must not be served from the cache.
+    if not created:
+        authentication.invalidate_user_tokens(instance)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Brand)
+@receiver(post_delete, sender=Brand)
+def invalidate_catalog_cache(sender, **kwargs):
+    bump_catalog_generation()
+
+
+@receiver(post_save, sender=State)
+@receiver(post_delete, sender=State)
+@receiver(post_save, sender=City)
+@receiver(post_delete, sender=City)
+@receiver(post_save, sender=Brand)
+@receiver(post_delete, sender=Brand)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_reference_data(sender, **kwargs):
+    refdata.bump_version()
+
+
+@receiver(pre_save, sender=Order)
+def remember_order_values(sender, instance, raw, **kwargs):
+    if not raw:
+        rollups.remember_previous(instance)
+
+
+@receiver(post_save, sender=Order)
+def update_sales_rollups(sender, instance, created, raw, **kwargs):
+    if not raw:
+        rollups.order_saved(instance, created)
+
+
+@receiver(post_delete, sender=Order)
+def remove_from_sales_rollups(sender, instance, **kwargs):
+    rollups.order_deleted(instance)
+
+
+@receiver(post_migrate)
+def install_search_index(sender, using, **kwargs):
+    if sender.name == 'api':
+        connection = connections[using]
+        search.get_backend(connection).install(connection)
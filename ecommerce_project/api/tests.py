@@ -1,3 +1,1992 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache, caches
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, reset_queries, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import F, QuerySet, Sum
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from django.utils import timezone
+from django.utils.http import parse_http_date
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.renderers import JSONRenderer
+
+from api import (
+    authentication, benchmark, fastpath, inventory, metrics, order_transitions, permissions, query_detector,
+    query_plans, refdata, rollups, search, serializer, views,
+)
+from api.authentication import CustomTokenAuthentication
+from api.cache import LRUCache, bump_catalog_generation, catalog_generation
+from api.renderers import ORJSONRenderer
+from api.models import (
+    Brand, Cart, Category, City, CustomToken, CustomUser, DailyCategorySales, DailyProductSales, DailyStateSales,
+    Order, Product, State, StockReservation,
+)
+
+
+class APITestCase(TestCase):
+    """Base class that resets the process-level caches between tests."""
+
+    def setUp(self):
+        cache.clear()
+        authentication.token_cache.clear()
+
+    def create_user(self, email, role='customer'):
+        return CustomUser.objects.create_user(email=email, name=email.split('@')[0], role=role)
+
+    def create_token(self, user):
+        return CustomToken.objects.create(user=user)
+
+    def auth_header(self, token):
+        return {'HTTP_AUTHORIZATION': f'Token {token.key}'}
+
+    def seed(self, n, customer):
+        """Create ``n`` rows of every catalog table plus carts and orders for ``customer``.
+
+        Every row gets its own related objects so that per-row relation access
+        shows up as extra queries.
+        """
+        offset = Product.objects.count()
+        indexes = range(offset, offset + n)
+        states = State.objects.bulk_create(State(abbreviation=chr(65 + i // 26 % 26) + chr(65 + i % 26), name=f'State {i}') for i in indexes)
+        cities = City.objects.bulk_create(City(name=f'City {i}', state=state) for i, state in zip(indexes, states))
+        brands = Brand.objects.bulk_create(Brand(name=f'Brand {i}') for i in indexes)
+        categories = Category.objects.bulk_create(Category(name=f'Category {i}', slug=f'category-{i}') for i in indexes)
+        products = Product.objects.bulk_create(
+            Product(
+                name=f'Product {i}', slug=f'product-{i}', description='', category=category,
+                brand=brand, price=10, discount_price=8 if i % 2 else None, stock_quantity=100,
+            )
+            for i, category, brand in zip(indexes, categories, brands)
+        )
+        Cart.objects.bulk_create(Cart(user=customer, product=product, quantity=1) for product in products)
+        Order.objects.bulk_create(
+            Order(
+                user=customer, product=product, quantity=2, unit_price=product.unit_price,
+                line_total=product.unit_price * 2, category=product.category, street_address='1 Main St',
+                city=city, state=city.state, postal_code='00000', phone_number='555-0100',
+            )
+            for product, city in zip(products, cities)
+        )
+
+
+class TokenAuthenticationCacheTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user('customer@example.com')
+        self.token = self.create_token(self.user)
+        self.auth = CustomTokenAuthentication()
+
+    def test_warm_cache_hits_database_zero_times(self):
+        with self.assertNumQueries(1):
+            user, token = self.auth.authenticate_credentials(self.token.key)
+        self.assertEqual(user, self.user)
+        self.assertEqual(token.key, self.token.key)
+
+        with self.assertNumQueries(0):
+            self.auth.authenticate_credentials(self.token.key)
+
+    def test_shared_cache_serves_other_workers(self):
+        self.auth.authenticate_credentials(self.token.key)
+        # Simulate another worker: empty local LRU, warm shared cache.
+        authentication.token_cache.clear()
+        with self.assertNumQueries(0):
+            user, _ = self.auth.authenticate_credentials(self.token.key)
+        self.assertEqual(user.pk, self.user.pk)
+
+    def test_authenticated_request_skips_auth_queries(self):
+        headers = self.auth_header(self.token)
+        self.client.get('/api/carts/', **headers)
+        with self.assertNumQueries(1):  # the cart listing itself
+            response = self.client.get('/api/carts/', **headers)
+        self.assertEqual(response.status_code, 200)
+
+    def test_unknown_key_is_negatively_cached(self):
+        with self.assertNumQueries(1):
+            with self.assertRaises(AuthenticationFailed):
+                self.auth.authenticate_credentials('missing')
+        with self.assertNumQueries(0):
+            with self.assertRaises(AuthenticationFailed):
+                self.auth.authenticate_credentials('missing')
+
+    def test_token_delete_invalidates_cache(self):
+        self.auth.authenticate_credentials(self.token.key)
+        self.token.delete()
+        with self.assertRaisesMessage(AuthenticationFailed, 'Invalid token.'):
+            self.auth.authenticate_credentials(self.token.key)
+
+    def test_token_save_invalidates_cache(self):
+        self.auth.authenticate_credentials(self.token.key)
+        self.token.expires = timezone.now() - timedelta(seconds=1)
+        self.token.save()
+        with self.assertRaisesMessage(AuthenticationFailed, 'Token has expired.'):
+            self.auth.authenticate_credentials(self.token.key)
+
+    def test_user_deactivation_invalidates_cache(self):
+        self.auth.authenticate_credentials(self.token.key)
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaisesMessage(AuthenticationFailed, 'User inactive or deleted.'):
+            self.auth.authenticate_credentials(self.token.key)
+
+    def test_cache_entry_never_outlives_token(self):
+        self.token.expires = timezone.now() - timedelta(seconds=1)
+        self.token.save()
+        with self.assertRaisesMessage(AuthenticationFailed, 'Token has expired.'):
+            self.auth.authenticate_credentials(self.token.key)
+        self.assertIsNone(authentication.token_cache.get(self.token.key))
+
+
+class SlidingExpiryTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user('customer@example.com')
+        self.token = self.create_token(self.user)
+        self.auth = CustomTokenAuthentication()
+
+    def age(self, token, delta):
+        CustomToken.objects.filter(pk=token.pk).update(expires=token.expires - delta)
+
+    def test_fresh_token_is_not_written(self):
+        self.auth.authenticate_credentials(self.token.key)
+        with self.assertNumQueries(0):
+            self.auth.authenticate_credentials(self.token.key)
+        self.assertEqual(CustomToken.objects.get().expires, self.token.expires)
+
+    def test_aged_token_is_renewed_once(self):
+        self.age(self.token, settings.AUTH_TOKEN_RENEW_INTERVAL + timedelta(seconds=1))
+        with self.assertNumQueries(2):  # fetch and renew
+            self.auth.authenticate_credentials(self.token.key)
+        renewed = CustomToken.objects.get().expires
+        self.assertGreater(renewed, self.token.expires - timedelta(seconds=5))
+        with self.assertNumQueries(0):
+            _, token = self.auth.authenticate_credentials(self.token.key)
+        self.assertEqual(token.expires, renewed)
+
+    def test_losing_renewal_race_drops_stale_copy(self):
+        self.age(self.token, settings.AUTH_TOKEN_RENEW_INTERVAL + timedelta(seconds=1))
+        stale = CustomToken.objects.select_related('user').get()
+        authentication.renew_token(CustomToken.objects.get())
+        authentication.cache_token(stale.key, stale)
+        with self.assertNumQueries(1):  # the conditional update matches nothing
+            authentication.renew_token(stale)
+        self.assertIsNone(authentication.token_cache.get(stale.key))
+        _, token = self.auth.authenticate_credentials(stale.key)
+        self.assertEqual(token.expires, CustomToken.objects.get().expires)
+
+    def test_expired_token_is_not_renewed(self):
+        CustomToken.objects.filter(pk=self.token.pk).update(expires=timezone.now() - timedelta(seconds=1))
+        with self.assertRaisesMessage(AuthenticationFailed, 'Token has expired.'):
+            self.auth.authenticate_credentials(self.token.key)
+        self.assertTrue(CustomToken.objects.get().is_expired())
+
+    def test_purge_tokens_deletes_expired_rows_in_batches(self):
+        past = timezone.now() - timedelta(seconds=1)
+        for i in range(5):
+            CustomToken.objects.create(user=self.create_user(f'expired{i}@example.com'), expires=past)
+        out = io.StringIO()
+        call_command('purge_tokens', batch_size=2, stdout=out)
+        self.assertIn('5 expired tokens deleted.', out.getvalue())
+        self.assertEqual(list(CustomToken.objects.values_list('key', flat=True)), [self.token.key])
+
+
+    def test_purge_keeps_tokens_renewed_after_selection(self):
+        expired = CustomToken.objects.create(user=self.create_user('expired@example.com'),
+                                             expires=timezone.now() - timedelta(seconds=1))
+        delete = QuerySet.delete
+
+        def renew_then_delete(queryset):
+            # Renewed between the SELECT and the DELETE.
+            CustomToken.objects.filter(key=expired.key).update(expires=timezone.now() + timedelta(hours=1))
+            return delete(queryset)
+
+        with mock.patch.object(QuerySet, 'delete', autospec=True, side_effect=renew_then_delete):
+            self.assertEqual(authentication.purge_expired_tokens(), 0)
+        self.assertTrue(CustomToken.objects.filter(key=expired.key).exists())
+
+
+@override_settings(PASSWORD_HASHER_ITERATIONS=1000)
+class AsyncLoginTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = CustomUser.objects.create_user(email='customer@example.com', name='customer', password='secret')
+
+    async def login(self, password='secret'):
+        return await self.async_client.post(
+            '/api/async/login/', {'email': 'customer@example.com', 'password': password},
+            content_type='application/json')
+
+    async def test_login_returns_a_reusable_token(self):
+        response = await self.login()
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual((body['email'], body['role']), ('customer@example.com', 'customer'))
+        self.assertEqual((await self.login()).json()['token'], body['token'])
+        self.assertEqual(await CustomToken.objects.filter(user=self.user).acount(), 1)
+
+    async def test_invalid_credentials_match_the_sync_view(self):
+        response = await self.login('wrong')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'non_field_errors': ['Invalid credentials']})
+        response = await self.async_client.post('/api/async/login/', {'email': 'nobody@example.com', 'password': 'x'})
+        self.assertEqual(response.status_code, 400)
+
+    async def test_login_upgrades_the_stored_hash(self):
+        with self.settings(PASSWORD_HASHER_ITERATIONS=2000):
+            self.assertEqual((await self.login()).status_code, 200)
+        await self.user.arefresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$2000$'))
+        self.assertEqual((await self.login()).status_code, 200)
+
+    async def test_register_hashes_with_the_configured_policy(self):
+        response = await self.async_client.post(
+            '/api/async/register/', {'email': 'new@example.com', 'name': 'New', 'password': 'pw'},
+            content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json(), {'email': 'new@example.com', 'name': 'New'})
+        user = await CustomUser.objects.aget(email='new@example.com')
+        self.assertTrue(user.password.startswith('pbkdf2_sha256$1000$'))
+        self.assertTrue(await user.acheck_password('pw'))
+
+        response = await self.async_client.post(
+            '/api/async/register/', {'email': 'new@example.com', 'name': 'Again', 'password': 'pw'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('email', response.json())
+
+    def test_sync_login_also_upgrades_legacy_hashes(self):
+        CustomUser.objects.filter(pk=self.user.pk).update(
+            password=make_password('secret', hasher='pbkdf2_sha1'))
+        response = self.client.post('/api/login/', {'email': 'customer@example.com', 'password': 'secret'})
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$1000$'))
+
+class QueryBudgetTests(APITestCase):
+    """Every router endpoint runs a constant number of queries regardless of row count."""
+
+    N = 3
+
+    def setUp(self):
+        super().setUp()
+        self.admin = self.create_user('admin@example.com', role='admin')
+        self.customer = self.create_user('customer@example.com')
+        self.tokens = {
+            'admin': self.create_token(self.admin),
+            'customer': self.create_token(self.customer),
+        }
+
+    def endpoints(self):
+        endpoints = [
+            ('admin', '/api/states/'), ('admin', '/api/cities/'), ('admin', '/api/brands/'),
+            ('admin', '/api/categories/'), ('admin', '/api/products/'), ('admin', '/api/orders/'),
+            ('customer', '/api/products/'), ('customer', '/api/orders/'), ('customer', '/api/carts/'),
+        ]
+        details = [
+            ('admin', f'/api/states/{State.objects.first().pk}/'),
+            ('admin', f'/api/cities/{City.objects.first().pk}/'),
+            ('admin', f'/api/brands/{Brand.objects.first().pk}/'),
+            ('admin', f'/api/categories/{Category.objects.first().pk}/'),
+            ('admin', f'/api/products/{Product.objects.first().pk}/'),
+            ('admin', f'/api/orders/{Order.objects.first().pk}/'),
+            ('customer', f'/api/carts/{Cart.objects.first().pk}/'),
+        ]
+        return endpoints + details
+
+    def count_queries(self):
+        counts = {}
+        for role, url in self.endpoints():
+            headers = self.auth_header(self.tokens[role])
+            # Measure the uncached path.
+            bump_catalog_generation()
+            refdata.bump_version()
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, **headers)
+            self.assertEqual(response.status_code, 200, url)
+            counts[role, url] = len(queries)
+        return counts
+
+    def test_query_count_is_independent_of_row_count(self):
+        self.seed(self.N, self.customer)
+        self.count_queries()  # warm the authentication cache
+        small = self.count_queries()
+
+        self.seed(9 * self.N, self.customer)
+        large = self.count_queries()
+
+        for endpoint, count in small.items():
+            with self.subTest(endpoint=endpoint):
+                self.assertEqual(large[endpoint], count)
+
+
+class PaginationTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.admin = self.create_user('admin@example.com', role='admin')
+        self.customer = self.create_user('customer@example.com')
+        self.admin_headers = self.auth_header(self.create_token(self.admin))
+        self.customer_headers = self.auth_header(self.create_token(self.customer))
+        self.seed(7, self.customer)
+
+    def collect(self, url, headers):
+        results = []
+        while url:
+            response = self.client.get(url, **headers)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('count', response.data)
+            results.extend(response.data['results'])
+            url = response.data['next']
+        return results
+
+    def test_products_are_cursor_paginated_oldest_first(self):
+        results = self.collect('/api/products/?page_size=3', self.customer_headers)
+        expected = list(Product.objects.order_by('created_at', 'id').values_list('id', flat=True))
+        self.assertEqual([row['id'] for row in results], expected)
+
+    def test_orders_are_cursor_paginated_newest_first(self):
+        results = self.collect('/api/orders/?page_size=3', self.customer_headers)
+        expected = list(Order.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual([row['id'] for row in results], expected)
+
+    def test_admin_can_opt_in_to_offset_pagination(self):
+        response = self.client.get('/api/products/?offset=5&limit=5', **self.admin_headers)
+        self.assertEqual(response.data['count'], 7)
+        self.assertEqual(len(response.data['results']), 2)
+
+    def test_offset_pagination_is_admin_only(self):
+        response = self.client.get('/api/orders/?offset=5&limit=5', **self.customer_headers)
+        self.assertNotIn('count', response.data)
+        self.assertEqual(len(response.data['results']), 7)
+
+
+class CheckoutTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.customer = self.create_user('customer@example.com')
+        self.headers = self.auth_header(self.create_token(self.customer))
+        self.state = State.objects.create(abbreviation='CA', name='California')
+        self.city = City.objects.create(name='Oakland', state=self.state)
+        self.category = Category.objects.create(name='Shoes', slug='shoes')
+        self.address = {
+            'street_address': '1 Main St', 'city': self.city.pk,
+            'postal_code': '94607', 'phone_number': '555-0100',
+        }
+
+    def fill_cart(self, n, stock=10, quantity=2):
+        products = Product.objects.bulk_create(
+            Product(name=f'Shoe {i}', slug=f'shoe-{i}-{n}', description='', category=self.category,
+                    price=10, stock_quantity=stock)
+            for i in range(n)
+        )
+        Cart.objects.bulk_create(Cart(user=self.customer, product=p, quantity=quantity) for p in products)
+        return products
+
+    def checkout(self):
+        return self.client.post('/api/cart-to-order/', self.address, format='json', **self.headers)
+
+    def test_checkout_creates_orders_and_decrements_stock(self):
+        products = self.fill_cart(3)
+        response = self.checkout()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data), 3)
+        self.assertEqual(response.data[0]['state'], self.state.pk)
+        self.assertFalse(Cart.objects.filter(user=self.customer).exists())
+        for product in products:
+            product.refresh_from_db()
+            self.assertEqual(product.stock_quantity, 8)
+        self.assertEqual(Order.objects.filter(user=self.customer, city=self.city, state=self.state).count(), 3)
+
+    def test_checkout_snapshots_prices(self):
+        products = self.fill_cart(2, quantity=3)
+        Product.objects.filter(pk=products[0].pk).update(discount_price=7)
+        self.assertEqual(self.checkout().status_code, 201)
+        Product.objects.update(price=99, discount_price=None)
+
+        orders = Order.objects.order_by('product_id')
+        self.assertEqual([(o.unit_price, o.line_total) for o in orders], [(7, 21), (10, 30)])
+        self.assertEqual(Order.objects.aggregate(total=Sum('line_total'))['total'], 51)
+        response = self.client.get('/api/orders/?ordering=-line_total,-id', **self.headers)
+        self.assertEqual([row['total_cost'] for row in response.data['results']], [30, 21])
+
+    def test_insufficient_stock_rolls_back(self):
+        products = self.fill_cart(3)
+        Product.objects.filter(pk=products[1].pk).update(stock_quantity=1)
+        response = self.checkout()
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Available stock: 1', str(response.data))
+        self.assertEqual(Product.objects.get(pk=products[0].pk).stock_quantity, 10)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(Cart.objects.filter(user=self.customer).count(), 3)
+
+    def test_lines_added_during_checkout_stay_in_the_cart(self):
+        self.fill_cart(2)
+        late = Product.objects.create(name='Late', slug='late', description='', category=self.category, price=5,
+                                      stock_quantity=5)
+        take = inventory.take
+
+        def add_line_then_take(quantities):
+            # A concurrent request adds to the cart after checkout has read it.
+            Cart.objects.create(user=self.customer, product=late, quantity=1)
+            return take(quantities)
+
+        with mock.patch.object(inventory, 'take', side_effect=add_line_then_take):
+            self.assertEqual(self.checkout().status_code, 201)
+        self.assertEqual(list(Cart.objects.filter(user=self.customer).values_list('product_id', flat=True)), [late.pk])
+        self.assertFalse(Order.objects.filter(product=late).exists())
+
+    def test_missing_address_is_rejected(self):
+        self.fill_cart(1)
+        self.address.pop('city')
+        response = self.checkout()
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('city', response.data)
+
+    def test_query_count_is_independent_of_cart_size(self):
+        self.checkout()  # warm the authentication cache
+        refdata.store.snapshot()
+        counts = []
+        for n in (5, 50):
+            self.fill_cart(n)
+            with CaptureQueriesContext(connection) as queries:
+                response = self.checkout()
+            self.assertEqual(response.status_code, 201)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+
+class ConcurrentCheckoutTests(TransactionTestCase):
+
+    def test_concurrent_checkouts_do_not_oversell(self):
+        cache.clear()
+        authentication.token_cache.clear()
+        state = State.objects.create(abbreviation='CA', name='California')
+        city = City.objects.create(name='Oakland', state=state)
+        category = Category.objects.create(name='Shoes', slug='shoes')
+        product = Product.objects.create(name='Shoe', slug='shoe', description='', category=category,
+                                         price=10, stock_quantity=5)
+        tokens = []
+        for i in range(8):
+            user = CustomUser.objects.create_user(email=f'c{i}@example.com', name=f'c{i}')
+            Cart.objects.create(user=user, product=product, quantity=2)
+            tokens.append(CustomToken.objects.create(user=user))
+        address = {'street_address': '1 Main St', 'city': city.pk, 'postal_code': '94607', 'phone_number': '555'}
+        barrier = threading.Barrier(len(tokens))
+
+        def checkout(token):
+            # The test client's exception capture is process-wide, so let
+            # lock contention surface as a 500 and retry on that instead.
+            client = Client(raise_request_exception=False)
+            try:
+                barrier.wait()
+                for attempt in range(50):
+                    response = client.post('/api/cart-to-order/', address, HTTP_AUTHORIZATION=f'Token {token.key}')
+                    if response.status_code != 500:  # SQLite lock contention
+                        return response.status_code
+                    time.sleep(0.01)
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(len(tokens)) as pool:
+            statuses = list(pool.map(checkout, tokens))
+
+        product.refresh_from_db()
+        sold = Order.objects.aggregate(total=Sum('quantity'))['total'] or 0
+        self.assertGreaterEqual(product.stock_quantity, 0)
+        self.assertEqual(sold + product.stock_quantity, 5)
+        self.assertEqual(statuses.count(201), 2)
+        self.assertEqual(statuses.count(400), 6)
+
+
+class CatalogCacheTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.admin = self.create_user('admin@example.com', role='admin')
+        self.customer = self.create_user('customer@example.com')
+        self.admin_headers = self.auth_header(self.create_token(self.admin))
+        self.customer_headers = self.auth_header(self.create_token(self.customer))
+        self.seed(3, self.customer)
+        self.product = Product.objects.order_by('id').first()
+
+    def test_cache_hit_runs_no_queries(self):
+        first = self.client.get('/api/products/', **self.customer_headers)
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/products/', **self.customer_headers)
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(first['ETag'], second['ETag'])
+
+    def test_etag_and_last_modified_give_304(self):
+        response = self.client.get(f'/api/products/{self.product.pk}/', **self.customer_headers)
+        self.assertIn('Last-Modified', response)
+
+        response = self.client.get(f'/api/products/{self.product.pk}/', HTTP_IF_NONE_MATCH=response['ETag'],
+                                   **self.customer_headers)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+        response = self.client.get(f'/api/products/{self.product.pk}/',
+                                   HTTP_IF_MODIFIED_SINCE=response['Last-Modified'], **self.customer_headers)
+        self.assertEqual(response.status_code, 304)
+
+    def test_if_modified_since_sees_deactivation(self):
+        first = self.client.get('/api/products/', **self.customer_headers)
+        later = time.time() + 10
+        with mock.patch('api.cache.time.time', return_value=later):
+            self.product.is_active = False
+            self.product.save()
+        # The newest updated_at among the remaining rows did not change.
+        response = self.client.get('/api/products/', HTTP_IF_MODIFIED_SINCE=first['Last-Modified'],
+                                   **self.customer_headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(self.product.pk, [row['id'] for row in response.data['results']])
+        self.assertGreater(parse_http_date(response['Last-Modified']), parse_http_date(first['Last-Modified']))
+
+    @override_settings(ALLOWED_HOSTS=['shop.example', 'api.example'])
+    def test_hosts_do_not_share_entries(self):
+        links = [
+            self.client.get('/api/products/?page_size=1', HTTP_HOST=host, **self.customer_headers).data['next']
+            for host in ('shop.example', 'api.example')
+        ]
+        self.assertTrue(links[0].startswith('http://shop.example/'))
+        self.assertTrue(links[1].startswith('http://api.example/'))
+
+    def test_product_save_invalidates(self):
+        etag = self.client.get('/api/products/', **self.customer_headers)['ETag']
+        self.product.is_active = False
+        self.product.save()
+        response = self.client.get('/api/products/', HTTP_IF_NONE_MATCH=etag, **self.customer_headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(self.product.pk, [row['id'] for row in response.data['results']])
+
+    def test_category_rename_invalidates(self):
+        self.client.get(f'/api/products/{self.product.pk}/', **self.customer_headers)
+        category = self.product.category
+        category.name = 'Renamed'
+        category.save()
+        response = self.client.get(f'/api/products/{self.product.pk}/', **self.customer_headers)
+        self.assertEqual(response.data['category_name'], 'Renamed')
+
+    def test_roles_do_not_share_entries(self):
+        Product.objects.filter(pk=self.product.pk).update(is_active=False)
+        customer = self.client.get('/api/products/', **self.customer_headers)
+        admin = self.client.get('/api/products/', **self.admin_headers)
+        self.assertEqual(len(customer.data['results']), 2)
+        self.assertEqual(len(admin.data['results']), 3)
+
+
+class ProductSearchTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.customer = self.create_user('customer@example.com')
+        self.headers = self.auth_header(self.create_token(self.customer))
+        self.shoes = Category.objects.create(name='Shoes', slug='shoes')
+        self.shirts = Category.objects.create(name='Shirts', slug='shirts')
+        self.brand = Brand.objects.create(name='Acme')
+        self.runner = self.create_product('Trail Runner', 'Lightweight running shoe', self.shoes, 120, brand=self.brand)
+        self.racer = self.create_product('Road Racer', 'Fast shoe for running races', self.shoes, 90)
+        self.tee = self.create_product('Running Tee', 'Breathable shirt', self.shirts, 30)
+        self.boot = self.create_product('Hiking Boot', 'Waterproof boot', self.shoes, 150)
+
+    def create_product(self, name, description, category, price, **kwargs):
+        return Product.objects.create(name=name, description=description, category=category, price=price,
+                                      stock_quantity=5, **kwargs)
+
+    def search(self, query):
+        response = self.client.get(f'/api/products/search/?{query}', **self.headers)
+        self.assertEqual(response.status_code, 200, response.data)
+        return [row['id'] for row in response.data]
+
+    def test_prefix_matching_on_name_and_description(self):
+        self.assertCountEqual(self.search('q=run'), [self.runner.pk, self.racer.pk, self.tee.pk])
+        self.assertEqual(self.search('q=waterpr'), [self.boot.pk])
+        self.assertEqual(self.search('q=road shoe'), [self.racer.pk])
+
+    def test_results_are_ranked(self):
+        self.assertEqual(self.search('q=running')[0], self.tee.pk)  # short document, name match
+
+    def test_filters_combine_with_the_match(self):
+        self.assertEqual(self.search(f'q=run&category={self.shirts.pk}'), [self.tee.pk])
+        self.assertEqual(self.search(f'q=run&brand={self.brand.pk}'), [self.runner.pk])
+        self.assertEqual(self.search('q=run&min_price=50&max_price=100'), [self.racer.pk])
+
+    def test_index_follows_updates_and_deletes(self):
+        Product.objects.filter(pk=self.boot.pk).update(name='Trail Boot')
+        self.racer.delete()
+        bump_catalog_generation()
+        self.assertCountEqual(self.search('q=trail'), [self.runner.pk, self.boot.pk])
+        self.assertEqual(self.search('q=racer'), [])
+
+    def test_customers_only_find_available_products(self):
+        Product.objects.filter(pk=self.runner.pk).update(stock_quantity=0)
+        bump_catalog_generation()
+        self.assertNotIn(self.runner.pk, self.search('q=trail'))
+
+    def test_query_is_required(self):
+        response = self.client.get('/api/products/search/', **self.headers)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.search('q=%22%2A'), [])
+
+
+class ProductImportTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.admin = self.create_user('admin@example.com', role='admin')
+        self.headers = self.auth_header(self.create_token(self.admin))
+        self.shoes = Category.objects.create(name='Shoes', slug='shoes')
+        self.acme = Brand.objects.create(name='Acme')
+
+    def post(self, body, content_type, query=''):
+        return self.client.post(f'/api/products/bulk/{query}', body, content_type=content_type, **self.headers)
+
+    def test_csv_import_creates_and_reports_errors(self):
+        body = (
+            'name,description,category,brand,price,discount_price,stock_quantity\n'
+            'Trail Runner,Light,Shoes,Acme,120.00,99.99,5\n'
+            'Road Racer,,Shoes,,90,,3\n'
+            'Bad Price,,Shoes,,abc,,1\n'
+            'Lost,,Hats,,10,,1\n'
+        )
+        response = self.post(body, 'text/csv')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual(response.data['error_count'], 2)
+        self.assertEqual([error['row'] for error in response.data['errors']], [3, 4])
+
+        runner = Product.objects.get(slug='trail-runner')
+        self.assertEqual((runner.brand, runner.discount_price, runner.stock_quantity), (self.acme, Decimal('99.99'), 5))
+        self.assertIsNone(Product.objects.get(slug='road-racer').brand)
+
+    def test_ndjson_import_upserts_on_slug(self):
+        Product.objects.create(name='Trail Runner', description='', category=self.shoes, price=100)
+        body = '\n'.join([
+            json.dumps({'name': 'Trail Runner', 'slug': 'trail-runner', 'category': 'Shoes', 'price': '110',
+                        'stock_quantity': 7}),
+            'not json',
+            json.dumps({'name': 'Boot', 'slug': 'boot-2024', 'category': 'Shoes', 'price': '150'}),
+        ])
+        response = self.post(body, 'application/x-ndjson')
+        self.assertEqual((response.data['created'], response.data['updated'], response.data['error_count']), (1, 1, 1))
+        runner = Product.objects.get(slug='trail-runner')
+        self.assertEqual((runner.price, runner.stock_quantity), (Decimal('110'), 7))
+        self.assertTrue(Product.objects.filter(slug='boot-2024').exists())
+
+    def test_upserts_keep_the_columns_a_row_leaves_out(self):
+        for slug in ('kept', 'changed'):
+            Product.objects.create(name=slug, slug=slug, description='Keep me', category=self.shoes, brand=self.acme,
+                                   price=10, discount_price=5, stock_quantity=42, is_active=False)
+        body = (
+            'name,slug,description,category,brand,price,discount_price,stock_quantity,is_active\n'
+            'Kept,kept,,Shoes,,12,,,\n'
+            'Changed,changed,New,Shoes,,12,,3,true\n'
+        )
+        response = self.post(body, 'text/csv')
+        self.assertEqual((response.data['updated'], response.data['error_count']), (2, 0))
+        fields = ('name', 'price', 'description', 'brand', 'discount_price', 'stock_quantity', 'is_active')
+        self.assertEqual(Product.objects.filter(slug='kept').values_list(*fields).get(),
+                         ('Kept', Decimal('12'), 'Keep me', self.acme.pk, Decimal('5'), 42, False))
+        self.assertEqual(Product.objects.filter(slug='changed').values_list(*fields).get(),
+                         ('Changed', Decimal('12'), 'New', self.acme.pk, Decimal('5'), 3, True))
+
+    def test_rows_without_slug_never_overwrite(self):
+        Product.objects.create(name='Trail Runner', description='', category=self.shoes, price=100)
+        long_name = 'x' * 60
+        body = '\n'.join(json.dumps(row) for row in [
+            {'name': 'Trail Runner', 'category': 'Shoes', 'price': '110'},
+            {'name': 'Trail Runner', 'category': 'Shoes', 'price': '120'},
+            {'name': long_name, 'category': 'Shoes', 'price': '1'},
+            {'name': long_name + 'y', 'category': 'Shoes', 'price': '2'},
+        ])
+        response = self.post(body, 'application/x-ndjson')
+        self.assertEqual((response.data['created'], response.data['updated'], response.data['error_count']), (4, 0, 0))
+        self.assertEqual(dict(Product.objects.values_list('slug', 'price')), {
+            'trail-runner': Decimal('100'), 'trail-runner-2': Decimal('110'), 'trail-runner-3': Decimal('120'),
+            'x' * 50: Decimal('1'), 'x' * 48 + '-2': Decimal('2'),
+        })
+
+    # bulk_create() splits the INSERT to fit SQLite's parameter limit, once per 90 rows here.
+    @override_settings(QUERY_DETECTOR_REPEAT_LIMIT=50)
+    def test_large_batches_without_slugs(self):
+        Product.objects.create(name='Item 7', description='', category=self.shoes, price=1)
+        body = 'name,category,price\n' + ''.join(f'Item {i},Shoes,1\n' for i in range(1500)) + 'Item 7,Shoes,2\n'
+        self.post('', 'text/csv')  # warm the authentication cache
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post(body, 'text/csv', '?batch_size=2000')
+        self.assertEqual((response.data['created'], response.data['error_count']), (1501, 0))
+        # Two candidates per name, looked up 900 at a time.
+        lookups = [query for query in queries if query['sql'].startswith('SELECT "api_product"."slug"')]
+        self.assertEqual(len(lookups), 4)
+        self.assertEqual(list(Product.objects.filter(name='Item 7').order_by('pk').values_list('slug', flat=True)),
+                         ['item-7', 'item-7-2', 'item-7-3'])
+        self.assertEqual(Product.objects.values('slug').distinct().count(), 1502)
+
+    def test_duplicate_slugs_in_a_batch_are_rejected(self):
+        body = '\n'.join(json.dumps(row) for row in [
+            {'name': 'Boot', 'slug': 'boot', 'category': 'Shoes', 'price': '150'},
+            {'name': 'Other Boot', 'slug': 'boot', 'category': 'Shoes', 'price': '99'},
+        ])
+        response = self.post(body, 'application/x-ndjson')
+        self.assertEqual((response.data['created'], response.data['error_count']), (1, 1))
+        self.assertEqual(response.data['errors'][0]['row'], 2)
+        self.assertEqual(Product.objects.get(slug='boot').name, 'Boot')
+
+    def test_query_count_is_per_batch(self):
+        def rows(n):
+            header = 'name,category,brand,price\n'
+            return header + ''.join(f'Product {i},Shoes,Acme,10\n' for i in range(n))
+
+        self.post('', 'text/csv')  # warm the authentication cache
+        counts = []
+        for n in (5, 50):
+            with CaptureQueriesContext(connection) as queries:
+                self.post(rows(n), 'text/csv', '?batch_size=1000')
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+        # Rows without a slug always create; the second run's first five get "-2" slugs.
+        self.assertEqual(Product.objects.count(), 55)
+
+    def test_bulk_endpoint_is_admin_only(self):
+        customer = self.create_user('customer@example.com')
+        response = self.client.post('/api/products/bulk/', '', content_type='text/csv',
+                                    **self.auth_header(self.create_token(customer)))
+        self.assertEqual(response.status_code, 403)
+
+    def test_import_products_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson', delete=False) as handle:
+            for i in range(5):
+                handle.write(json.dumps({'name': f'Sock {i}', 'category': 'Shoes', 'price': '5'}) + '\n')
+        self.addCleanup(os.remove, handle.name)
+        out = io.StringIO()
+        call_command('import_products', handle.name, '--batch-size', '2', stdout=out)
+        self.assertIn('5 created, 0 updated, 0 rejected.', out.getvalue())
+        self.assertEqual(Product.objects.filter(name__startswith='Sock').count(), 5)
+
+
+class OrderExportTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.admin = self.create_user('admin@example.com', role='admin')
+        self.customer = self.create_user('customer@example.com')
+        self.headers = self.auth_header(self.create_token(self.admin))
+        self.seed(4, self.customer)
+        first = Order.objects.order_by('id').first()
+        Order.objects.filter(pk=first.pk).update(status='COMPLETED', created_at=timezone.now() - timedelta(days=10))
+
+    def export(self, query=''):
+        response = self.client.get(f'/api/orders/export/{query}', **self.headers)
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content)
+
+    def test_ndjson_export_joins_related_rows(self):
+        response, body = self.export()
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in body.decode().splitlines()]
+        self.assertEqual(len(rows), 4)
+        order = Order.objects.select_related('city', 'state', 'product').get(pk=rows[1]['id'])
+        self.assertEqual(rows[1]['user_email'], 'customer@example.com')
+        self.assertEqual(rows[1]['product_name'], order.product.name)
+        self.assertEqual(rows[1]['city_name'], order.city.name)
+        self.assertEqual(rows[1]['state_code'], order.state.abbreviation)
+        self.assertEqual(Decimal(rows[1]['total_cost']), order.total_cost)
+
+    def test_csv_export_with_filters_and_gzip(self):
+        response, body = self.export('?file_format=csv&gzip=true&status=pending')
+        self.assertIn('orders.csv.gz', response['Content-Disposition'])
+        lines = gzip.decompress(body).decode().splitlines()
+        self.assertEqual(lines[0].split(',')[:3], ['id', 'created_at', 'status'])
+        self.assertEqual(len(lines), 4)
+
+        since = (timezone.now() - timedelta(days=1)).date()
+        _, body = self.export(f'?date_from={since}')
+        self.assertEqual(len(body.splitlines()), 3)
+
+    def test_export_runs_one_query_regardless_of_size(self):
+        self.export()  # warm the authentication cache
+        with self.assertNumQueries(1):
+            self.export()
+        self.seed(20, self.customer)
+        with self.assertNumQueries(1):
+            self.export()
+
+    def test_invalid_filters_are_rejected(self):
+        response = self.client.get('/api/orders/export/?status=SHIPPED', **self.headers)
+        self.assertEqual(response.status_code, 400)
+
+    def test_export_is_admin_only(self):
+        response = self.client.get('/api/orders/export/', **self.auth_header(self.create_token(self.customer)))
+        self.assertEqual(response.status_code, 403)
+
+    def test_export_orders_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'orders.csv')
+            call_command('export_orders', '--output', path, '--format', 'csv', '--status', 'COMPLETED')
+            with open(path) as handle:
+                self.assertEqual(len(handle.read().splitlines()), 2)
+
+
+class ReferenceDataTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.admin = self.create_user('admin@example.com', role='admin')
+        self.customer = self.create_user('customer@example.com')
+        self.admin_headers = self.auth_header(self.create_token(self.admin))
+        self.headers = self.auth_header(self.create_token(self.customer))
+        self.state = State.objects.create(abbreviation='CA', name='California')
+        self.city = City.objects.create(name='Oakland', state=self.state)
+        Category.objects.create(name='Shoes', slug='shoes')
+        Brand.objects.create(name='Acme')
+
+    def test_responses_match_the_serializers(self):
+        for url, model, serializer_class in [
+            ('/api/states/', State, serializer.StateSerializer),
+            ('/api/cities/', City, serializer.CitySerializer),
+            ('/api/brands/', Brand, serializer.BrandSerializer),
+            ('/api/categories/', Category, serializer.CategorySerializer),
+        ]:
+            with self.subTest(url=url):
+                expected = serializer_class(model.objects.order_by('pk'), many=True).data
+                response = self.client.get(url, **self.headers)
+                self.assertEqual(response['Content-Type'], 'application/json')
+                self.assertEqual(response.json(), json.loads(json.dumps(expected)))
+
+                obj = model.objects.first()
+                response = self.client.get(f'{url}{obj.pk}/', **self.headers)
+                self.assertEqual(response.json()['id'], obj.pk)
+
+    def test_warm_snapshot_runs_no_queries_and_supports_etags(self):
+        response = self.client.get('/api/cities/', **self.headers)
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/cities/', HTTP_IF_NONE_MATCH=response['ETag'], **self.headers)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.client.get('/api/cities/999/', **self.headers).status_code, 404)
+
+    def test_admin_write_is_visible_to_other_workers(self):
+        self.client.get('/api/states/', **self.headers)
+        response = self.client.post('/api/states/', {'abbreviation': 'NY', 'name': 'New York'}, **self.admin_headers)
+        self.assertEqual(response.status_code, 201)
+        names = [row['name'] for row in self.client.get('/api/states/', **self.headers).json()]
+        self.assertEqual(names, ['California', 'New York'])
+
+        # Another worker bumping the shared version forces a reload here.
+        State.objects.filter(pk=self.state.pk).update(name='Calif.')
+        cache.incr(refdata.VERSION_KEY)
+        names = [row['name'] for row in self.client.get('/api/states/', **self.headers).json()]
+        self.assertEqual(names, ['Calif.', 'New York'])
+
+    def test_city_creation_and_order_resolution_use_the_snapshot(self):
+        response = self.client.post('/api/cities/', {'name': 'Fresno', 'state': 'CA'}, **self.admin_headers)
+        self.assertEqual(response.status_code, 201)
+        response = self.client.post('/api/cities/', {'name': 'Nowhere', 'state': 'ZZ'}, **self.admin_headers)
+        self.assertEqual(response.status_code, 400)
+
+        checkout = serializer.CheckoutSerializer(data={
+            'street_address': '1 Main St', 'city': self.city.pk, 'postal_code': '1', 'phone_number': '2',
+        })
+        refdata.store.snapshot()
+        with self.assertNumQueries(0):
+            self.assertTrue(checkout.is_valid())
+        self.assertEqual(checkout.validated_data['city'].state_id, self.state.pk)
+        self.assertFalse(serializer.CheckoutSerializer(data={'city': 999}).is_valid())
+
+    def test_order_creation_resolves_state_from_the_city(self):
+        product = Product.objects.create(name='Shoe', description='', category=Category.objects.get(),
+                                         price=10, stock_quantity=5)
+        response = self.client.post('/api/orders/', {
+            'product': product.pk, 'quantity': 1, 'street_address': '1 Main St', 'city': self.city.pk,
+            'postal_code': '94607', 'phone_number': '555-0100',
+        }, **self.headers)
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(Order.objects.get().state, self.state)
+
+    def test_names_shared_by_several_rows_resolve_by_primary_key(self):
+        shoes = Category.objects.create(name='Shoes', slug='shoes-2')
+        acme = Brand.objects.get()
+        response = self.client.post('/api/products/', {
+            'name': 'Shoe', 'description': 'Light', 'category': shoes.pk, 'brand': acme.pk, 'price': '10',
+            'stock_quantity': 5,
+        }, **self.admin_headers)
+        self.assertEqual(response.status_code, 201, response.data)
+        product = Product.objects.get(pk=response.data['id'])
+        self.assertEqual((product.category, product.brand), (shoes, acme))
+
+        response = self.client.patch(f'/api/products/{product.pk}/', {'category': shoes.pk, 'brand': acme.pk},
+                                     content_type='application/json', **self.admin_headers)
+        self.assertEqual(response.status_code, 200, response.data)
+
+        twin = Product.objects.create(name='Shoe', slug='shoe-2', description='', category=shoes, price=12,
+                                      stock_quantity=5)
+        response = self.client.post('/api/orders/', {
+            'product': twin.pk, 'quantity': 1, 'street_address': '1 Main St', 'city': self.city.pk,
+            'postal_code': '94607', 'phone_number': '555-0100',
+        }, **self.headers)
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual((Order.objects.get().product, Order.objects.get().unit_price), (twin, Decimal('12')))
+
+
+class BenchmarkTests(APITestCase):
+
+    maxDiff = None
+
+    def seeded_products(self, seed):
+        with transaction.atomic():
+            benchmark.seed(scale=20, seed=seed)
+            rows = list(Product.objects.order_by('slug').values_list('slug', 'price', 'stock_quantity', 'brand__name'))
+            transaction.set_rollback(True)
+        return rows
+
+    def test_seed_is_deterministic(self):
+        self.assertEqual(self.seeded_products(1), self.seeded_products(1))
+        self.assertNotEqual(self.seeded_products(1), self.seeded_products(2))
+
+    def test_run_reports_every_selected_route_for_both_roles(self):
+        tokens = benchmark.seed(scale=20)
+        results = benchmark.run(tokens, iterations=2, warmup=0, only=['product', 'order-list'])
+        self.assertEqual(set(results), {
+            f'{role} {route}' for role in ('admin', 'customer') for route in (
+                'order-list', 'product-list', 'product-search', 'product-detail', 'product-activate-deactivate',
+                'product-bulk', 'async-order-list', 'async-product-list', 'async-product-detail',
+                'sales-breakdown-products')
+        })
+        self.assertEqual(results['customer product-search']['status'], 200)
+        self.assertEqual(results['customer product-activate-deactivate']['status'], 403)
+        self.assertEqual(results['admin order-list']['queries'], 1)
+        for result in results.values():
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+            self.assertGreater(result['peak_memory_kb'], 0)
+
+    def test_every_api_route_is_benchmarked(self):
+        tokens = benchmark.seed(scale=20)
+        names = benchmark.api_url_names()
+        self.assertLessEqual({'cart-batch', 'order-transition', 'sales-breakdown', 'async-login'}, names)
+        benchmarked = {resolve(route.path).url_name for route in benchmark.routes(tokens)}
+        self.assertEqual(names - benchmarked, set())
+
+    def test_writes_succeed_on_every_iteration(self):
+        tokens = benchmark.seed(scale=20)
+        results = benchmark.run(tokens, iterations=2, warmup=1, only=[
+            'cart-batch', 'cart-reserve', 'cart-to-order', 'order-transition', 'product-bulk', 'register',
+            'api-token-auth',
+        ])
+        self.assertEqual({name: result['status'] for name, result in results.items()}, {
+            'admin cart-batch': 403, 'customer cart-batch': 200,
+            'admin cart-reserve': 403, 'customer cart-reserve': 201,
+            'admin cart-to-order': 403, 'customer cart-to-order': 201,
+            'admin order-transition': 200, 'customer order-transition': 403,
+            'admin product-bulk': 200, 'customer product-bulk': 403,
+            'anonymous register': 201, 'anonymous async-register': 201, 'anonymous api-token-auth': 200,
+        })
+
+
+class AsyncReadTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.admin = self.create_user('admin@example.com', role='admin')
+        self.customer = self.create_user('customer@example.com')
+        self.tokens = {'admin': self.create_token(self.admin), 'customer': self.create_token(self.customer)}
+        self.seed(3, self.customer)
+
+    def async_get(self, path, token=None, **headers):
+        if token is not None:
+            headers['Authorization'] = f'Token {token.key}'
+        return async_to_sync(self.async_client.get)(path, headers=headers)
+
+    def test_responses_match_the_sync_views(self):
+        order = Order.objects.first()
+        paths = [
+            '/api/products/', '/api/products/?page_size=2', f'/api/products/{Product.objects.first().pk}/',
+            '/api/orders/', f'/api/orders/{order.pk}/', '/api/states/', f'/api/cities/{City.objects.first().pk}/',
+            '/api/brands/', '/api/categories/', '/api/products/999/',
+            '/api/orders/?fields=id&ordering=-line_total,-id&page_size=3',
+            '/api/orders/?fields=id&ordering=-line_total,-id&page_size=2', f'/api/orders/{order.pk}/?fields=id',
+        ]
+        for role, token in self.tokens.items():
+            for path in paths:
+                with self.subTest(role=role, path=path):
+                    expected = self.client.get(path, **self.auth_header(token))
+                    response = self.async_get(path.replace('/api/', '/api/async/'), token)
+                    self.assertEqual(response.status_code, expected.status_code)
+                    self.assertEqual(response.content.replace(b'/api/async/', b'/api/'), expected.content)
+
+    def test_cursor_pages_follow_on(self):
+        first = self.async_get('/api/async/orders/?page_size=2', self.tokens['customer']).json()
+        second = self.async_get(first['next'], self.tokens['customer']).json()
+        ids = [row['id'] for row in first['results'] + second['results']]
+        self.assertEqual(ids, list(Order.objects.order_by('-created_at', '-id').values_list('id', flat=True)))
+
+    def test_authentication_and_scoping(self):
+        self.assertEqual(self.async_get('/api/async/products/').status_code, 401)
+        response = self.async_get('/api/async/products/', Authorization='Token nope')
+        self.assertEqual((response.status_code, response.json()), (401, {'detail': 'Invalid token.'}))
+
+        other = self.create_user('other@example.com')
+        order = Order.objects.first()
+        self.assertEqual(self.async_get(f'/api/async/orders/{order.pk}/', self.create_token(other)).status_code, 404)
+        Product.objects.filter(pk=order.product_id).update(is_active=False)
+        bump_catalog_generation()
+        response = self.async_get(f'/api/async/products/{order.product_id}/', self.tokens['customer'])
+        self.assertEqual(response.status_code, 404)
+
+    def test_product_responses_are_cached(self):
+        first = self.async_get('/api/async/products/', self.tokens['customer'])
+        with self.assertNumQueries(0):
+            response = self.async_get('/api/async/products/', self.tokens['customer'], **{'If-None-Match': first['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+
+    def test_cache_is_not_used_synchronously_on_the_event_loop(self):
+        def off_the_loop(method):
+            def guarded(cache_backend, *args, **kwargs):
+                try:
+                    asyncio.get_running_loop()
+                except RuntimeError:
+                    return method(cache_backend, *args, **kwargs)
+                raise AssertionError(f'Synchronous cache.{method.__name__}() on the event loop.')
+            return guarded
+
+        names = ('get', 'set', 'add', 'incr', 'delete')
+        backend = type(caches['default'])
+        patches = [mock.patch.object(backend, name, off_the_loop(getattr(backend, name))) for name in names]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        cache.clear()
+        authentication.token_cache.clear()
+        refdata.store.clear()
+        for path in ('/api/async/products/', '/api/async/products/?page_size=1', '/api/async/orders/',
+                     '/api/async/states/'):
+            for _ in range(2):
+                with self.subTest(path=path):
+                    self.assertEqual(self.async_get(path, self.tokens['customer']).status_code, 200)
+
+class PriceSnapshotTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.customer = self.create_user('customer@example.com')
+        self.headers = self.auth_header(self.create_token(self.customer))
+        self.seed(3, self.customer)
+
+    def test_order_keeps_its_price_when_the_product_changes(self):
+        product = Product.objects.first()
+        response = self.client.post('/api/orders/', {
+            'product': product.pk, 'quantity': 4, 'street_address': '1 Main St', 'city': City.objects.first().pk,
+            'postal_code': '1', 'phone_number': '2',
+        }, **self.headers)
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual((response.data['unit_price'], response.data['total_cost']), ('10.00', 40))
+
+        Product.objects.filter(pk=product.pk).update(price=50)
+        response = self.client.get(f"/api/orders/{response.data['id']}/", **self.headers)
+        self.assertEqual(response.data['total_cost'], 40)
+
+    def test_cart_totals_follow_current_prices_in_sql(self):
+        Product.objects.update(price=20, discount_price=None)
+        self.client.get('/api/carts/', **self.headers)  # warm the authentication cache
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/carts/', **self.headers)
+        self.assertEqual({row['total_cost'] for row in response.data}, {20})
+
+
+class SalesRollupTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.admin = self.create_user('admin@example.com', role='admin')
+        self.customer = self.create_user('customer@example.com')
+        self.admin_headers = self.auth_header(self.create_token(self.admin))
+        self.headers = self.auth_header(self.create_token(self.customer))
+        self.seed(3, self.customer)
+        rollups.rebuild()
+        self.city = City.objects.first()
+
+    maxDiff = None
+
+    def rollup_rows(self):
+        return {
+            model.__name__: sorted(
+                model.objects.exclude(orders=0, units=0, revenue=0).values_list(key, 'date', 'orders', 'units', 'revenue'))
+            for model, key in rollups.ROLLUPS
+        }
+
+    def assertMatchesRebuild(self):
+        incremental = self.rollup_rows()
+        rollups.rebuild()
+        self.assertEqual(incremental, self.rollup_rows())
+
+    def test_checkout_and_order_changes_are_rolled_up(self):
+        product = Product.objects.first()
+        Cart.objects.filter(user=self.customer).exclude(product=product).delete()
+        response = self.client.post('/api/cart-to-order/', {
+            'street_address': '1 Main St', 'city': self.city.pk, 'postal_code': '1', 'phone_number': '2',
+        }, **self.headers)
+        self.assertEqual(response.status_code, 201)
+        self.assertMatchesRebuild()
+        today = timezone.localdate()
+        self.assertEqual(DailyProductSales.objects.get(product=product, date=today).orders, 2)
+
+        order = Order.objects.get(pk=response.data[0]['id'])
+        response = self.client.put(f'/api/orders/{order.pk}/', {
+            'product': Product.objects.last().pk, 'quantity': 5, 'street_address': '2 Main St',
+            'city': self.city.pk, 'postal_code': '1', 'phone_number': '2',
+        }, content_type='application/json', **self.headers)
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertMatchesRebuild()
+
+        order.refresh_from_db()
+        order.status = 'CANCELLED'
+        order.save()
+        self.assertMatchesRebuild()
+        order.status = 'PENDING'
+        order.save()
+        self.assertMatchesRebuild()
+
+        order.delete()
+        self.assertMatchesRebuild()
+        Product.objects.first().delete()
+        self.assertMatchesRebuild()
+
+    def test_recategorised_products_keep_their_past_sales(self):
+        order = Order.objects.select_related('product').first()
+        old_category = order.product.category
+        new_category = Category.objects.exclude(pk=old_category.pk).first()
+        today = timezone.localdate()
+        old_orders = DailyCategorySales.objects.get(category=old_category, date=today).orders
+        Product.objects.filter(pk=order.product_id).update(category=new_category)
+
+        response = self.client.post('/api/orders/transition/', {'ids': [order.pk], 'status': 'CANCELLED'},
+                                    content_type='application/json', **self.admin_headers)
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(DailyCategorySales.objects.get(category=old_category, date=today).orders, old_orders - 1)
+        self.assertMatchesRebuild()
+
+        order.refresh_from_db()
+        order.status = 'PENDING'
+        order.save()
+        self.assertEqual(DailyCategorySales.objects.get(category=old_category, date=today).orders, old_orders)
+        order.delete()
+        self.assertEqual(DailyCategorySales.objects.get(category=old_category, date=today).orders, old_orders - 1)
+        self.assertMatchesRebuild()
+
+    def test_rebuild_command(self):
+        DailyStateSales.objects.all().delete()
+        out = io.StringIO()
+        call_command('rebuild_rollups', stdout=out)
+        self.assertIn('DailyStateSales: 3 rows', out.getvalue())
+        self.assertEqual(DailyStateSales.objects.aggregate(total=Sum('revenue'))['total'],
+                         Order.objects.aggregate(total=Sum('line_total'))['total'])
+
+    def test_analytics_endpoints_read_only_the_rollups(self):
+        self.assertEqual(self.client.get('/api/analytics/sales/', **self.headers).status_code, 403)
+        self.client.get('/api/analytics/sales/', **self.admin_headers)  # warm the authentication cache
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/analytics/sales/', **self.admin_headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['totals'], {'orders': 3, 'units': 6, 'revenue': '56.00'})
+        self.assertEqual(response.data['days'][0]['date'], str(timezone.localdate()))
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/analytics/sales/products/?limit=2', **self.admin_headers)
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertEqual(response.data['results'][0]['revenue'], '20.00')
+        self.assertEqual(response.data['results'][0]['name'], 'Product 0')
+
+        response = self.client.get('/api/analytics/sales/states/', **self.admin_headers)
+        self.assertEqual({row['name'] for row in response.data['results']}, {'AA', 'AB', 'AC'})
+        self.assertEqual(self.client.get('/api/analytics/sales/brands/', **self.admin_headers).status_code, 404)
+        response = self.client.get('/api/analytics/sales/?date_from=2024-02-01&date_to=2024-01-01', **self.admin_headers)
+        self.assertEqual(response.status_code, 400)
+
+
+class CartSummaryTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.customer = self.create_user('customer@example.com')
+        self.headers = self.auth_header(self.create_token(self.customer))
+
+    def test_empty_cart(self):
+        response = self.client.get('/api/carts/summary/', **self.headers)
+        self.assertEqual(response.data, {
+            'item_count': 0, 'subtotal': '0.00', 'savings': '0.00', 'total': '0.00', 'warnings': []})
+
+    def test_totals_and_warnings_come_from_one_query(self):
+        self.seed(4, self.customer)
+        products = list(Product.objects.order_by('pk'))
+        Product.objects.filter(pk=products[2].pk).update(is_active=False)
+        Product.objects.filter(pk=products[3].pk).update(stock_quantity=0)
+        Cart.objects.filter(product=products[1]).update(quantity=3)
+        self.client.get('/api/carts/summary/', **self.headers)  # warm the authentication cache
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/carts/summary/', **self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['item_count'], 6)
+        self.assertEqual(response.data['subtotal'], '60.00')
+        self.assertEqual(response.data['savings'], '8.00')
+        self.assertEqual(response.data['total'], '52.00')
+        self.assertEqual(
+            [(warning['product'], warning['code']) for warning in response.data['warnings']],
+            [(products[2].pk, 'inactive'), (products[3].pk, 'insufficient_stock')],
+        )
+        self.assertEqual(
+            Decimal(response.data['total']),
+            sum(Decimal(line['total_cost']) for line in self.client.get('/api/carts/', **self.headers).data),
+        )
+
+
+class InventoryTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.customer = self.create_user('customer@example.com')
+        self.headers = self.auth_header(self.create_token(self.customer))
+        state = State.objects.create(abbreviation='CA', name='California')
+        self.city = City.objects.create(name='Oakland', state=state)
+        category = Category.objects.create(name='Shoes', slug='shoes')
+        self.shoe, self.boot = Product.objects.bulk_create(
+            Product(name=name, slug=name, description='', category=category, price=10, stock_quantity=5)
+            for name in ('shoe', 'boot')
+        )
+
+    def stock(self, product):
+        return Product.objects.values_list('stock_quantity', flat=True).get(pk=product.pk)
+
+    def test_take_is_all_or_nothing(self):
+        with self.assertRaises(inventory.InsufficientStock) as raised:
+            inventory.take({self.shoe.pk: 2, self.boot.pk: 6})
+        self.assertEqual(raised.exception.available, {self.boot.pk: 5})
+        self.assertEqual((self.stock(self.shoe), self.stock(self.boot)), (5, 5))
+
+        inventory.take({self.shoe.pk: 2, self.boot.pk: 5})
+        inventory.restock({self.boot.pk: 1})
+        self.assertEqual((self.stock(self.shoe), self.stock(self.boot)), (3, 1))
+
+    def test_reservations_expire_back_into_stock(self):
+        other = self.create_user('other@example.com')
+        inventory.reserve(other, {self.shoe.pk: 4}, ttl=timedelta(seconds=-1))
+        inventory.reserve(other, {self.boot.pk: 1})
+        self.assertEqual(self.stock(self.shoe), 1)
+
+        # A buyer who needs the lapsed stock gets it back on the spot.
+        inventory.take({self.shoe.pk: 3})
+        self.assertEqual(self.stock(self.shoe), 2)
+        self.assertEqual(inventory.commit(other), {self.boot.pk: 1})
+
+        inventory.reserve(other, {self.boot.pk: 2}, ttl=timedelta(seconds=-1))
+        out = io.StringIO()
+        call_command('release_reservations', stdout=out)
+        self.assertIn('1 expired reservations released.', out.getvalue())
+        self.assertEqual(self.stock(self.boot), 4)
+        self.assertEqual(inventory.release_expired(), 0)
+
+    def test_release_does_not_count_twice(self):
+        inventory.reserve(self.customer, {self.shoe.pk: 3})
+        reservations = StockReservation.objects.filter(user=self.customer)
+        pending = reservations.all()
+        self.assertEqual(inventory.release(self.customer), 1)
+        self.assertEqual(inventory._release(pending), 0)
+        self.assertEqual(self.stock(self.shoe), 5)
+
+    def test_checkout_commits_the_reserved_stock(self):
+        Cart.objects.create(user=self.customer, product=self.shoe, quantity=2)
+        Cart.objects.create(user=self.customer, product=self.boot, quantity=1)
+        response = self.client.post('/api/carts/reserve/', **self.headers)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(sorted((row['product'], row['quantity']) for row in response.data),
+                         [(self.shoe.pk, 2), (self.boot.pk, 1)])
+        # Reserving again replaces the earlier hold.
+        self.client.post('/api/carts/reserve/', **self.headers)
+        self.assertEqual((self.stock(self.shoe), self.stock(self.boot)), (3, 4))
+
+        Cart.objects.filter(product=self.shoe).update(quantity=3)
+        Cart.objects.filter(product=self.boot).delete()
+        response = self.client.post('/api/cart-to-order/', {
+            'street_address': '1 Main St', 'city': self.city.pk, 'postal_code': '1', 'phone_number': '2',
+        }, **self.headers)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((self.stock(self.shoe), self.stock(self.boot)), (2, 5))
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_reserve_rejects_short_carts(self):
+        Cart.objects.create(user=self.customer, product=self.shoe, quantity=6)
+        response = self.client.post('/api/carts/reserve/', **self.headers)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, ["Insufficient stock for product 'shoe'. Available stock: 5."])
+        self.assertEqual(self.stock(self.shoe), 5)
+
+    def test_orders_take_and_return_stock(self):
+        order = {'product': self.shoe.pk, 'quantity': 2, 'street_address': '1 Main St',
+                 'city': self.city.pk, 'postal_code': '1', 'phone_number': '2'}
+        response = self.client.post('/api/orders/', order, content_type='application/json', **self.headers)
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(self.stock(self.shoe), 3)
+
+        url = f"/api/orders/{response.data['id']}/"
+        response = self.client.put(url, {**order, 'quantity': 6}, content_type='application/json', **self.headers)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.stock(self.shoe), 3)
+        self.client.put(url, {**order, 'product': self.boot.pk, 'quantity': 4},
+                        content_type='application/json', **self.headers)
+        self.assertEqual((self.stock(self.shoe), self.stock(self.boot)), (5, 1))
+
+        self.assertEqual(self.client.delete(url, **self.headers).status_code, 204)
+        self.assertEqual(self.stock(self.boot), 5)
+
+    def test_only_selling_out_or_restocking_invalidates_the_catalog(self):
+        generation = catalog_generation()
+        inventory.take({self.shoe.pk: 2})
+        inventory.restock({self.shoe.pk: 1})
+        inventory.reserve(self.customer, {self.shoe.pk: 1})
+        inventory.release(self.customer)
+        self.assertEqual(catalog_generation(), generation)
+
+        inventory.take({self.shoe.pk: 4})
+        self.assertGreater(catalog_generation(), generation)
+        generation = catalog_generation()
+        inventory.restock({self.shoe.pk: 1})
+        self.assertGreater(catalog_generation(), generation)
+        generation = catalog_generation()
+        inventory.reserve(self.customer, {self.shoe.pk: 1})
+        self.assertGreater(catalog_generation(), generation)
+        generation = catalog_generation()
+        inventory.release(self.customer)
+        self.assertGreater(catalog_generation(), generation)
+
+
+class ReservationStressTests(TransactionTestCase):
+
+    def test_hot_product_is_never_oversold(self):
+        cache.clear()
+        result = benchmark.reservation_stress(threads=8, stock=100)
+        self.assertEqual(result['oversold'], 0)
+        self.assertEqual(result['reserved'], 100)
+        self.assertEqual(result['reservation_rows'], 100)
+        self.assertEqual(result['remaining_stock'], 0)
+
+
+class PermissionPolicyTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.admin = self.create_user('admin@example.com', role='admin')
+        self.customer = self.create_user('customer@example.com')
+        self.other = self.create_user('other@example.com')
+        self.admin_headers = self.auth_header(self.create_token(self.admin))
+        self.headers = self.auth_header(self.create_token(self.customer))
+        self.other_headers = self.auth_header(self.create_token(self.other))
+        self.seed(1, self.customer)
+        self.order = Order.objects.get()
+        self.cart = Cart.objects.get()
+
+    def test_policy_matrix(self):
+        cases = [
+            (None, 'get', '/api/products/', 401),
+            (self.headers, 'get', '/api/brands/', 200),
+            (self.headers, 'post', '/api/brands/', 403),
+            (self.admin_headers, 'post', '/api/brands/', 400),
+            (self.admin_headers, 'get', '/api/carts/', 403),
+            (self.headers, 'get', '/api/orders/export/', 403),
+            (self.headers, 'get', '/api/analytics/sales/', 403),
+            (self.admin_headers, 'get', f'/api/orders/{self.order.pk}/', 200),
+            (self.headers, 'get', f'/api/orders/{self.order.pk}/', 200),
+            (self.other_headers, 'get', f'/api/orders/{self.order.pk}/', 404),
+            (self.other_headers, 'delete', f'/api/carts/{self.cart.pk}/', 404),
+            (self.admin_headers, 'post', '/api/cart-to-order/', 403),
+        ]
+        for headers, method, path, expected in cases:
+            with self.subTest(method=method, path=path):
+                response = getattr(self.client, method)(path, **(headers or {}))
+                self.assertEqual(response.status_code, expected)
+        self.assertEqual(self.client.get('/api/orders/', **self.other_headers).data['results'], [])
+
+    def test_permissions_are_shared_and_owner_checks_do_not_query(self):
+        view = views.OrderViewSet()
+        self.assertIs(view.get_permissions()[0], permissions.POLICIES['order'])
+        request = RequestFactory().get('/')
+        request.user = self.customer
+        order = Order.objects.get()
+        with self.assertNumQueries(0):
+            self.assertTrue(permissions.POLICIES['order'].has_object_permission(request, view, order))
+
+    def test_detail_routes_run_one_query(self):
+        self.client.get('/api/orders/', **self.headers)  # warm the authentication cache
+        for path in (f'/api/orders/{self.order.pk}/', f'/api/carts/{self.cart.pk}/'):
+            with self.subTest(path=path), self.assertNumQueries(1):
+                self.assertEqual(self.client.get(path, **self.headers).status_code, 200)
+
+
+class CartBatchTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.customer = self.create_user('customer@example.com')
+        self.headers = self.auth_header(self.create_token(self.customer))
+        category = Category.objects.create(name='Shoes', slug='shoes')
+        self.products = Product.objects.bulk_create(
+            Product(name=f'Shoe {i}', slug=f'shoe-{i}', description='', category=category, price=10, stock_quantity=5)
+            for i in range(25)
+        )
+
+    def batch(self, *operations):
+        return self.client.post('/api/carts/batch/', {'operations': list(operations)},
+                                content_type='application/json', **self.headers)
+
+    def cart(self):
+        return dict(Cart.objects.filter(user=self.customer).values_list('product_id', 'quantity'))
+
+    def test_operations_apply_in_order(self):
+        first, second, third = self.products[:3]
+        Cart.objects.create(user=self.customer, product=first, quantity=1)
+        Cart.objects.create(user=self.customer, product=third, quantity=1)
+        response = self.batch(
+            {'op': 'add', 'product': first.pk, 'quantity': 2},
+            {'op': 'set', 'product': second.pk, 'quantity': 4},
+            {'op': 'add', 'product': second.pk, 'quantity': 1},
+            {'op': 'remove', 'product': third.pk},
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(self.cart(), {first.pk: 3, second.pk: 5})
+        self.assertEqual(sorted((line['product'], line['quantity']) for line in response.data),
+                         [(first.pk, 3), (second.pk, 5)])
+
+    def test_twenty_line_edit_is_a_handful_of_queries(self):
+        Cart.objects.bulk_create(Cart(user=self.customer, product=p, quantity=1) for p in self.products[:10])
+        operations = [{'op': 'remove', 'product': p.pk} for p in self.products[:5]]
+        operations += [{'op': 'set', 'product': p.pk, 'quantity': 2} for p in self.products[5:20]]
+        self.batch({'op': 'remove', 'product': self.products[24].pk})  # warm the authentication cache
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.batch(*operations)
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(len(queries), 6)
+        self.assertEqual(self.cart(), {p.pk: 2 for p in self.products[5:20]})
+
+    def test_invalid_operations_change_nothing(self):
+        Product.objects.filter(pk=self.products[1].pk).update(is_active=False)
+        Cart.objects.create(user=self.customer, product=self.products[2], quantity=1)
+        response = self.batch(
+            {'op': 'remove', 'product': self.products[2].pk},
+            {'op': 'add', 'product': self.products[0].pk, 'quantity': 6},
+            {'op': 'set', 'product': self.products[1].pk, 'quantity': 1},
+            {'op': 'add', 'product': 0, 'quantity': 1},
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(sorted(response.data['operations']), [1, 2, 3])
+        self.assertEqual(self.cart(), {self.products[2].pk: 1})
+        self.assertEqual(self.batch({'op': 'set', 'product': self.products[0].pk}).status_code, 400)
+
+    def test_adding_a_product_twice_bumps_the_line(self):
+        for quantity in (1, 2):
+            response = self.client.post('/api/carts/', {'product': self.products[0].pk, 'quantity': quantity},
+                                        content_type='application/json', **self.headers)
+            self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.cart(), {self.products[0].pk: 3})
+        response = self.client.post('/api/carts/', {'product': self.products[0].pk, 'quantity': 3},
+                                    content_type='application/json', **self.headers)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.cart(), {self.products[0].pk: 3})
+
+
+    def test_add_builds_on_the_line_as_written(self):
+        line = Cart.objects.create(user=self.customer, product=self.products[0], quantity=1)
+        atomic = transaction.atomic
+
+        def run_with_concurrent_add(quantity):
+            calls = []
+
+            def concurrent_add(*args, **kwargs):
+                # Another request adds to the line after this batch has read it.
+                if not calls:
+                    calls.append(Cart.objects.filter(pk=line.pk).update(quantity=F('quantity') + quantity))
+                return atomic(*args, **kwargs)
+
+            with mock.patch.object(transaction, 'atomic', side_effect=concurrent_add):
+                return self.batch({'op': 'add', 'product': self.products[0].pk, 'quantity': 2})
+
+        self.assertEqual(run_with_concurrent_add(2).status_code, 200)
+        self.assertEqual(self.cart(), {self.products[0].pk: 5})
+        Cart.objects.filter(pk=line.pk).update(quantity=1)
+        response = run_with_concurrent_add(3)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(list(response.data['operations']), [0])
+        self.assertEqual(self.cart(), {self.products[0].pk: 4})
+
+
+class OrderTransitionTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.admin = self.create_user('admin@example.com', role='admin')
+        self.customer = self.create_user('customer@example.com')
+        self.admin_headers = self.auth_header(self.create_token(self.admin))
+        self.headers = self.auth_header(self.create_token(self.customer))
+        self.seed(4, self.customer)
+        rollups.rebuild()
+        self.orders = list(Order.objects.order_by('pk'))
+
+    def transition(self, headers=None, **body):
+        return self.client.post('/api/orders/transition/', body, content_type='application/json',
+                                **(headers or self.admin_headers))
+
+    def test_ids_follow_the_transition_table(self):
+        first, second, third, fourth = (order.pk for order in self.orders)
+        Order.objects.filter(pk=fourth).update(status='COMPLETED')
+        response = self.transition(status='PROCESSING', ids=[first, second, fourth, 0])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {
+            'status': 'PROCESSING', 'transitioned': [first, second], 'skipped': {fourth: 'COMPLETED'}, 'not_found': [0]})
+
+        response = self.transition(status='COMPLETED', ids=[first, third])
+        self.assertEqual((response.data['transitioned'], response.data['skipped']), ([first], {third: 'PENDING'}))
+        self.assertEqual(dict(Order.objects.values_list('pk', 'status')),
+                         {first: 'COMPLETED', second: 'PROCESSING', third: 'PENDING', fourth: 'COMPLETED'})
+
+    def test_cancelling_returns_stock_and_updates_rollups(self):
+        Order.objects.filter(pk=self.orders[0].pk).update(status='PROCESSING')
+        Order.objects.filter(pk=self.orders[3].pk).update(status='COMPLETED')
+        response = self.transition(status='CANCELLED', from_status=['PENDING', 'PROCESSING'])
+        self.assertEqual(response.data['transitioned'], [order.pk for order in self.orders[:3]])
+        self.assertNotIn('not_found', response.data)
+        self.assertEqual(list(Product.objects.order_by('pk').values_list('stock_quantity', flat=True)),
+                         [102, 102, 102, 100])
+
+        incremental = list(DailyProductSales.objects.filter(orders__gt=0).values_list('product', 'orders', 'revenue'))
+        rollups.rebuild()
+        self.assertEqual(incremental, list(DailyProductSales.objects.values_list('product', 'orders', 'revenue')))
+        self.assertEqual(len(incremental), 1)
+
+    def test_statements_are_batched(self):
+        self.seed(26, self.customer)
+        self.client.get('/api/orders/', **self.admin_headers)  # warm the authentication cache
+        with mock.patch.object(order_transitions, 'BATCH_SIZE', 10), \
+                CaptureQueriesContext(connection) as queries:
+            response = self.transition(status='PROCESSING', date_from=str(timezone.localdate()))
+        self.assertEqual(len(response.data['transitioned']), 30)
+        updates = [query['sql'] for query in queries if query['sql'].startswith('UPDATE "api_order"')]
+        self.assertEqual(len(updates), 3)
+        self.assertFalse(Order.objects.exclude(status='PROCESSING').exists())
+
+    def test_requests_are_validated(self):
+        self.assertEqual(self.transition(self.headers, status='PROCESSING', ids=[1]).status_code, 403)
+        self.assertEqual(self.transition(status='PROCESSING').status_code, 400)
+        self.assertEqual(self.transition(status='PENDING', ids=[1]).status_code, 400)
+        self.assertEqual(self.transition(status='PROCESSING', from_status=['LOST']).status_code, 400)
+
+
+class MetricsTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        metrics.registry.clear()
+        self.customer = self.create_user('customer@example.com')
+        self.headers = self.auth_header(self.create_token(self.customer))
+        self.seed(3, self.customer)
+
+    def server_timing(self, response):
+        timing = {}
+        for entry in response['Server-Timing'].split(', '):
+            name, *params = entry.split(';')
+            timing[name] = dict(param.split('=', 1) for param in params)
+        return timing
+
+    def test_server_timing_header(self):
+        self.client.get('/api/orders/', **self.headers)
+        reset_queries()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/orders/', **self.headers)
+        self.assertEqual(response.status_code, 200)
+        timing = self.server_timing(response)
+        self.assertEqual(list(timing), ['total', 'auth', 'db', 'serialize', 'render'])
+        self.assertEqual(timing['db']['desc'], f'"{len(queries)} queries"')
+        for name in ('auth', 'db', 'serialize', 'render'):
+            self.assertGreater(float(timing[name]['dur']), 0, name)
+            self.assertLessEqual(float(timing[name]['dur']), float(timing['total']['dur']), name)
+
+    def test_async_views_are_timed(self):
+        CustomUser.objects.filter(pk=self.customer.pk).update(password=make_password('secret'))
+        response = self.client.post('/api/async/login/', {'email': 'customer@example.com', 'password': 'secret'})
+        self.assertEqual(response.status_code, 200)
+        timing = self.server_timing(response)
+        self.assertNotEqual(timing['db']['desc'], '"0 queries"')
+        self.assertIn(('async-login', 'POST', '2xx'), metrics.registry.snapshot())
+
+    def test_metrics_endpoint(self):
+        for _ in range(3):
+            self.client.get('/api/products/', **self.headers)
+        self.client.get('/api/products/', HTTP_AUTHORIZATION='Token nope')
+        self.client.get('/no/such/page/')
+
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE)
+        lines = response.content.decode().splitlines()
+        labels = 'route="product-list",method="GET",status="2xx"'
+        self.assertIn(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} 3', lines)
+        self.assertIn(f'http_request_duration_seconds_count{{{labels}}} 3', lines)
+        self.assertTrue(any(line.startswith(f'http_request_phase_seconds_total{{{labels},phase="db"}} ')
+                            for line in lines))
+        self.assertIn('route="product-list",method="GET",status="4xx"', response.content.decode())
+        self.assertIn('route="<unmatched>",method="GET",status="4xx"', response.content.decode())
+
+    def test_metrics_endpoint_is_restricted(self):
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.1.2.3').status_code, 403)
+        with override_settings(METRICS_ALLOWED_IPS=['10.0.0.0/8']):
+            self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.1.2.3').status_code, 200)
+            self.assertEqual(self.client.get('/metrics').status_code, 403)
+
+    def test_histogram_buckets(self):
+        registry = metrics.Registry(buckets=(0.1, 0.01))
+        timer = metrics.RequestTimer()
+        timer.durations['db'] = 0.002
+        timer.queries = 2
+        for total in (0.005, 0.01, 0.05, 3):
+            registry.observe('route', 'GET', '2xx', total, timer)
+        lines = registry.export().splitlines()
+        labels = 'route="route",method="GET",status="2xx"'
+        self.assertEqual([line for line in lines if line.startswith('http_request_duration_seconds_bucket')], [
+            f'http_request_duration_seconds_bucket{{{labels},le="0.01"}} 2',
+            f'http_request_duration_seconds_bucket{{{labels},le="0.1"}} 3',
+            f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} 4',
+        ])
+        self.assertIn(f'http_request_duration_seconds_sum{{{labels}}} 3.065', lines)
+        self.assertIn(f'http_request_phase_seconds_total{{{labels},phase="db"}} 0.008', lines)
+        self.assertIn(f'http_request_db_queries_total{{{labels}}} 8', lines)
+
+    def test_nested_phases_are_counted_once(self):
+        timer = metrics.RequestTimer()
+        token = metrics._current.set(timer)
+        try:
+            with metrics.phase('serialize'):
+                with metrics.phase('serialize'):
+                    time.sleep(0.01)
+                time.sleep(0.01)
+        finally:
+            metrics._current.reset(token)
+        self.assertGreaterEqual(timer.durations['serialize'], 0.02)
+        self.assertLess(timer.durations['serialize'], 0.03)
+
+    def test_no_timing_outside_requests(self):
+        with metrics.phase('auth'):
+            list(Product.objects.all())
+        self.assertIsNone(metrics.current())
+
+
+class QueryDetectorTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.customer = self.create_user('customer@example.com')
+        self.headers = self.auth_header(self.create_token(self.customer))
+        self.seed(12, self.customer)
+
+    def test_fingerprint(self):
+        self.assertEqual(
+            query_detector.fingerprint(
+                'SELECT "a"."id" FROM "api_cart2"  WHERE ("a"."id" IN (%s, %s, %s) AND "a"."name" = \'x\'\'y\') LIMIT 21'),
+            'SELECT "a"."id" FROM "api_cart2" WHERE ("a"."id" IN (...) AND "a"."name" = ?) LIMIT ?',
+        )
+
+    def test_repeated_queries_name_the_serializer_field(self):
+        with query_detector.watch(repeat_limit=10) as watch:
+            serializer.CartSerializer(Cart.objects.filter(user=self.customer), many=True).data
+        [finding] = watch.findings
+        self.assertEqual(finding.kind, 'repeated')
+        self.assertEqual(finding.count, 12)
+        self.assertEqual(finding.source, 'CartSerializer.pr_name')
+        self.assertIn('FROM "api_product"', finding.sql)
+        self.assertIn('test_repeated_queries_name_the_serializer_field', finding.stack)
+        with self.assertRaisesMessage(query_detector.ExcessiveQueries, 'Query ran 12 times while serializing'):
+            watch.check()
+
+    def test_select_related_passes(self):
+        with query_detector.watch(repeat_limit=10) as watch:
+            serializer.CartSerializer(
+                Cart.objects.filter(user=self.customer).select_related('product'), many=True).data
+        self.assertEqual(watch.findings, [])
+        watch.check()
+
+    def test_slow_queries(self):
+        with query_detector.watch(slow_ms=0) as watch:
+            list(Product.objects.all())
+        [finding] = watch.findings
+        self.assertEqual(finding.kind, 'slow')
+        self.assertIsNone(finding.source)
+        self.assertIn('Query took', str(finding))
+
+    def n_plus_one_cart(self):
+        return mock.patch.object(views.CartViewSet, 'get_queryset',
+                                 lambda view: Cart.objects.filter(user=view.request.user))
+
+    @override_settings(QUERY_DETECTOR_ENABLED=True, QUERY_DETECTOR_RAISE=True)
+    def test_requests_fail_in_tests(self):
+        self.assertEqual(self.client.get('/api/carts/', **self.headers).status_code, 200)
+        with self.n_plus_one_cart(), self.assertRaisesMessage(
+                query_detector.ExcessiveQueries, 'in GET /api/carts/ (cart-list)'):
+            self.client.get('/api/carts/', **self.headers)
+
+    @override_settings(QUERY_DETECTOR_ENABLED=True, QUERY_DETECTOR_RAISE=False)
+    def test_requests_are_logged_in_development(self):
+        with self.n_plus_one_cart(), self.assertLogs('api.query_detector', 'WARNING') as logs:
+            response = self.client.get('/api/carts/', **self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('while serializing CartSerializer.pr_name', logs.output[0])
+
+    @override_settings(QUERY_DETECTOR_ENABLED=True, QUERY_DETECTOR_RAISE=True, QUERY_DETECTOR_SLOW_MS=0)
+    def test_slow_queries_only_log_in_tests(self):
+        with self.assertLogs('api.query_detector', 'WARNING') as logs:
+            response = self.client.get('/api/carts/', **self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Query took', logs.output[0])
+        with override_settings(QUERY_DETECTOR_RAISE_ON=('repeated', 'slow')), self.assertRaisesMessage(
+                query_detector.ExcessiveQueries, 'Query took'):
+            self.client.get('/api/carts/', **self.headers)
+
+
+class SparseFieldsetTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.customer = self.create_user('customer@example.com')
+        self.headers = self.auth_header(self.create_token(self.customer))
+        self.seed(3, self.customer)
+        # Authenticate once so the token is cached and not part of the counts.
+        self.client.get('/api/states/', **self.headers)
+
+    def get(self, path, **params):
+        reset_queries()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path, params, **self.headers)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(len(queries), 1, [query['sql'] for query in queries])
+        return response.json(), queries[0]['sql']
+
+    def test_product_fields_are_pushed_down(self):
+        body, sql = self.get('/api/products/', fields='id,name,price')
+        product = Product.objects.order_by('created_at', 'id').first()
+        self.assertEqual(body['results'][0], {'id': product.pk, 'name': product.name, 'price': '10.00'})
+        self.assertNotIn('description', sql)
+        self.assertNotIn('JOIN', sql)
+
+        body, sql = self.get('/api/products/', fields='id,category_name')
+        self.assertEqual(body['results'][0], {'id': product.pk, 'category_name': product.category.name})
+        self.assertIn('JOIN "api_category"', sql)
+        self.assertNotIn('"api_brand"', sql)
+
+    def test_product_expand(self):
+        body, sql = self.get('/api/products/', fields='id,category,brand', expand='category')
+        product = Product.objects.select_related('category').order_by('created_at', 'id').first()
+        row = body['results'][0]
+        self.assertEqual(row['brand'], product.brand_id)
+        self.assertEqual(row['category']['id'], product.category_id)
+        self.assertEqual(row['category']['slug'], product.category.slug)
+        self.assertNotIn('"api_brand"', sql)
+
+    def test_cart_and_order_fields(self):
+        body, sql = self.get('/api/carts/', fields='id,product,total_cost', expand='product')
+        cart = Cart.objects.select_related('product').order_by('pk').first()
+        self.assertEqual(body[0], {
+            'id': cart.pk, 'total_cost': 8.0 if cart.product.discount_price else 10.0,
+            'product': {'id': cart.product_id, 'name': cart.product.name, 'price': '10.00',
+                        'discount_price': cart.product.discount_price and '8.00', 'is_active': True},
+        })
+        self.assertNotIn('"description"', sql)
+
+        full = self.client.get('/api/orders/', **self.headers).json()['results']
+        body, sql = self.get('/api/orders/', fields='id,state,total_cost', ordering='-line_total')
+        by_id = {order['id']: order for order in full}
+        for order in body['results']:
+            self.assertEqual(order, {key: by_id[order['id']][key] for key in ('id', 'state', 'total_cost')})
+        self.assertNotIn('street_address', sql)
+
+    def test_retrieve_checks_the_owner_without_extra_queries(self):
+        order = Order.objects.first()
+        body, _ = self.get(f'/api/orders/{order.pk}/', fields='id,status', expand='city')
+        self.assertEqual(body, {'id': order.pk, 'status': 'PENDING'})
+        body, _ = self.get(f'/api/orders/{order.pk}/', fields='id,city', expand='city')
+        self.assertEqual(body, {'id': order.pk, 'city': {'id': order.city_id, 'name': order.city.name}})
+
+    def test_async_views(self):
+        body, sql = self.get('/api/async/orders/', fields='id,status')
+        self.assertEqual({tuple(order) for order in body['results']}, {('id', 'status')})
+        self.assertNotIn('JOIN', sql)
+
+    def test_unknown_fields(self):
+        response = self.client.get('/api/products/', {'fields': 'id,nope', 'expand': 'description'}, **self.headers)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'fields': 'Unknown field(s): nope.', 'expand': 'Cannot expand: description.'})
+
+    def test_writes_ignore_the_parameters(self):
+        product = Product.objects.create(
+            name='Extra', slug='extra', description='', category=Category.objects.first(), price=5, stock_quantity=5)
+        response = self.client.post('/api/carts/?fields=id&expand=product', {'product': product.pk, 'quantity': 1},
+                                    content_type='application/json', **self.headers)
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.json()['product'], product.pk)
+        self.assertIn('pr_name', response.json())
+
+    def test_equivalent_selections_share_cache_entries(self):
+        fastpath._compiled.clear()
+        for fields, expand in (('id,status,city', 'city'), ('status, id,city,status', 'city,city')):
+            self.get('/api/orders/', fields=fields, expand=expand)
+        self.assertEqual(len(fastpath._compiled), 1)
+
+        first, _ = self.get('/api/products/', fields='id,category,brand', expand='category,brand')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/products/', {'fields': 'brand,category,id', 'expand': 'brand,category,brand'},
+                                       **self.headers)
+        self.assertEqual(response.json(), first)
+
+    def test_compiled_serializers_are_bounded(self):
+        with mock.patch.object(fastpath, '_compiled', LRUCache(maxsize=2)):
+            for fields in ('id', 'id,status', 'id,quantity'):
+                self.get('/api/orders/', fields=fields)
+            self.assertEqual(len(fastpath._compiled), 2)
+
+
+class FastListTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.admin = self.create_user('admin@example.com', role='admin')
+        self.customer = self.create_user('customer@example.com')
+        self.tokens = {'admin': self.create_token(self.admin), 'customer': self.create_token(self.customer)}
+        self.seed(5, self.customer)
+        category = Category.objects.first()
+        Product.objects.create(
+            name='Zoë “quoted” \\ back\x1fslash', slug='zoe', description='line separator  ✓',
+            category=category, brand=None, price=Decimal('12345678.90'), discount_price=Decimal('0.01'),
+            stock_quantity=3,
+        )
+        Order.objects.filter(pk=Order.objects.first().pk).update(
+            line_total=Decimal('123456789.12'), unit_price=Decimal('61728394.56'))
+
+    def fetch(self, path, role, fast=True):
+        cache.clear()
+        viewset = views.ProductViewSet if path.startswith('/api/products/') else views.OrderViewSet
+        with mock.patch.object(viewset, 'fast_list', fast), \
+                mock.patch.object(viewset, 'renderer_classes', [ORJSONRenderer] if fast else [JSONRenderer]):
+            response = self.client.get(path, **self.auth_header(self.tokens[role]))
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.content
+
+    def test_output_is_byte_for_byte_identical(self):
+        paths = [
+            '/api/products/', '/api/products/?page_size=2', '/api/products/?fields=id,brand_name,price',
+            '/api/orders/', '/api/orders/?ordering=-line_total', '/api/orders/?fields=state,total_cost,created_at',
+        ]
+        for role in ('admin', 'customer'):
+            for path in paths + (['/api/products/?offset=1&limit=3', '/api/orders/?offset=0'] if role == 'admin' else []):
+                with self.subTest(role=role, path=path):
+                    fast = self.fetch(path, role)
+                    self.assertEqual(fast, self.fetch(path, role, fast=False))
+                    self.assertGreater(len(json.loads(fast)['results']), 0)
+
+    def test_fast_path_skips_model_serializers(self):
+        with mock.patch.object(serializer.ProductSerializer, 'to_representation', autospec=True,
+                               side_effect=serializer.ProductSerializer.to_representation) as to_representation:
+            self.fetch('/api/products/', 'admin')
+            self.fetch('/api/products/?expand=category', 'admin')
+        # Only the expanded listing, which the fast path cannot serve, went through the serializer.
+        self.assertEqual(to_representation.call_count, 6)
+
+    def test_cursor_pages_follow_on(self):
+        first = json.loads(self.fetch('/api/products/?page_size=4', 'customer'))
+        second = json.loads(self.fetch(first['next'].split('testserver')[1], 'customer'))
+        ids = [row['id'] for row in first['results'] + second['results']]
+        self.assertEqual(ids, list(Product.objects.filter(is_active=True, stock_quantity__gt=0)
+                                   .order_by('created_at', 'id').values_list('id', flat=True)))
+
+    def test_renderer_matches_drf(self):
+        data = {
+            'decimal': Decimal('1.10'), 'float': 0.1, 'int': 10 ** 15, 'big': 2 ** 70, 'none': None, 'bool': True,
+            'datetime': timezone.now(), 'naive': timezone.now().replace(tzinfo=None), 'date': timezone.localdate(),
+            'duration': timedelta(seconds=90), 'text': 'é  \x00"\\/\t\x7f', 7: 'int key',
+            'list': [1, [2, {'x': Decimal('3')}]],
+        }
+        expected = JSONRenderer().render(data)
+        self.assertEqual(ORJSONRenderer().render(data), expected)
+        self.assertEqual(ORJSONRenderer().render(None), b'')
+        self.assertEqual(ORJSONRenderer().render({'a': [1]}, 'application/json; indent=2'),
+                         JSONRenderer().render({'a': [1]}, 'application/json; indent=2'))
+
+
+class QueryPlanTests(TestCase):
+
+    def test_endpoint_queries_do_not_scan_tables(self):
+        out = io.StringIO()
+        call_command('explain_queries', stdout=out)
+        self.assertIn('26 endpoint queries checked, no full table scans.', out.getvalue())
+
+    def test_customer_product_listing_uses_partial_index(self):
+        plans = {str(plan): plan for plan in query_plans.endpoint_plans()}
+        self.assertIn('product_available_idx', plans['product-list (customer)'].plan)
+        self.assertNotIn('cart-list (admin)', plans)
+
+    def test_name_lookups_use_indexes(self):
+        # The product import resolves categories and brands by name.
+        self.assertEqual(query_plans.full_scans(Category.objects.filter(name__in=['Shoes', 'Hats'])), [])
+        self.assertEqual(query_plans.full_scans(Brand.objects.filter(name__in=['Acme', 'Zenith'])), [])
+        self.assertEqual(query_plans.full_scans(Product.objects.filter(description='Runner')), ['api_product'])
+
+    def test_command_fails_on_full_scan(self):
+        out = io.StringIO()
+        with mock.patch.object(views.StateViewSet, 'get_queryset', lambda view: State.objects.filter(name='Ohio')):
+            with self.assertRaisesMessage(CommandError, '2 of 26 endpoint queries scan whole tables.'):
+                call_command('explain_queries', stdout=out)
+        self.assertIn('state-list (customer): full scan of api_state', out.getvalue())
+
+
+class SearchIndexMigrationTests(TransactionTestCase):
+
+    def migrate(self, target):
+        executor = MigrationExecutor(connection)
+        executor.migrate([('api', target)])
+
+    def triggers(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'api_product'")
+            return sorted(row[0] for row in cursor.fetchall())
+
+    def test_triggers_survive_table_rebuild(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('The FTS5 index is SQLite only.')
+        self.migrate('0009_clamp_negative_stock')
+        # As post_migrate left a database upgraded to 0009.
+        search.get_backend(connection).install(connection)
+        expected = ['api_product_fts_ad', 'api_product_fts_ai', 'api_product_fts_au']
+        self.assertEqual(self.triggers(), expected)
+
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes('api')[0][1])
+        self.assertEqual(self.triggers(), expected)
+
+        user = CustomUser.objects.create_user('customer@example.com', 'Customer')
+        product = Product.objects.create(name='Trail Runner', description='Running shoe', price=10, stock_quantity=5,
+                                         category=Category.objects.create(name='Shoes', slug='shoes'))
+        token = CustomToken.objects.create(user=user)
+        response = self.client.get('/api/products/search/?q=trail', HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.assertEqual([row['id'] for row in response.data], [product.pk])
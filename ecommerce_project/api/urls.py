@@ -1,5 +1,5 @@
 from django.urls import path, include
-from . import views
+from . import async_views, views
 from rest_framework.authtoken.views import obtain_auth_token
 from rest_framework.routers import DefaultRouter
 from rest_framework.authtoken.views import obtain_auth_token
@@ -21,6 +21,20 @@ urlpatterns = [
     path('api-token-auth/', obtain_auth_token, name='api_token_auth'),
     path('products/<int:pk>/activate-deactivate/', views.ProductActivateDeactivateView.as_view(), name='product-activate-deactivate'),
     path('cart-to-order/', views.CartToOrderView.as_view(), name='cart-to-order'),
+    path('analytics/sales/', views.SalesAnalyticsView.as_view(), name='sales-analytics'),
+    path('analytics/sales/<slug:dimension>/', views.SalesBreakdownView.as_view(), name='sales-breakdown'),
+    path('async/products/', async_views.ProductReadView.as_view(), name='async-product-list'),
+    path('async/products/<int:pk>/', async_views.ProductReadView.as_view(), name='async-product-detail'),
+    path('async/orders/', async_views.OrderReadView.as_view(), name='async-order-list'),
+    path('async/orders/<int:pk>/', async_views.OrderReadView.as_view(), name='async-order-detail'),
+    path('async/states/', async_views.ReferenceReadView.as_view(viewset_class=views.StateViewSet), name='async-state-list'),
+    path('async/states/<int:pk>/', async_views.ReferenceReadView.as_view(viewset_class=views.StateViewSet), name='async-state-detail'),
+    path('async/cities/', async_views.ReferenceReadView.as_view(viewset_class=views.CityViewSet), name='async-city-list'),
+    path('async/cities/<int:pk>/', async_views.ReferenceReadView.as_view(viewset_class=views.CityViewSet), name='async-city-detail'),
+    path('async/brands/', async_views.ReferenceReadView.as_view(viewset_class=views.BrandViewSet), name='async-brand-list'),
+    path('async/brands/<int:pk>/', async_views.ReferenceReadView.as_view(viewset_class=views.BrandViewSet), name='async-brand-detail'),
+    path('async/categories/', async_views.ReferenceReadView.as_view(viewset_class=views.CategoryViewSet), name='async-category-list'),
+    path('async/categories/<int:pk>/', async_views.ReferenceReadView.as_view(viewset_class=views.CategoryViewSet), name='async-category-detail'),
     # path('register/', views.RegisterView.as_view(), name='register'),
     # path('login/', views.LoginView.as_view(), name='login')
 ]
@@ -1,14 +1,33 @@
-from rest_framework import generics, viewsets,status,views
+import codecs
+from collections import Counter
+from decimal import Decimal
+
+from rest_framework import filters, generics, viewsets,status,views
+from rest_framework.decorators import action
 from rest_framework.settings import api_settings
 from rest_framework.authentication import TokenAuthentication
 from .authentication import CustomTokenAuthentication
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.permissions import IsAuthenticatedOrReadOnly, IsAuthenticated
-from django.db import transaction
+from django.db import connection, transaction
+from django.http import StreamingHttpResponse
+from django.db.models import DecimalField, ExpressionWrapper, F, OuterRef, Subquery, Sum, Window
+from rest_framework.exceptions import NotFound, ValidationError
 from .serializer import ProductActivationSerializer, ProductSerializer, OrderSerializer
 
 from api import models
+from api import cache
+from api import fastpath
+from api import fieldsets
+from api import inventory
+from api import order_export
+from api import order_transitions
+from api import pagination
 from api import permissions
+from api import product_import
+from api import refdata
+from api import rollups
+from api import search
 from api import serializer
 
 from rest_framework.response import Response
@@ -55,82 +74,101 @@ class UserProfileFeedViewSet(viewsets.ModelViewSet):
         """Sets the user profile to the logged in user"""
         serializer.save(user_profile=self.request.user)
 
-class StateViewSet(viewsets.ModelViewSet):
+class StateViewSet(permissions.PolicyMixin, refdata.ReferenceDataMixin, viewsets.ModelViewSet):
     queryset = models.State.objects.all()
+    reference_table = 'states'
     serializer_class = serializer.StateSerializer
     authentication_classes = [CustomTokenAuthentication]
+    policy = 'catalog'
 
-    def get_permissions(self):
-        if self.request.method in ['POST', 'PUT', 'PATCH', 'DELETE']:
-            permission_classes = [IsAuthenticated & permissions.IsAdmin]
-        else:
-            permission_classes = [IsAuthenticated & (permissions.IsAdmin | permissions.IsCustomer)]
-        return [permission() for permission in permission_classes]
-
-class CityViewSet(viewsets.ModelViewSet):
+class CityViewSet(permissions.PolicyMixin, refdata.ReferenceDataMixin, viewsets.ModelViewSet):
     queryset = models.City.objects.all()
+    reference_table = 'cities'
     serializer_class = serializer.CitySerializer
     authentication_classes = [CustomTokenAuthentication]
+    policy = 'catalog'
 
-    def get_permissions(self):
-        if self.request.method in ['POST', 'PUT', 'PATCH', 'DELETE']:
-            permission_classes = [IsAuthenticated & permissions.IsAdmin]
-        else:
-            permission_classes = [IsAuthenticated & (permissions.IsAdmin | permissions.IsCustomer)]
-        return [permission() for permission in permission_classes]
-
-class BrandViewSet(viewsets.ModelViewSet):
+class BrandViewSet(permissions.PolicyMixin, refdata.ReferenceDataMixin, viewsets.ModelViewSet):
     queryset = models.Brand.objects.all()
+    reference_table = 'brands'
     serializer_class = serializer.BrandSerializer
     authentication_classes = [CustomTokenAuthentication]
+    policy = 'catalog'
 
-    def get_permissions(self):
-        if self.request.method in ['POST', 'PUT', 'PATCH', 'DELETE']:
-            permission_classes = [IsAuthenticated & permissions.IsAdmin]
-        else:
-            permission_classes = [IsAuthenticated & (permissions.IsAdmin | permissions.IsCustomer)]
-        return [permission() for permission in permission_classes]
-
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(permissions.PolicyMixin, refdata.ReferenceDataMixin, viewsets.ModelViewSet):
     queryset = models.Category.objects.all()
+    reference_table = 'categories'
     serializer_class = serializer.CategorySerializer
     authentication_classes = [CustomTokenAuthentication]
+    policy = 'catalog'
 
-    def get_permissions(self):
-        if self.request.method in ['POST', 'PUT', 'PATCH', 'DELETE']:
-            permission_classes = [IsAuthenticated & permissions.IsAdmin]
-        else:
-            permission_classes = [IsAuthenticated & (permissions.IsAdmin | permissions.IsCustomer)]
-        return [permission() for permission in permission_classes]
-
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(permissions.PolicyMixin, cache.CatalogCacheMixin, fieldsets.SparseFieldsetMixin,
+                     fastpath.FastListMixin, pagination.KeysetPaginationMixin, viewsets.ModelViewSet):
     queryset = models.Product.objects.all()
     serializer_class = serializer.ProductSerializer
     authentication_classes = [CustomTokenAuthentication]
+    pagination_class = pagination.ProductCursorPagination
+    policy = 'catalog'
 
-    def get_permissions(self):
-        if self.request.method in ['POST', 'PUT', 'PATCH', 'DELETE']:
-            permission_classes = [IsAuthenticated & permissions.IsAdmin]
-        else:
-            permission_classes = [IsAuthenticated & (permissions.IsAdmin | permissions.IsCustomer)]
-        return [permission() for permission in permission_classes]
-    
     def get_queryset(self):
         user = self.request.user
+        queryset = models.Product.objects.select_related('category', 'brand')
         if user.is_authenticated and user.role == 'admin':
-            return models.Product.objects.all()
+            return queryset
         elif user.is_authenticated and user.role == 'customer':
-            return models.Product.objects.filter(is_active=True, stock_quantity__gt=0)
+            return queryset.filter(is_active=True, stock_quantity__gt=0)
         return models.Product.objects.none()
-class ProductActivateDeactivateView(generics.UpdateAPIView):
+
+    @action(detail=False, methods=['get'])
+    def search(self, request, *args, **kwargs):
+        """Ranked full-text search on name and description, e.g. ``?q=run sho&category=3&max_price=100``."""
+        return self.cached_response(self.search_results, request, *args, **kwargs)
+
+    def search_results(self, request, *args, **kwargs):
+        params = serializer.ProductSearchSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        criteria = params.validated_data
+
+        queryset = self.get_queryset()
+        if 'category' in criteria:
+            queryset = queryset.filter(category_id=criteria['category'])
+        if 'brand' in criteria:
+            queryset = queryset.filter(brand_id=criteria['brand'])
+        if 'min_price' in criteria or 'max_price' in criteria:
+            queryset = queryset.alias(effective_price=models.effective_price())
+            if 'min_price' in criteria:
+                queryset = queryset.filter(effective_price__gte=criteria['min_price'])
+            if 'max_price' in criteria:
+                queryset = queryset.filter(effective_price__lte=criteria['max_price'])
+
+        results = search.search_products(queryset, criteria['q'], connection)[:criteria['limit']]
+        return Response(self.get_serializer(results, many=True).data)
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request, *args, **kwargs):
+        """Upsert products from a CSV (``text/csv``) or NDJSON (``application/x-ndjson``) request body."""
+        fmt = 'ndjson' if 'json' in request.content_type else 'csv'
+        try:
+            batch_size = int(request.query_params.get('batch_size', product_import.DEFAULT_BATCH_SIZE))
+        except ValueError:
+            batch_size = 0
+        if not 1 <= batch_size <= 10000:
+            return Response({"detail": "batch_size must be between 1 and 10000."}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Read the body as a stream instead of through request.data so that
+        # memory use does not grow with the upload.
+        lines = codecs.iterdecode(request.stream or [], 'utf-8', errors='replace')
+        report = product_import.import_products(product_import.READERS[fmt](lines), batch_size=batch_size)
+        return Response(report.as_dict(), status=status.HTTP_200_OK)
+class ProductActivateDeactivateView(permissions.PolicyMixin, generics.UpdateAPIView):
     queryset = models.Product.objects.all()
     serializer_class = serializer.ProductActivationSerializer
     authentication_classes = [CustomTokenAuthentication]
-    permission_classes = [IsAuthenticated & permissions.IsAdmin]
+    policy = 'admin'
 
     def patch(self, request, pk):
         try:
-            product = models.Product.objects.get(pk=pk)
+            product = models.Product.objects.select_related('category', 'brand').get(pk=pk)
         except models.Product.DoesNotExist:
             return Response({'error': 'Product not found.'}, status=status.HTTP_404_NOT_FOUND)
 
@@ -141,30 +179,211 @@ class ProductActivateDeactivateView(generics.UpdateAPIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class CartViewSet(viewsets.ModelViewSet):
+class CartViewSet(permissions.PolicyMixin, fieldsets.SparseFieldsetMixin, viewsets.ModelViewSet):
     queryset = models.Cart.objects.all()
     serializer_class = serializer.CartSerializer
     authentication_classes = [CustomTokenAuthentication]
-    permission_classes = [IsAuthenticated, permissions.IsOwner, permissions.IsCustomer]
+    policy = 'cart'
+    # Read by the owner check on retrieve.
+    fieldset_columns = ('user',)
 
     def get_queryset(self):
-        return self.queryset.filter(user=self.request.user)
+        return super().get_queryset().select_related('product').annotate(line_total=models.line_total())
+
+    @action(detail=False, methods=['get'])
+    def summary(self, request, *args, **kwargs):
+        """Item count, subtotal at list prices, discount savings and total, with a warning per unbuyable line.
+
+        Totals are window aggregates over the cart lines, so everything comes
+        from a single query.
+        """
+        lines = (
+            self.queryset.filter(user=request.user)
+            .annotate(list_total=ExpressionWrapper(
+                F('quantity') * F('product__price'), output_field=DecimalField(max_digits=12, decimal_places=2)),
+                line_total=models.line_total())
+            .annotate(
+                item_count=Window(Sum('quantity')),
+                subtotal=Window(Sum('list_total')),
+                total=Window(Sum('line_total')),
+            )
+            .values('id', 'product_id', 'product__name', 'product__is_active', 'product__stock_quantity',
+                    'quantity', 'item_count', 'subtotal', 'total')
+            .order_by('id')
+        )
+        summary = {'item_count': 0, 'subtotal': Decimal(0), 'savings': Decimal(0), 'total': Decimal(0), 'warnings': []}
+        for line in lines:
+            summary.update(item_count=line['item_count'], subtotal=line['subtotal'], total=line['total'],
+                           savings=line['subtotal'] - line['total'])
+            if not line['product__is_active']:
+                code, detail = 'inactive', f"{line['product__name']} is no longer available."
+            elif line['product__stock_quantity'] < line['quantity']:
+                code, detail = 'insufficient_stock', (
+                    f"Only {line['product__stock_quantity']} of {line['product__name']} left in stock.")
+            else:
+                continue
+            summary['warnings'].append({'id': line['id'], 'product': line['product_id'], 'code': code, 'detail': detail})
+        return Response(serializer.CartSummarySerializer(summary).data)
+
+    @action(detail=False, methods=['post'])
+    def batch(self, request, *args, **kwargs):
+        """Apply ``{"operations": [{"op": "add" | "set" | "remove", "product": id, "quantity": n}, ...]}`` at once.
+
+        Operations run in order, so later ones see earlier ones. Products,
+        stock and current cart quantities are read in one query; if every
+        operation is valid the cart is changed with one DELETE, one upsert
+        for the quantities set and one for the quantities added, otherwise
+        nothing changes. Returns the whole cart.
+        """
+        params = serializer.CartBatchSerializer(data=request.data)
+        params.is_valid(raise_exception=True)
+        operations = params.validated_data['operations']
+        user = request.user
 
-class OrderViewSet(viewsets.ModelViewSet):
+        in_cart = self.queryset.filter(user=user, product=OuterRef('pk')).values('quantity')[:1]
+        products = {
+            product['pk']: product
+            for product in models.Product.objects.filter(pk__in={operation['product'] for operation in operations})
+            .annotate(in_cart=Subquery(in_cart)).values('pk', 'name', 'is_active', 'stock_quantity', 'in_cart')
+        }
+
+        # product id -> (quantity the batch sets, or None to build on the cart's line; quantity added after that)
+        changes, last_change, errors = {}, {}, {}
+        for index, operation in enumerate(operations):
+            product = products.get(operation['product'])
+            if product is None:
+                errors[index] = ["Invalid product ID."]
+                continue
+            absolute, added = changes.get(product['pk'], (None, 0))
+            if operation['op'] == 'add':
+                added += operation['quantity']
+            elif operation['op'] == 'set':
+                absolute, added = operation['quantity'], 0
+            else:
+                absolute, added = 0, 0
+            changes[product['pk']] = (absolute, added)
+            last_change[product['pk']] = index
+
+        def check(product_id, quantity):
+            product = products[product_id]
+            if not quantity:
+                return
+            if not product['is_active']:
+                errors[last_change[product_id]] = [f"The product '{product['name']}' is inactive, please remove it."]
+            elif product['stock_quantity'] < quantity:
+                errors[last_change[product_id]] = [
+                    f"Insufficient stock for product '{product['name']}'. Available stock: {product['stock_quantity']}."]
+
+        for product_id, (absolute, added) in changes.items():
+            check(product_id, (products[product_id]['in_cart'] or 0 if absolute is None else absolute) + added)
+        if errors:
+            raise ValidationError({'operations': errors})
+
+        with transaction.atomic():
+            removed = [product_id for product_id, (absolute, added) in changes.items() if absolute == 0 and not added]
+            if removed:
+                self.queryset.filter(user=user, product__in=removed).delete()
+            kept = [models.Cart(user=user, product_id=product_id, quantity=absolute + added)
+                    for product_id, (absolute, added) in changes.items() if absolute is not None and absolute + added]
+            if kept:
+                models.Cart.objects.bulk_create(
+                    kept, update_conflicts=True, unique_fields=['user', 'product'], update_fields=['quantity'])
+            # Adds are applied to the line as it is when written, so a concurrent
+            # add to the same line is not lost; the result is checked again and
+            # the whole batch rolls back if it is now over the stock.
+            increments = {product_id: added for product_id, (absolute, added) in changes.items() if absolute is None}
+            for product_id, quantity in _add_to_cart(user, increments):
+                check(product_id, quantity)
+            if errors:
+                raise ValidationError({'operations': errors})
+        return Response(self.get_serializer(self.get_queryset(), many=True).data)
+
+    @action(detail=False, methods=['post'])
+    def reserve(self, request, *args, **kwargs):
+        """Hold stock for every cart line until checkout or ``STOCK_RESERVATION_TTL``, replacing earlier holds."""
+        quantities = Counter()
+        names = {}
+        for product_id, name, quantity in self.queryset.filter(user=request.user).values_list(
+                'product_id', 'product__name', 'quantity'):
+            quantities[product_id] += quantity
+            names[product_id] = name
+        if not quantities:
+            return Response({"detail": "No items in the cart."}, status=status.HTTP_400_BAD_REQUEST)
+        with transaction.atomic():
+            inventory.release(request.user)
+            try:
+                reservations = inventory.reserve(request.user, quantities)
+            except inventory.InsufficientStock as exc:
+                raise _insufficient_stock(exc, names)
+        return Response(serializer.StockReservationSerializer(reservations, many=True).data,
+                        status=status.HTTP_201_CREATED)
+
+class OrderViewSet(permissions.PolicyMixin, fieldsets.SparseFieldsetMixin, fastpath.FastListMixin,
+                   pagination.KeysetPaginationMixin, viewsets.ModelViewSet):
     authentication_classes = [CustomTokenAuthentication]
     queryset = models.Order.objects.all()
     serializer_class = serializer.OrderSerializer
-    permission_classes = [IsAuthenticated, permissions.IsAdminOrOwner]
+    policy = 'order'
+    # Read by the owner check on retrieve.
+    fieldset_columns = ('user',)
+    pagination_class = pagination.OrderCursorPagination
+    # e.g. ?ordering=-line_total,-id for the largest orders first.
+    filter_backends = [filters.OrderingFilter]
+    ordering_fields = ['created_at', 'line_total', 'id']
+    ordering = ('-created_at', '-id')
 
     def get_queryset(self):
-        user = self.request.user
-        if user.role == 'admin':
-            return models.Order.objects.all()
-        return models.Order.objects.filter(user=user)
+        return super().get_queryset().select_related('city')
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
+    @action(detail=False, methods=['get'], policy='admin')
+    def export(self, request, *args, **kwargs):
+        """Stream orders as NDJSON or CSV, e.g. ``?date_from=2024-01-01&status=PENDING,PROCESSING&file_format=csv&gzip=1``."""
+        params = serializer.OrderExportSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        options = params.validated_data
+
+        queryset = order_export.export_queryset(
+            options.get('date_from'), options.get('date_to'), options.get('status'))
+        file_format = options['file_format']
+        filename = f'orders.{file_format}' + ('.gz' if options['gzip'] else '')
+        response = StreamingHttpResponse(
+            order_export.stream_orders(queryset, file_format, gzip=options['gzip']),
+            content_type=order_export.CONTENT_TYPES[file_format],
+        )
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    @action(detail=False, methods=['post'], policy='admin')
+    def transition(self, request, *args, **kwargs):
+        """Move many orders to ``status`` at once, e.g. ``{"status": "PROCESSING", "from_status": ["PENDING"]}``.
+
+        Orders are picked by ``ids`` and/or the ``date_from``, ``date_to``
+        and ``from_status`` filters. Orders the transition table does not
+        allow to move are reported under ``skipped`` with their status.
+        """
+        params = serializer.OrderTransitionSerializer(data=request.data)
+        params.is_valid(raise_exception=True)
+        options = params.validated_data
+
+        orders = order_export.filter_orders(
+            models.Order.objects.all(), options.get('date_from'), options.get('date_to'), options.get('from_status'))
+        if 'ids' in options:
+            orders = orders.filter(pk__in=options['ids'])
+        try:
+            result = order_transitions.transition(orders, options['status'])
+        except order_transitions.TransitionConflict:
+            return Response({"detail": "Orders changed while being updated, please try again."},
+                            status=status.HTTP_409_CONFLICT)
+
+        response = {'status': options['status'], 'transitioned': result.transitioned, 'skipped': result.skipped}
+        if 'ids' in options:
+            found = set(result.transitioned) | set(result.skipped)
+            response['not_found'] = [pk for pk in dict.fromkeys(options['ids']) if pk not in found]
+        return Response(response)
+
     def update(self, request, *args, **kwargs):
         instance = self.get_object()
         if instance.status != 'PENDING':
@@ -179,37 +398,132 @@ class OrderViewSet(viewsets.ModelViewSet):
                             status=status.HTTP_400_BAD_REQUEST)
         self.perform_destroy(instance)
         return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        inventory.restock({instance.product_id: instance.quantity})
+        instance.delete()
     
-class CartToOrderView(views.APIView):
-    permission_classes = [IsAuthenticated, permissions.IsCustomer]
+def _add_to_cart(user, quantities):
+    """Add ``{product_id: quantity}`` to ``user``'s cart lines in one upsert; returns ``(product_id, quantity)`` rows.
+
+    The sum is taken by the database (``ON CONFLICT DO UPDATE``), not from a
+    quantity read earlier, so concurrent adds to the same line both count.
+    """
+    if not quantities:
+        return []
+    quote = connection.ops.quote_name
+    table = quote(models.Cart._meta.db_table)
+    user_id, product_id, quantity = quote('user_id'), quote('product_id'), quote('quantity')
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} ({user_id}, {product_id}, {quantity}) '
+            f"VALUES {', '.join(['(%s, %s, %s)'] * len(quantities))} "
+            f'ON CONFLICT ({user_id}, {product_id}) DO UPDATE SET {quantity} = {table}.{quantity} + excluded.{quantity} '
+            f'RETURNING {product_id}, {quantity}',
+            [value for item in quantities.items() for value in (user.pk, *item)],
+        )
+        return cursor.fetchall()
+
+def _insufficient_stock(exc, names):
+    return ValidationError([
+        f"Insufficient stock for product '{names[product_id]}'. Available stock: {available}."
+        for product_id, available in exc.available.items()
+    ] or "Stock changed during checkout, please try again.")
+
+
+class CartToOrderView(permissions.PolicyMixin, views.APIView):
+    policy = 'customer'
     authentication_classes = [CustomTokenAuthentication]
 
     @transaction.atomic
     def post(self, request, *args, **kwargs):
         user = request.user
-        cart_items = models.Cart.objects.filter(user=user)
+        cart_items = list(models.Cart.objects.filter(user=user).select_related('product'))
 
-        if not cart_items.exists():
+        if not cart_items:
             return Response({"detail": "No items in the cart."}, status=status.HTTP_400_BAD_REQUEST)
 
-        created_orders = []
+        checkout = serializer.CheckoutSerializer(data=request.data)
+        checkout.is_valid(raise_exception=True)
+        address = checkout.validated_data
+        city = address.pop('city')
+
+        quantities = Counter()
         for cart_item in cart_items:
-            product = cart_item.product
-            order_data = {
-                "product": product.id,
-                "quantity": cart_item.quantity,
-                "street_address": request.data.get("street_address"),
-                "city": request.data.get("city"),
-                "postal_code": request.data.get("postal_code"),
-                "phone_number": request.data.get("phone_number"),
-                "status": "PENDING"
-            }
-            serializer = OrderSerializer(data=order_data, context={'request': request})
-            serializer.is_valid(raise_exception=True)
-            order = serializer.save()
-            created_orders.append(order)
-
-        # Clear the cart after creating orders
-        cart_items.delete()
+            if not cart_item.product.is_active:
+                raise ValidationError(f"The product '{cart_item.product.name}' is inactive, please remove it from the cart.")
+            quantities[cart_item.product_id] += cart_item.quantity
+
+        # Stock the customer reserved is already out of stock_quantity; only
+        # the difference from the cart is taken or put back.
+        try:
+            held = inventory.commit(user)
+            inventory.take(quantities - held)
+        except inventory.InsufficientStock as exc:
+            raise _insufficient_stock(exc, {cart_item.product_id: cart_item.product.name for cart_item in cart_items})
+        except inventory.ReservationExpired:
+            raise ValidationError("Your stock reservation expired during checkout, please try again.")
+        inventory.restock(held - quantities)
+
+        created_orders = models.Order.objects.bulk_create(
+            models.Order(
+                user=user,
+                product=cart_item.product,
+                quantity=cart_item.quantity,
+                unit_price=cart_item.product.unit_price,
+                line_total=cart_item.product.unit_price * cart_item.quantity,
+                category_id=cart_item.product.category_id,
+                status='PENDING',
+                city=city,
+                state_id=city.state_id,
+                **address
+            )
+            for cart_item in cart_items
+        )
+
+        rollups.record(created_orders)
+
+        # Clear the ordered lines only: lines added since they were read stay in the cart.
+        models.Cart.objects.filter(pk__in=[cart_item.pk for cart_item in cart_items]).delete()
 
         return Response(OrderSerializer(created_orders, many=True).data, status=status.HTTP_201_CREATED)
+
+
+class SalesAnalyticsView(permissions.PolicyMixin, views.APIView):
+    """Daily sales totals over a date range, read from the rollup tables only."""
+    authentication_classes = [CustomTokenAuthentication]
+    policy = 'admin'
+
+    def get(self, request):
+        params = serializer.SalesAnalyticsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        date_from, date_to = params.validated_data['date_from'], params.validated_data['date_to']
+
+        days = serializer.SalesDaySerializer(rollups.daily_totals(date_from, date_to), many=True).data
+        totals = {
+            'orders': sum(day['orders'] for day in days),
+            'units': sum(day['units'] for day in days),
+            'revenue': str(sum((Decimal(day['revenue']) for day in days), Decimal('0.00'))),
+        }
+        return Response({'date_from': date_from, 'date_to': date_to, 'totals': totals, 'days': days})
+
+
+class SalesBreakdownView(permissions.PolicyMixin, views.APIView):
+    """Sales per product, category or state over a date range, highest revenue first."""
+    authentication_classes = [CustomTokenAuthentication]
+    policy = 'admin'
+
+    def get(self, request, dimension):
+        if dimension not in rollups.DIMENSIONS:
+            raise NotFound()
+        params = serializer.SalesAnalyticsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        criteria = params.validated_data
+
+        rows = rollups.breakdown(dimension, criteria['date_from'], criteria['date_to'], criteria['limit'])
+        return Response({
+            'date_from': criteria['date_from'],
+            'date_to': criteria['date_to'],
+            'results': serializer.SalesBreakdownSerializer(rows, many=True).data,
+        })
@@ -51,9 +51,15 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
+    'api.query_detector.QueryDetectorMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -94,6 +100,30 @@ DATABASES = {
     }
 }
 
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+# Use a shared backend (Redis, Memcached) in production so that cached
+# authentication is consistent across workers.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Password hashing. The first hasher is used for new hashes and stored hashes
+# are upgraded to it (and to PASSWORD_HASHER_ITERATIONS) on the next login.
+# Async views hash in a pool of PASSWORD_HASHING_WORKERS threads.
+PASSWORD_HASHERS = [
+    'api.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+PASSWORD_HASHER_ITERATIONS = 720000
+PASSWORD_HASHING_WORKERS = 2
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -137,3 +167,47 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 AUTH_USER_MODEL = 'api.CustomUser'
 
 AUTH_TOKEN_EXPIRATION = timezone.timedelta(minutes=5)
+
+# Tokens slide forward to a full AUTH_TOKEN_EXPIRATION on use, but are written
+# back at most once per AUTH_TOKEN_RENEW_INTERVAL.
+AUTH_TOKEN_RENEW_INTERVAL = timezone.timedelta(minutes=1)
+
+# How long POST /api/carts/reserve/ holds stock before it returns to the shelf.
+STOCK_RESERVATION_TTL = timezone.timedelta(minutes=15)
+
+# Token authentication cache: a small per-process LRU in front of the shared
+# cache. Timeouts are in seconds and are always capped at the token's expiry.
+AUTH_TOKEN_CACHE_ALIAS = 'default'
+AUTH_TOKEN_CACHE_TIMEOUT = 300
+AUTH_TOKEN_CACHE_LOCAL_TIMEOUT = 10
+AUTH_TOKEN_CACHE_LOCAL_MAXSIZE = 1024
+AUTH_TOKEN_CACHE_NEGATIVE_TIMEOUT = 30
+
+# Product catalog response cache, invalidated by a generation counter that is
+# bumped whenever a product, category or brand changes.
+CATALOG_CACHE_ALIAS = 'default'
+CATALOG_CACHE_TIMEOUT = 300
+
+# Dotted path to an api.search.SearchBackend subclass; by default the backend
+# is chosen from the database vendor (SQLite FTS5, PostgreSQL tsvector).
+PRODUCT_SEARCH_BACKEND = None
+
+# Upper bounds, in seconds, of the per-route request duration histograms
+# served at /metrics.
+METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Addresses or networks (CIDR) allowed to read /metrics, matched against the
+# connecting peer. List the Prometheus scraper here, not a proxy in front of
+# the workers, or everyone behind that proxy can read it.
+METRICS_ALLOWED_IPS = ('127.0.0.1', '::1')
+
+# N+1 and slow query detector (api.query_detector). Off by default; when on,
+# requests running one statement shape more than QUERY_DETECTOR_REPEAT_LIMIT
+# times, or any statement slower than QUERY_DETECTOR_SLOW_MS, are logged, or
+# fail with QUERY_DETECTOR_RAISE for the finding kinds in QUERY_DETECTOR_RAISE_ON.
+# The test runner turns both on and raises on repeated statements only.
+QUERY_DETECTOR_ENABLED = False
+QUERY_DETECTOR_RAISE = False
+QUERY_DETECTOR_REPEAT_LIMIT = 10
+QUERY_DETECTOR_SLOW_MS = 200
+QUERY_DETECTOR_RAISE_ON = ('repeated', 'slow')
+TEST_RUNNER = 'api.query_detector.QueryDetectorTestRunner'
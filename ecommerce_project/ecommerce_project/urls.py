@@ -1,10 +1,14 @@
 from django.contrib import admin
 from django.urls import path, include
+from api import async_views, metrics
 from api.views import RegisterView, LoginView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metrics.metrics_view, name='metrics'),
     path('api/', include('api.urls')),
     path('api/register/', RegisterView.as_view(), name='register'),
     path('api/login/', LoginView.as_view(), name='login'),
+    path('api/async/register/', async_views.register, name='async-register'),
+    path('api/async/login/', async_views.login, name='async-login'),
 ]